@@ -1,6 +1,9 @@
 from flask import Flask
 from flask_cors import CORS
+from .json_provider import FastJSONProvider
+from .logging_setup import init_logging
 import os
+import logging
 
 def create_app():
     """The Application Factory"""
@@ -9,8 +12,10 @@ def create_app():
 
     # 1. Load Configuration
     app.config.from_object('app.config')
+    init_logging(app) # Before anything below logs
 
     # 2. Initialize Extensions
+    app.json = FastJSONProvider(app) # orjson when installed, stdlib otherwise
     CORS(app)
     app.secret_key = app.config['SECRET_KEY']
 
@@ -46,7 +51,34 @@ def create_app():
     app.register_blueprint(views_parts.bp)
     # *** END MISSING LINE ***
 
-    print("Application created and blueprints registered.")
+    # Register Trends Blueprint
+    from . import views_trends
+    app.register_blueprint(views_trends.bp)
+
+    # Register Analytics Blueprint
+    from . import views_analytics
+    app.register_blueprint(views_analytics.bp)
+
+    # Register Warehouse Arrivals Blueprint
+    from . import views_arrivals
+    app.register_blueprint(views_arrivals.bp)
+
+    # Register Shortage Reports Blueprint
+    from . import views_shortages
+    app.register_blueprint(views_shortages.bp)
+
+    # Register Notes Search Blueprint
+    from . import views_search
+    app.register_blueprint(views_search.bp)
+
+    # 5. Register Background Jobs (the entry points start the scheduler, see app/scheduler.py)
+    from . import scheduler, snapshots, arrivals, forecast, maintenance
+    scheduler.register_job('daily_snapshots', app.config['SNAPSHOT_INTERVAL_SECONDS'], snapshots.run_snapshot_job)
+    scheduler.register_job('warehouse_arrivals', app.config['ARRIVALS_CHECK_INTERVAL_SECONDS'], arrivals.run_arrivals_job)
+    scheduler.register_job('completion_forecasts', app.config['FORECAST_CHECK_INTERVAL_SECONDS'], forecast.run_forecast_job)
+    scheduler.register_job('database_maintenance', app.config['MAINTENANCE_CHECK_INTERVAL_SECONDS'], maintenance.run_maintenance_job)
+
+    logging.getLogger(__name__).info("Application created and blueprints registered.")
 
     return app
 
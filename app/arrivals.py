@@ -0,0 +1,198 @@
+import json
+import sqlite3
+import logging
+from datetime import datetime
+from urllib.request import pathname2url
+from flask import current_app
+from .db import get_db_connection
+from .generations import file_generation
+from .work_centers import default_work_centers, sql_placeholders
+
+logger = logging.getLogger(__name__)
+
+# Warehouse arrivals. Whenever projekti_baza.db is replaced by a new ERP snapshot, the
+# detection job diffs components.inventory (per project, item and rack) against the
+# inventory stored for the previous snapshot in skladisce_inventory_state: a component
+# whose inventory went from <= 0 to > 0 is recorded in skladisce_arrivals. The diff runs
+# in SQL against the attached ERP file, and only changed state rows are rewritten.
+# The feeds read skladisce_arrivals only. is_seen is the shared flag used by the group
+# (warehouse screen) feeds; per-user seen state lives in skladisce_arrivals_seen.
+
+_ARRIVAL_COLUMNS = "a.arrival_key, a.project_task_no, a.item_no, a.description, a.sifra_regala, a.quantity, a.arrived_at"
+
+def _load_erp_inventory(conn, erp_path):
+    """Copies the per-component inventory of the ERP snapshot into temp.erp_inventory."""
+    work_centers = default_work_centers()
+    conn.execute("ATTACH DATABASE ? AS erp", (f"file:{pathname2url(erp_path)}?mode=ro",))
+    try:
+        conn.execute("DROP TABLE IF EXISTS temp.erp_inventory")
+        conn.execute("""
+            CREATE TEMP TABLE erp_inventory (
+                project_task_no TEXT NOT NULL,
+                item_no TEXT NOT NULL,
+                sifra_regala TEXT NOT NULL,
+                arrival_key TEXT NOT NULL,
+                description TEXT,
+                inventory REAL NOT NULL,
+                PRIMARY KEY (project_task_no, item_no, sifra_regala)
+            ) WITHOUT ROWID""")
+        # Same key format as the existing rows: <project>_<item>[_<rack>].
+        # CAST turns '' (no stock) into 0; same scope as the default parts lists (assembly centers excluded).
+        conn.execute(f"""
+            INSERT INTO temp.erp_inventory
+            SELECT project_task_no, item_no, COALESCE(sifra_regala, ''),
+                   project_task_no || '_' || item_no || COALESCE('_' || NULLIF(sifra_regala, ''), ''),
+                   MAX(description), COALESCE(MAX(CAST(inventory AS REAL)), 0)
+            FROM erp.components
+            WHERE project_task_no IS NOT NULL AND item_no IS NOT NULL AND work_center NOT IN ({sql_placeholders(work_centers)})
+            GROUP BY project_task_no, item_no, COALESCE(sifra_regala, '')
+        """, work_centers)
+        conn.commit() # Only temp tables changed; DETACH isn't allowed inside a transaction
+    finally:
+        if conn.in_transaction: conn.rollback()
+        conn.execute("DETACH DATABASE erp")
+
+def detect_arrivals():
+    """
+    Processes a new ERP snapshot, if there is one. Returns the number of arrivals recorded,
+    or None when the snapshot was already processed. The first run only stores the baseline.
+    """
+    erp_path = current_app.config['DATABASE_FILE_PATH']
+    signature = file_generation(erp_path)
+    if signature is None:
+        return None
+    signature = json.dumps(signature)
+    conn = None
+    try:
+        conn = get_db_connection(current_app.config['VELIKA_MONTAZA_DB_PATH'])
+        if conn is None: raise sqlite3.OperationalError("Could not connect to montaza DB.")
+        state = conn.execute("SELECT signature FROM skladisce_inventory_snapshot WHERE id = 1").fetchone()
+        if state and state['signature'] == signature:
+            return None
+        # Read the ERP snapshot before taking the write lock on velika_montaza.db.
+        _load_erp_inventory(conn, erp_path)
+        now = datetime.now().isoformat(timespec='seconds')
+        arrived = 0
+        if state is not None:
+            conn.execute("DROP TABLE IF EXISTS temp.new_arrivals")
+            conn.execute("""
+                CREATE TEMP TABLE new_arrivals AS
+                SELECT c.arrival_key, c.project_task_no, c.item_no, c.description, c.sifra_regala, c.inventory
+                FROM temp.erp_inventory c
+                JOIN skladisce_inventory_state s
+                  ON s.project_task_no = c.project_task_no AND s.item_no = c.item_no AND s.sifra_regala = c.sifra_regala
+                WHERE c.inventory > 0 AND s.inventory <= 0
+            """)
+            # A part that runs out and arrives again becomes unseen again.
+            cursor = conn.execute("""
+                INSERT INTO skladisce_arrivals
+                    (arrival_key, is_seen, project_task_no, item_no, description, sifra_regala, quantity, arrived_at)
+                SELECT arrival_key, 0, project_task_no, item_no, description, NULLIF(sifra_regala, ''), inventory, ?
+                FROM temp.new_arrivals WHERE true
+                ON CONFLICT (arrival_key) DO UPDATE SET
+                    is_seen = 0, project_task_no = excluded.project_task_no, item_no = excluded.item_no,
+                    description = excluded.description, sifra_regala = excluded.sifra_regala,
+                    quantity = excluded.quantity, arrived_at = excluded.arrived_at
+            """, (now,))
+            arrived = cursor.rowcount
+            conn.execute("DELETE FROM skladisce_arrivals_seen WHERE arrival_key IN (SELECT arrival_key FROM temp.new_arrivals)")
+        # Bring the stored state up to this snapshot, touching only rows that changed.
+        conn.execute("""
+            DELETE FROM skladisce_inventory_state
+            WHERE NOT EXISTS (
+                SELECT 1 FROM temp.erp_inventory c
+                WHERE c.project_task_no = skladisce_inventory_state.project_task_no
+                  AND c.item_no = skladisce_inventory_state.item_no
+                  AND c.sifra_regala = skladisce_inventory_state.sifra_regala
+            )""")
+        conn.execute("""
+            INSERT INTO skladisce_inventory_state (project_task_no, item_no, sifra_regala, inventory)
+            SELECT project_task_no, item_no, sifra_regala, inventory FROM temp.erp_inventory WHERE true
+            ON CONFLICT (project_task_no, item_no, sifra_regala) DO UPDATE SET inventory = excluded.inventory
+            WHERE inventory != excluded.inventory
+        """)
+        conn.execute("INSERT OR REPLACE INTO skladisce_inventory_snapshot (id, signature, processed_at) VALUES (1, ?, ?)", (signature, now))
+        conn.commit()
+        return arrived
+    finally:
+        if conn: conn.close()
+
+def run_arrivals_job():
+    """Scheduler entry point."""
+    arrived = detect_arrivals()
+    if arrived is not None:
+        logger.info(f"Processed new ERP snapshot: {arrived} new warehouse arrivals.")
+
+def get_unseen_for_user(username, project_ids=None, limit=200):
+    """Detected arrivals the user hasn't marked seen, newest first (optionally only for project_ids)."""
+    if project_ids is not None and not project_ids:
+        return [], 0
+    where = """
+        FROM skladisce_arrivals a
+        WHERE a.arrived_at IS NOT NULL
+          AND NOT EXISTS (SELECT 1 FROM skladisce_arrivals_seen s WHERE s.username = ? AND s.arrival_key = a.arrival_key)
+    """
+    params = [username]
+    if project_ids is not None:
+        where += f"AND a.project_task_no IN ({','.join('?' * len(project_ids))})"
+        params += list(project_ids)
+    return _feed(where, params, limit)
+
+def get_unseen_for_group(group_name, limit=200):
+    """Arrivals for the group's projects that nobody marked seen on the shared screen, newest first."""
+    where = """
+        FROM skladisce_arrivals a
+        JOIN skladisce_groups g ON g.project_task_no = a.project_task_no
+        WHERE g.group_name = ? AND a.is_seen = 0
+    """
+    return _feed(where, [group_name], limit)
+
+def _feed(where, params, limit):
+    conn = None
+    try:
+        conn = get_db_connection(current_app.config['VELIKA_MONTAZA_DB_PATH'])
+        if conn is None: raise sqlite3.OperationalError("Could not connect to montaza DB.")
+        total = conn.execute(f"SELECT COUNT(*) {where}", params).fetchone()[0]
+        rows = conn.execute(f"SELECT {_ARRIVAL_COLUMNS} {where} ORDER BY a.arrived_at DESC, a.arrival_key LIMIT ?", params + [limit]).fetchall()
+        return [dict(row) for row in rows], total
+    finally:
+        if conn: conn.close()
+
+def mark_seen_for_user(username, arrival_keys):
+    """Marks arrivals seen for one user. Returns the number of newly marked arrivals."""
+    now = datetime.now().isoformat(timespec='seconds')
+    conn = None
+    try:
+        conn = get_db_connection(current_app.config['VELIKA_MONTAZA_DB_PATH'])
+        if conn is None: raise sqlite3.OperationalError("Could not connect to montaza DB.")
+        before = conn.total_changes
+        conn.executemany(
+            "INSERT OR IGNORE INTO skladisce_arrivals_seen (username, arrival_key, seen_at) VALUES (?, ?, ?)",
+            [(username, key, now) for key in arrival_keys]
+        )
+        conn.commit()
+        return conn.total_changes - before
+    finally:
+        if conn: conn.close()
+
+def mark_seen_for_group(group_name, arrival_keys=None):
+    """Sets the shared is_seen flag for the group's arrivals (all unseen ones if arrival_keys is None)."""
+    conn = None
+    try:
+        conn = get_db_connection(current_app.config['VELIKA_MONTAZA_DB_PATH'])
+        if conn is None: raise sqlite3.OperationalError("Could not connect to montaza DB.")
+        in_group = "project_task_no IN (SELECT project_task_no FROM skladisce_groups WHERE group_name = ?)"
+        if arrival_keys is None:
+            cursor = conn.execute(f"UPDATE skladisce_arrivals SET is_seen = 1 WHERE is_seen = 0 AND {in_group}", (group_name,))
+            marked = cursor.rowcount
+        else:
+            before = conn.total_changes
+            conn.executemany(
+                f"UPDATE skladisce_arrivals SET is_seen = 1 WHERE arrival_key = ? AND is_seen = 0 AND {in_group}",
+                [(key, group_name) for key in arrival_keys]
+            )
+            marked = conn.total_changes - before
+        conn.commit()
+        return marked
+    finally:
+        if conn: conn.close()
@@ -1,11 +1,22 @@
 from flask import (
     Blueprint, jsonify, request, session, redirect, url_for
 )
+import os
+import time
+import sqlite3
+import threading
+import logging
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
 from functools import wraps
-from werkzeug.security import check_password_hash
+from werkzeug.security import check_password_hash, generate_password_hash
 from .db import get_db_connection
 from flask import current_app # Import current_app to access config
 
+logger = logging.getLogger(__name__)
+
 # Create a Blueprint. All routes defined here will be registered with this.
 bp = Blueprint('auth', __name__, url_prefix='/api')
 
@@ -35,6 +46,143 @@ def admin_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
+# --- Password Hashing Pool ---
+# Hash checks are CPU-heavy (scrypt), so they run in a small process pool instead of
+# on a waitress thread. A semaphore caps how many jobs may be queued or running.
+# The entry points start the pool with start_hash_pool() before their own threads exist:
+# on POSIX the workers are forked, and a fork from a busy request thread can copy a lock
+# some other thread holds into the child. If the pool breaks it is recreated lazily.
+_hash_pool = None
+_hash_pool_lock = threading.Lock()
+_hash_slots = None
+
+class LoginBusyError(Exception):
+    """Raised when the hashing pool queue is full."""
+    pass
+
+def _get_hash_pool():
+    """Lazily creates the shared hashing pool and its queue slots."""
+    global _hash_pool, _hash_slots
+    with _hash_pool_lock:
+        if _hash_pool is None:
+            _hash_pool = ProcessPoolExecutor(max_workers=current_app.config['LOGIN_HASH_WORKERS'])
+            _hash_slots = threading.BoundedSemaphore(current_app.config['LOGIN_HASH_QUEUE_LIMIT'])
+        return _hash_pool, _hash_slots
+
+def start_hash_pool(app):
+    """Creates the hashing pool and forks its workers now, while the process has no request threads yet."""
+    if multiprocessing.get_start_method() != 'fork' or multiprocessing.parent_process() is not None:
+        return # Spawned workers start from a fresh interpreter, so creating them lazily is safe
+    with app.app_context():
+        pool, _ = _get_hash_pool()
+    pool.submit(int).result() # The first job starts the worker processes
+
+def _reset_hash_pool():
+    """Drops a broken pool so the next login creates a fresh one."""
+    global _hash_pool, _hash_slots
+    with _hash_pool_lock:
+        if _hash_pool is not None:
+            _hash_pool.shutdown(wait=False)
+        _hash_pool, _hash_slots = None, None
+
+def _submit_hash_job(func, *args):
+    """Submits a hashing job to the pool, or raises LoginBusyError if the queue is full."""
+    pool, slots = _get_hash_pool()
+    if not slots.acquire(blocking=False):
+        raise LoginBusyError("Too many logins in progress.")
+    try:
+        future = pool.submit(func, *args)
+    except Exception:
+        slots.release()
+        raise
+    # Release the slot only once the job really finishes, even if the caller timed out.
+    future.add_done_callback(lambda _f: slots.release())
+    return future
+
+def verify_password(password_hash, password):
+    """Checks a password against its hash in the hashing pool."""
+    future = _submit_hash_job(check_password_hash, password_hash, password)
+    try:
+        return future.result(timeout=current_app.config['LOGIN_HASH_TIMEOUT_SECONDS'])
+    except BrokenProcessPool:
+        logger.warning("Password hashing pool broke, recreating it on next login.")
+        _reset_hash_pool()
+        raise
+
+def _needs_rehash(password_hash):
+    """True if the stored hash was made with a different method than the configured one."""
+    method = password_hash.split('$', 1)[0]
+    return method != current_app.config['PASSWORD_HASH_METHOD']
+
+def _schedule_hash_upgrade(db_path, user_id, username, password):
+    """Re-hashes a password with the current method in the background and stores it."""
+    def store_upgraded_hash(future):
+        try:
+            new_hash = future.result()
+        except Exception as e:
+            logger.warning(f"Could not upgrade password hash for user '{username}': {e}")
+            return
+        conn = None
+        try:
+            conn = sqlite3.connect(db_path)
+            conn.execute("UPDATE users SET password_hash = ? WHERE id = ?", (new_hash, user_id))
+            conn.commit()
+            logger.info(f"Upgraded password hash for user: {username}")
+        except sqlite3.Error as e:
+            logger.warning(f"Could not store upgraded password hash for user '{username}': {e}")
+        finally:
+            if conn: conn.close()
+    try:
+        future = _submit_hash_job(generate_password_hash, password, current_app.config['PASSWORD_HASH_METHOD'])
+        future.add_done_callback(store_upgraded_hash)
+    except LoginBusyError:
+        pass # Pool is busy; the upgrade is retried on the next successful login
+
+# --- Failed Login Rate Limiting ---
+# Every attempt is counted as a failure up front, in the same lock acquisition as the
+# limit check, so concurrent attempts can't all slip past it. Only wrong credentials keep
+# it: a successful login, a busy hashing pool (503) or a server error give back just that
+# attempt, so other users behind the same address keep the failures they caused.
+_failed_logins = {} # client address -> deque of failure timestamps
+_failed_logins_lock = threading.Lock()
+
+def _recent_failures(client, now):
+    """Returns the failure timestamps for a client inside the window, pruning older ones."""
+    window = current_app.config['LOGIN_FAILED_WINDOW_SECONDS']
+    failures = _failed_logins.get(client)
+    if failures is None:
+        return None
+    while failures and failures[0] <= now - window:
+        failures.popleft()
+    if not failures:
+        del _failed_logins[client]
+        return None
+    return failures
+
+def _reserve_login_attempt(client):
+    """
+    Counts an attempt as failed unless the client is rate limited.
+    Returns (0, timestamp of the reserved failure) or (seconds until the client may try again, None).
+    """
+    now = time.monotonic()
+    with _failed_logins_lock:
+        failures = _recent_failures(client, now)
+        if failures is None:
+            failures = _failed_logins[client] = deque()
+        elif len(failures) >= current_app.config['LOGIN_MAX_FAILED_ATTEMPTS']:
+            return max(1, int(failures[0] + current_app.config['LOGIN_FAILED_WINDOW_SECONDS'] - now)), None
+        failures.append(now)
+        return 0, now
+
+def _release_login_attempt(client, reserved_at):
+    """Takes back a reserved failure (the attempt succeeded, or failed on our side)."""
+    with _failed_logins_lock:
+        failures = _failed_logins.get(client)
+        if failures is not None and reserved_at in failures:
+            failures.remove(reserved_at)
+            if not failures:
+                del _failed_logins[client]
+
 # --- Auth Routes ---
 @bp.route('/logout')
 def logout():
@@ -42,7 +190,7 @@ def logout():
     session.pop('logged_in', None)
     session.pop('username', None)
     session.pop('role', None)
-    print("User logged out.")
+    logger.info("User logged out.")
     return redirect(url_for('core.serve_app')) # Redirect to main login page
 
 @bp.route('/login', methods=['POST'])
@@ -51,6 +199,16 @@ def web_app_login():
     data = request.json
     username = data.get('username')
     password = data.get('password')
+    client = request.remote_addr or 'unknown'
+
+    # Rate limit repeated failures before spending any time on hashing.
+    retry_after, reserved_at = _reserve_login_attempt(client)
+    if retry_after:
+        logger.warning(f"Login rate limited for client: {client}")
+        response = jsonify({"status": "error", "message": "Too many failed login attempts. Try again later."})
+        response.headers['Retry-After'] = str(retry_after)
+        return response, 429
+
     conn = None
     try:
         # Get DB path from config
@@ -61,17 +219,25 @@ def web_app_login():
 
         user_row = conn.execute("SELECT * FROM users WHERE username = ?", (username,)).fetchone()
 
-        if user_row and check_password_hash(user_row['password_hash'], password):
+        if user_row and password and verify_password(user_row['password_hash'], password):
+            _release_login_attempt(client, reserved_at)
+            if _needs_rehash(user_row['password_hash']):
+                _schedule_hash_upgrade(db_path, user_row['id'], user_row['username'], password)
             session['logged_in'] = True
             session['username'] = user_row['username']
             session['role'] = user_row['role']
-            print(f"Login successful for user: {username}, role: {user_row['role']}")
+            logger.info(f"Login successful for user: {username}, role: {user_row['role']}")
             return jsonify({"status": "success", "role": user_row['role'], "username": user_row['username']})
 
-        print(f"Login failed for user: {username}")
+        logger.warning(f"Login failed for user: {username}")
         return jsonify({"status": "error", "message": "Invalid Credentials."}), 401
+    except (LoginBusyError, FutureTimeoutError):
+        _release_login_attempt(client, reserved_at)
+        logger.warning(f"Login rejected for user: {username}, hashing pool is busy.")
+        return jsonify({"status": "error", "message": "Server busy, please try again."}), 503
     except Exception as e:
-        print(f"Login error: {e}")
+        _release_login_attempt(client, reserved_at)
+        logger.error(f"Login error: {e}")
         return jsonify({"status": "error", "message": "Server error during login."}), 500
     finally:
         if conn:
@@ -0,0 +1,56 @@
+import bisect
+import sqlite3
+import threading
+import logging
+from flask import current_app
+from .db import get_db_connection
+from .generations import file_generation
+
+logger = logging.getLogger(__name__)
+
+# Sorted, in-memory list of every project in projekti_baza.db. The ERP snapshot only
+# changes when the file is replaced, so the list is rebuilt only when the file changes.
+
+_catalog_lock = threading.Lock()
+_catalog = {"key": None, "projects": [], "keys": []}
+
+def _load_catalog():
+    db_path = current_app.config['DATABASE_FILE_PATH']
+    key = file_generation(db_path)
+    with _catalog_lock:
+        if _catalog['key'] == key and key is not None:
+            return _catalog['projects'], _catalog['keys']
+        conn = None
+        try:
+            conn = get_db_connection(db_path)
+            if conn is None: raise sqlite3.OperationalError("Could not connect to main DB.")
+            names = {row['project_task_no'] for row in conn.execute("SELECT DISTINCT project_task_no FROM work_orders") if row['project_task_no']}
+        finally:
+            if conn: conn.close()
+        projects = sorted(names, key=lambda name: (name.upper(), name))
+        _catalog['key'] = key
+        _catalog['projects'] = projects
+        _catalog['keys'] = [name.upper() for name in projects] # Search keys, same order as projects
+        logger.info(f"Project catalog rebuilt with {len(projects)} projects.")
+        return projects, _catalog['keys']
+
+def get_all_projects():
+    """Returns every project_task_no in projekti_baza.db, sorted."""
+    return _load_catalog()[0]
+
+def search_projects(query='', match='prefix'):
+    """
+    Returns the sorted project names matching query (case-insensitive).
+    match='prefix' uses a binary search on the sorted keys; match='substring' scans them.
+    """
+    projects, keys = _load_catalog()
+    query = (query or '').upper()
+    if not query:
+        return projects
+    if match == 'substring':
+        return [projects[i] for i, key in enumerate(keys) if query in key]
+    start = bisect.bisect_left(keys, query)
+    end = start
+    while end < len(keys) and keys[end].startswith(query):
+        end += 1
+    return projects[start:end]
@@ -17,4 +17,94 @@ UPLOADS_FOLDER = os.path.join(APP_ROOT, 'uploads')
 
 # --- App Settings ---
 SECRET_KEY = 'your_super_secret_key_change_me' # IMPORTANT: Change this!
-UPRAVLJALNI_CENTER_SKLOP = '303'
\ No newline at end of file
+
+# --- Work Centers ---
+WORK_CENTERS = ('303',) # Assembly work centers tracked on the layout; each card carries progress per center
+DEFAULT_WORK_CENTERS = ('303',) # Used when a request has no ?work_center= (comma-separated subset of WORK_CENTERS)
+
+# --- Login Settings ---
+PASSWORD_HASH_METHOD = 'scrypt:32768:8:1' # Stored hashes using any other method are upgraded on the next successful login
+LOGIN_HASH_WORKERS = 2 # Size of the process pool that verifies password hashes
+LOGIN_HASH_QUEUE_LIMIT = 8 # Max hash jobs queued or running at once; further logins get a 503
+LOGIN_HASH_TIMEOUT_SECONDS = 10
+LOGIN_MAX_FAILED_ATTEMPTS = 5 # Failed attempts per client allowed inside the window below
+LOGIN_FAILED_WINDOW_SECONDS = 300
+
+# --- Public Endpoints (planning_data, detailed parts lists) ---
+PUBLIC_CACHE_TTL_SECONDS = 5 # Identical requests inside this window share one computed response
+PUBLIC_CACHE_MAX_ENTRIES = 1000
+PUBLIC_CACHE_WAIT_SECONDS = 30 # How long a request waits for an identical one in progress before computing itself
+PUBLIC_RATE_LIMIT_PER_SECOND = 2 # Token bucket refill rate per client address
+PUBLIC_RATE_LIMIT_BURST = 20 # Bucket size: requests a client may send at once before getting 429
+PUBLIC_RATE_LIMIT_MAX_CLIENTS = 10000 # Tracked client buckets before idle (full) ones are dropped
+
+# --- ASGI Settings (asgi.py) ---
+ASGI_WSGI_THREADS = 8 # Threads running the regular Flask routes behind the ASGI server
+ASGI_DB_THREADS = 4 # Dedicated executor for SQLite work done by the native async routes
+LAYOUT_STREAM_INTERVAL_SECONDS = 5 # How often the layout stream re-checks for changes
+LAYOUT_STREAM_KEEPALIVE_SECONDS = 25
+
+# --- Layout Viewport Settings ---
+LAYOUT_GRID_CELL_SIZE = 1000 # Cell size (layout units) of the in-memory grid index behind ?bbox= queries
+LAYOUT_VIEWPORT_MARGIN_PX = 200 # Screen pixels added around a requested bbox (divided by zoom)
+LAYOUT_OVERLAP_MODE = 'snap' # What add/move do with a drop that overlaps another card: 'snap', 'reject' or 'allow'
+LAYOUT_SNAP_GAP = 10 # Spacing (layout units) added to the card size when stepping through candidate slots
+LAYOUT_SNAP_MAX_RINGS = 10 # How many card-sized rings around the drop point are searched for a free slot
+LAYOUT_PRETTY_PRINT = False # Write layout_data.json indented (slower, bigger) instead of compact
+LAYOUT_GENERATION_CHECK_SECONDS = 1 # How long a process trusts its last read of the shared 'layout' generation
+
+# --- Background Jobs ---
+BACKGROUND_JOBS_ENABLED = True
+SCHEDULER_TICK_SECONDS = 30 # How often the scheduler checks for due jobs
+SCHEDULER_LOCK_FILE = os.path.join(APP_ROOT, 'scheduler.lock') # Only the process holding this lock runs jobs
+SNAPSHOT_INTERVAL_SECONDS = 3600 # Refresh today's project snapshot (one row per project per day) this often
+ARRIVALS_CHECK_INTERVAL_SECONDS = 60 # How often to look for a new ERP snapshot to diff for warehouse arrivals (cheap when unchanged)
+FORECAST_CHECK_INTERVAL_SECONDS = 120 # How often to check whether cas_baza, projekti_baza or the layout changed and forecasts need recomputing
+MAINTENANCE_CHECK_INTERVAL_SECONDS = 600 # How often to check whether the nightly database maintenance is due
+
+# --- Database Maintenance (app/maintenance.py) ---
+MAINTENANCE_WINDOW_HOURS = (2, 5) # Local hours [start, end) in which the maintenance runs once; may wrap midnight, e.g. (22, 4)
+MAINTENANCE_ANALYSIS_LIMIT = 1000 # Rows ANALYZE samples per index (0 = all rows)
+MAINTENANCE_VACUUM_MAX_PAGES = 0 # Free pages incremental_vacuum returns per run (0 = all)
+MAINTENANCE_BUSY_TIMEOUT_SECONDS = 30 # How long to wait for other writers (the time clock) per database
+MAINTENANCE_RUNS_LIMIT = 30 # Default ?limit= of /api/admin/maintenance
+MAINTENANCE_LOCK_FILE = os.path.join(APP_ROOT, 'maintenance.lock') # Held while a run is in progress (any process)
+
+# --- Analytics ---
+LABOUR_MAX_INTERVAL_HOURS = 12 # Longer Start->next-event gaps are treated as forgotten clock-outs
+LABOUR_CACHE_MIN_AGE_SECONDS = 60 # Minimum age before the labour cache is rebuilt after cas_baza.db changed
+FORECAST_WINDOW_DAYS = 56 # Completed DNIs per worker over this many days of history give the forecast rates
+FORECAST_MAX_AGE_SECONDS = 3600 # Recompute forecasts at least this often (manual DNI completions, priorities)
+
+# --- ERP Import (import_erp.py) ---
+ERP_IMPORT_BATCH_SIZE = 50000 # Rows per executemany transaction
+ERP_IMPORT_MIN_RATIO = 0.5 # Refuse an export with fewer rows than this share of the current table (truncated export)
+ERP_IMPORT_SWAP_TIMEOUT_SECONDS = 10 # How long to keep retrying the swap while Windows readers hold the old file
+DB_SWAP_WAIT_SECONDS = 2 # How long a new connection waits for a database file that is being swapped in
+ERP_REPLICA_ENABLED = False # Serve projekti_baza.db reads from an in-memory copy (one per process, two while one reloads and reads on the old copy finish)
+
+# --- cas_baza Archive (archive_cas.py) ---
+CAS_ARCHIVE_FOLDER = os.path.join(APP_ROOT, 'archive') # Yearly cas_archive_<year>.db files
+CAS_ARCHIVE_HORIZON_DAYS = 365 # Time entries older than this are moved to the archive
+
+# --- Planning Data & Exports ---
+EXPORT_BATCH_SIZE = 200 # Projects (or part rows) computed per step of a streamed CSV/XLSX export
+PLANNING_PAGE_SIZE = 100 # Default ?limit= for paginated /api/planning_data requests
+PLANNING_MAX_PAGE_SIZE = 500
+
+# --- Warehouse Arrivals ---
+ARRIVALS_FEED_LIMIT = 200 # Default ?limit= of the unseen-arrivals feeds
+SHORTAGES_MAX_PROJECTS = 500 # Max projects in an ad-hoc /api/shortages?projects= report
+
+# --- Notes Search ---
+NOTES_SEARCH_LIMIT = 20 # Default ?limit= of /api/search/notes
+
+# --- Logging (app/logging_setup.py) ---
+LOG_LEVEL = 'INFO' # Level of the 'app' loggers
+LOG_LEVELS = {} # Per-module overrides, e.g. {'app.scheduler': 'WARNING', 'app.requests': 'DEBUG'}
+LOG_CONSOLE = True # Human-readable lines on stderr
+LOG_FILE = os.path.join(APP_ROOT, 'logs', 'app.log') # JSON lines; None disables the file
+LOG_FILE_MAX_BYTES = 10 * 1024 * 1024
+LOG_FILE_BACKUP_COUNT = 5
+LOG_QUEUE_SIZE = 10000 # Records waiting for the writer thread; more are dropped
+LOG_SLOW_REQUEST_MS = 2000 # Requests slower than this are logged as warnings ('app.requests' at DEBUG logs all)
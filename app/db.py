@@ -1,23 +1,46 @@
 import sqlite3
 import os
+import time
+import logging
+from urllib.request import pathname2url
 from flask import current_app, g
 
+logger = logging.getLogger(__name__)
+
+def _wait_for_file(db_file_path, timeout):
+    """Waits out the short window in which a database file is being swapped in (see erp_import)."""
+    deadline = time.monotonic() + timeout
+    while not os.path.exists(db_file_path):
+        if time.monotonic() >= deadline:
+            return False
+        time.sleep(0.05)
+    return True
+
 def get_db_connection(db_file_path):
-    """Establishes a connection to the specified SQLite database."""
-    if not os.path.exists(db_file_path):
-        print(f"ERROR: Database file not found at '{db_file_path}'.")
-        if db_file_path == current_app.config['CAS_DATABASE_FILE_PATH']:
-            print(f"Warning: '{os.path.basename(db_file_path)}' not found. Worker names cannot be fetched.")
+    """Establishes a connection to the specified SQLite database (projekti_baza may be served by app/replica.py)."""
+    if db_file_path == current_app.config['DATABASE_FILE_PATH'] and current_app.config['ERP_REPLICA_ENABLED']:
+        from .replica import replica_connection # Imported here: replica -> generations -> db
+        conn = replica_connection()
+        if conn is not None:
+            return conn
+    is_cas_db = db_file_path == current_app.config['CAS_DATABASE_FILE_PATH']
+    if not os.path.exists(db_file_path) and (is_cas_db or not _wait_for_file(db_file_path, current_app.config['DB_SWAP_WAIT_SECONDS'])):
+        database = os.path.basename(db_file_path)
+        if is_cas_db:
+            logger.warning(f"'{database}' not found. Worker names cannot be fetched.", extra={'database': database})
             return None
+        logger.error(f"Database file not found at '{db_file_path}'.", extra={'database': database})
         raise FileNotFoundError(f"Database file not found at '{db_file_path}'.")
     try:
-        conn = sqlite3.connect(db_file_path, check_same_thread=False, detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES)
+        # mode=rw: never create an empty database if the file disappears between the check and the open
+        conn = sqlite3.connect(f"file:{pathname2url(db_file_path)}?mode=rw", uri=True, check_same_thread=False, detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES)
         conn.row_factory = sqlite3.Row
         return conn
     except sqlite3.OperationalError as e:
-        print(f"ERROR: Could not connect to database '{db_file_path}': {e}")
-        if db_file_path == current_app.config['CAS_DATABASE_FILE_PATH']:
-            print(f"Warning: Could not connect. Worker names cannot be fetched.")
+        database = os.path.basename(db_file_path)
+        logger.error(f"Could not connect to database '{db_file_path}': {e}", extra={'database': database})
+        if is_cas_db:
+            logger.warning("Could not connect. Worker names cannot be fetched.", extra={'database': database})
             return None
         raise e
 
@@ -29,7 +52,7 @@ def init_velika_montaza_db():
         db_path = current_app.config['VELIKA_MONTAZA_DB_PATH']
         conn = get_db_connection(db_path)
         if conn is None:
-            print(f"ERROR: Cannot initialize '{os.path.basename(db_path)}' as it could not be connected to.")
+            logger.error(f"Cannot initialize '{os.path.basename(db_path)}' as it could not be connected to.")
             return
 
         cursor = conn.cursor()
@@ -54,22 +77,22 @@ def init_velika_montaza_db():
         # Add columns if they don't exist (for older DBs)
         try: cursor.execute("SELECT priority FROM project_notes LIMIT 1")
         except sqlite3.OperationalError:
-            print("Adding 'priority' column to project_notes table.")
+            logger.info("Adding 'priority' column to project_notes table.")
             cursor.execute("ALTER TABLE project_notes ADD COLUMN priority TEXT")
         
         try: cursor.execute("SELECT pause_status FROM project_notes LIMIT 1")
         except sqlite3.OperationalError:
-            print("Adding 'pause_status' column to project_notes table.")
+            logger.info("Adding 'pause_status' column to project_notes table.")
             cursor.execute("ALTER TABLE project_notes ADD COLUMN pause_status TEXT")
         
         try: cursor.execute("SELECT last_note_updated_at FROM project_notes LIMIT 1")
         except sqlite3.OperationalError:
-            print("Adding 'last_note_updated_at' column to project_notes table.")
+            logger.info("Adding 'last_note_updated_at' column to project_notes table.")
             cursor.execute("ALTER TABLE project_notes ADD COLUMN last_note_updated_at TEXT")
 
         try: cursor.execute("SELECT last_dni_updated_at FROM project_notes LIMIT 1")
         except sqlite3.OperationalError:
-            print("Adding 'last_dni_updated_at' column to project_notes table.")
+            logger.info("Adding 'last_dni_updated_at' column to project_notes table.")
             cursor.execute("ALTER TABLE project_notes ADD COLUMN last_dni_updated_at TEXT")
 
         # DNI status table
@@ -98,12 +121,185 @@ def init_velika_montaza_db():
                 role TEXT NOT NULL CHECK (role IN ('admin', 'viewer'))
             )""")
 
+        # Shared generation counters (cache invalidation across worker processes)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS cache_generations (
+                name TEXT PRIMARY KEY,
+                generation INTEGER NOT NULL DEFAULT 0
+            )""")
+
+        # Daily per-project snapshots and their weekly rollups (trend endpoints)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS project_daily_snapshots (
+                project_task_no TEXT NOT NULL,
+                snapshot_date TEXT NOT NULL,
+                completed_dnis INTEGER NOT NULL,
+                total_dnis INTEGER NOT NULL,
+                electrification_state TEXT,
+                control_state TEXT,
+                pause_status TEXT,
+                PRIMARY KEY (project_task_no, snapshot_date)
+            ) WITHOUT ROWID""")
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS project_weekly_rollups (
+                project_task_no TEXT NOT NULL,
+                week_start TEXT NOT NULL,
+                first_completed INTEGER NOT NULL,
+                last_completed INTEGER NOT NULL,
+                total_dnis INTEGER NOT NULL,
+                days_recorded INTEGER NOT NULL,
+                paused_days INTEGER NOT NULL,
+                electrification_state TEXT,
+                control_state TEXT,
+                pause_status TEXT,
+                PRIMARY KEY (project_task_no, week_start)
+            ) WITHOUT ROWID""")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_weekly_rollups_week ON project_weekly_rollups (week_start)")
+
+        # Warehouse (skladisce) arrivals and project groups
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS skladisce_arrivals (
+                arrival_key TEXT PRIMARY KEY,
+                is_seen BOOLEAN NOT NULL CHECK (is_seen IN (0, 1))
+            )""")
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS skladisce_groups (
+                group_name TEXT NOT NULL,
+                project_task_no TEXT NOT NULL,
+                PRIMARY KEY (group_name, project_task_no)
+            )""")
+        # Columns filled by the arrivals detection job (rows from before it stay NULL)
+        for column, column_type in (("project_task_no", "TEXT"), ("item_no", "TEXT"), ("description", "TEXT"),
+                                    ("sifra_regala", "TEXT"), ("quantity", "REAL"), ("arrived_at", "TEXT")):
+            try: cursor.execute(f"SELECT {column} FROM skladisce_arrivals LIMIT 1")
+            except sqlite3.OperationalError:
+                logger.info(f"Adding '{column}' column to skladisce_arrivals table.")
+                cursor.execute(f"ALTER TABLE skladisce_arrivals ADD COLUMN {column} {column_type}")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_skladisce_arrivals_project ON skladisce_arrivals (project_task_no, arrived_at)")
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS skladisce_arrivals_seen (
+                username TEXT NOT NULL,
+                arrival_key TEXT NOT NULL,
+                seen_at TEXT NOT NULL,
+                PRIMARY KEY (username, arrival_key)
+            ) WITHOUT ROWID""")
+        # Inventory per component at the last processed ERP snapshot (what arrivals are diffed against)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS skladisce_inventory_state (
+                project_task_no TEXT NOT NULL,
+                item_no TEXT NOT NULL,
+                sifra_regala TEXT NOT NULL,
+                inventory REAL NOT NULL,
+                PRIMARY KEY (project_task_no, item_no, sifra_regala)
+            ) WITHOUT ROWID""")
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS skladisce_inventory_snapshot (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                signature TEXT,
+                processed_at TEXT
+            )""")
+        # Completion forecasts, rewritten by the forecast job (app/forecast.py)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS project_forecasts (
+                project_task_no TEXT PRIMARY KEY,
+                worker_name TEXT,
+                remaining_dnis INTEGER NOT NULL,
+                dnis_per_day REAL,
+                expected_finish TEXT,
+                computed_at TEXT NOT NULL
+            )""")
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS worker_forecasts (
+                worker_name TEXT PRIMARY KEY,
+                projects INTEGER NOT NULL,
+                remaining_dnis INTEGER NOT NULL,
+                dnis_per_day REAL,
+                expected_finish TEXT,
+                computed_at TEXT NOT NULL
+            )""")
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS forecast_state (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                signature TEXT,
+                computed_at TEXT
+            )""")
+
+        # One row per database per maintenance run (see maintenance.py)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS maintenance_runs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                started_at TEXT NOT NULL,
+                database TEXT NOT NULL,
+                duration_ms REAL NOT NULL,
+                page_size INTEGER,
+                pages_before INTEGER,
+                pages_after INTEGER,
+                free_pages_before INTEGER,
+                free_pages_after INTEGER,
+                steps TEXT,
+                error TEXT
+            )""")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_maintenance_runs_started ON maintenance_runs (started_at)")
+
+        # R*Tree mirror of the layout card rectangles (overlap checks on placement)
+        try:
+            cursor.execute("""
+                CREATE VIRTUAL TABLE IF NOT EXISTS layout_rtree USING rtree(
+                    id, min_x, max_x, min_y, max_y,
+                    +project_task_no TEXT
+                )""")
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS layout_rtree_state (
+                    id INTEGER PRIMARY KEY CHECK (id = 1),
+                    signature TEXT
+                )""")
+        except sqlite3.OperationalError as e:
+            logger.warning(f"SQLite R*Tree module not available, layout overlap checks are disabled: {e}")
+
+        # FTS5 index over the note columns (/api/search/notes). External content: the text stays
+        # in project_notes only, and the triggers keep the index in step with every write.
+        try:
+            cursor.execute("""
+                CREATE VIRTUAL TABLE IF NOT EXISTS project_notes_fts USING fts5(
+                    notes, electrification_notes, control_notes,
+                    content='project_notes', content_rowid='rowid',
+                    tokenize='unicode61 remove_diacritics 2'
+                )""")
+            cursor.execute("""
+                CREATE TRIGGER IF NOT EXISTS project_notes_fts_insert AFTER INSERT ON project_notes BEGIN
+                    INSERT INTO project_notes_fts (rowid, notes, electrification_notes, control_notes)
+                    VALUES (new.rowid, new.notes, new.electrification_notes, new.control_notes);
+                END""")
+            cursor.execute("""
+                CREATE TRIGGER IF NOT EXISTS project_notes_fts_delete AFTER DELETE ON project_notes BEGIN
+                    INSERT INTO project_notes_fts (project_notes_fts, rowid, notes, electrification_notes, control_notes)
+                    VALUES ('delete', old.rowid, old.notes, old.electrification_notes, old.control_notes);
+                END""")
+            # Only note edits touch the index; status, priority and timestamp updates don't.
+            cursor.execute("""
+                CREATE TRIGGER IF NOT EXISTS project_notes_fts_update
+                AFTER UPDATE OF notes, electrification_notes, control_notes ON project_notes BEGIN
+                    INSERT INTO project_notes_fts (project_notes_fts, rowid, notes, electrification_notes, control_notes)
+                    VALUES ('delete', old.rowid, old.notes, old.electrification_notes, old.control_notes);
+                    INSERT INTO project_notes_fts (rowid, notes, electrification_notes, control_notes)
+                    VALUES (new.rowid, new.notes, new.electrification_notes, new.control_notes);
+                END""")
+            # Indexes notes written before the triggers existed (and repairs the index if a
+            # VACUUM renumbered project_notes rowids).
+            try:
+                cursor.execute("INSERT INTO project_notes_fts (project_notes_fts, rank) VALUES ('integrity-check', 1)")
+            except sqlite3.DatabaseError:
+                logger.info("Rebuilding the project notes search index.")
+                cursor.execute("INSERT INTO project_notes_fts (project_notes_fts) VALUES ('rebuild')")
+        except sqlite3.OperationalError as e:
+            logger.warning(f"SQLite FTS5 module not available, notes search is disabled: {e}")
+
         conn.commit()
-        print("Velika Montaza database schema is verified.")
+        logger.info("Velika Montaza database schema is verified.")
     except sqlite3.OperationalError as e:
-        print(f"ERROR initializing Velika Montaza database: {e}")
+        logger.error(f"Error initializing Velika Montaza database: {e}")
     except Exception as e:
-        print(f"An unexpected error occurred during Velika Montaza DB initialization: {e}")
+        logger.error(f"An unexpected error occurred during Velika Montaza DB initialization: {e}")
     finally:
         if conn:
             conn.close()
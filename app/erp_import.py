@@ -0,0 +1,177 @@
+import os
+import csv
+import time
+import sqlite3
+import logging
+from urllib.request import pathname2url
+from flask import current_app
+
+logger = logging.getLogger(__name__)
+
+# Bulk import of ERP CSV exports (work orders + components) into projekti_baza.db.
+# Rows are streamed from the CSV files into a fresh database next to the live one,
+# indexes are built after loading, counts are validated and the new file is then
+# os.replace()d over the old one. Open connections keep reading the old file until
+# they close; new connections see the new one (get_db_connection waits out the swap).
+
+ERP_TABLES = {
+    "work_orders": ("project_task_no", "work_order_no", "description", "work_center"),
+    "components": ("project_task_no", "item_no", "description", "inventory", "remaining_quantity", "sifra_regala", "work_center"),
+}
+_NUMERIC_COLUMNS = {"inventory", "remaining_quantity"}
+
+_SCHEMA = """
+    CREATE TABLE work_orders (project_task_no TEXT, work_order_no TEXT, description TEXT, work_center TEXT);
+    CREATE TABLE components (
+        project_task_no TEXT, item_no TEXT, description TEXT,
+        inventory NUMERIC, remaining_quantity NUMERIC, sifra_regala TEXT, work_center TEXT
+    );
+"""
+# Built after loading; one index build is much cheaper than maintaining it per insert.
+_INDEXES = """
+    CREATE INDEX idx_work_orders_project ON work_orders (project_task_no, work_center);
+    CREATE INDEX idx_components_project ON components (project_task_no, work_center);
+    CREATE INDEX idx_components_item ON components (item_no);
+"""
+
+class ImportValidationError(Exception):
+    """The new snapshot failed validation; the live database was left untouched."""
+
+def _numeric(value):
+    value = value.strip()
+    if not value:
+        return None
+    return value.replace(',', '.') # ERP exports use decimal commas; NUMERIC affinity stores the result as a number
+
+def _csv_rows(csv_path, table, delimiter, encoding):
+    """Yields tuples in ERP_TABLES column order; header names are matched case-insensitively."""
+    columns = ERP_TABLES[table]
+    with open(csv_path, newline='', encoding=encoding) as f:
+        reader = csv.reader(f, delimiter=delimiter)
+        header = [name.strip().lower() for name in next(reader, [])]
+        missing = [column for column in columns if column not in header]
+        if missing:
+            raise ImportValidationError(f"{os.path.basename(csv_path)}: missing columns {', '.join(missing)}")
+        positions = [header.index(column) for column in columns]
+        numeric = [column in _NUMERIC_COLUMNS for column in columns]
+        width = max(positions) + 1
+        for line in reader:
+            if not line:
+                continue
+            if len(line) < width:
+                line = line + [''] * (width - len(line))
+            yield tuple(
+                _numeric(line[pos]) if is_numeric else (line[pos].strip() or None)
+                for pos, is_numeric in zip(positions, numeric)
+            )
+
+def _load_table(conn, table, rows, batch_size):
+    """Inserts rows with executemany in large transactions. Returns the number of rows read."""
+    columns = ERP_TABLES[table]
+    sql = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+    total = 0
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            with conn:
+                conn.executemany(sql, batch)
+            total += len(batch)
+            batch = []
+    if batch:
+        with conn:
+            conn.executemany(sql, batch)
+        total += len(batch)
+    return total
+
+def _current_counts(db_path):
+    """
+    Row counts of the live database, or None if there is none yet. Raises
+    ImportValidationError if it exists but can't be counted: the truncation check
+    would otherwise be skipped without anyone noticing.
+    """
+    if not os.path.exists(db_path):
+        return None
+    try:
+        conn = sqlite3.connect(f"file:{pathname2url(db_path)}?mode=ro", uri=True)
+        try:
+            return {table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0] for table in ERP_TABLES}
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        raise ImportValidationError(
+            f"Could not count the rows of the current database to check the export against: {e} (use --force to import anyway)."
+        ) from e
+
+def _validate(conn, read_counts, previous_counts, min_ratio):
+    for table, read in read_counts.items():
+        stored = conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+        if stored != read:
+            raise ImportValidationError(f"{table}: read {read} rows but stored {stored}.")
+        if read == 0:
+            raise ImportValidationError(f"{table}: the export is empty.")
+        if previous_counts and min_ratio and read < previous_counts[table] * min_ratio:
+            # A truncated export would otherwise silently wipe most of the data.
+            raise ImportValidationError(
+                f"{table}: {read} rows is less than {min_ratio:.0%} of the current {previous_counts[table]} (use --force to import anyway)."
+            )
+    check = conn.execute("PRAGMA quick_check").fetchone()[0]
+    if check != 'ok':
+        raise ImportValidationError(f"quick_check failed: {check}")
+
+def _swap_into_place(tmp_path, db_path):
+    """Atomically replaces db_path, retrying while Windows readers still have the old file open."""
+    deadline = time.monotonic() + current_app.config['ERP_IMPORT_SWAP_TIMEOUT_SECONDS']
+    delay = 0.02
+    while True:
+        try:
+            os.replace(tmp_path, db_path)
+            return
+        except PermissionError:
+            if time.monotonic() >= deadline: raise
+            time.sleep(delay)
+            delay = min(delay * 2, 0.5)
+
+def import_erp_snapshot(work_orders_csv, components_csv, db_path=None, delimiter=',', encoding='utf-8-sig', force=False):
+    """Imports both ERP CSV exports into a new database and swaps it in. Returns the row counts."""
+    db_path = db_path or current_app.config['DATABASE_FILE_PATH']
+    tmp_path = f"{db_path}.{os.getpid()}.import.tmp"
+    batch_size = current_app.config['ERP_IMPORT_BATCH_SIZE']
+    min_ratio = 0 if force else current_app.config['ERP_IMPORT_MIN_RATIO']
+    started = time.monotonic()
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+    conn = sqlite3.connect(tmp_path)
+    try:
+        # The temporary file is thrown away on any failure, so durability during the load doesn't matter.
+        conn.execute("PRAGMA journal_mode = OFF")
+        conn.execute("PRAGMA synchronous = OFF")
+        conn.execute("PRAGMA cache_size = -200000")
+        conn.executescript(_SCHEMA)
+        sources = {"work_orders": work_orders_csv, "components": components_csv}
+        read_counts = {
+            table: _load_table(conn, table, _csv_rows(path, table, delimiter, encoding), batch_size)
+            for table, path in sources.items()
+        }
+        conn.executescript(_INDEXES)
+        conn.execute("ANALYZE")
+        _validate(conn, read_counts, _current_counts(db_path) if min_ratio else None, min_ratio)
+        # Readers open the file with the normal rollback journal; make that the persistent mode.
+        conn.execute("PRAGMA journal_mode = DELETE")
+        conn.commit()
+    except BaseException:
+        conn.close()
+        os.remove(tmp_path)
+        raise
+    conn.close()
+
+    with open(tmp_path, 'rb+') as f:
+        os.fsync(f.fileno())
+    try:
+        _swap_into_place(tmp_path, db_path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    logger.info(f"ERP import: {read_counts['work_orders']} work orders, {read_counts['components']} components in {time.monotonic() - started:.1f}s.")
+    return read_counts
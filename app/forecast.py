@@ -0,0 +1,198 @@
+import json
+import sqlite3
+import logging
+from datetime import datetime, timedelta
+from flask import current_app
+from .db import get_db_connection
+from .generations import file_generation, get_generation
+from .helpers import get_project_statuses_from_db, get_completion_data_from_db, get_latest_worker_from_cas_db
+from .planning import get_layout_project_info
+from .time_archive import time_entries_source
+
+logger = logging.getLogger(__name__)
+
+try:
+    import numpy as np
+except ImportError: # Optional; without it there are no forecasts (expected_finish stays None)
+    np = None
+
+# Completion forecasts from throughput. A worker's rate is the number of distinct DNIs they
+# closed ('Zaključi') per day over the last FORECAST_WINDOW_DAYS of history. Each layout
+# project is queued behind its current worker's other projects (not paused first, then by
+# priority and name), and finishes when the worker has worked through the remaining DNIs
+# of everything queued up to and including it. Workers without recent completions use the
+# shop's average rate per worker.
+# The background job writes the results to project_forecasts / worker_forecasts; requests
+# only read those tables, so forecasting never runs on the request path.
+
+# The priorities set_project_priority allows, most urgent first. Projects without one
+# (or with an unknown value) queue behind all of them.
+_PRIORITY_RANK = {'Urgent': 0, 'High': 1, 'Normal': 2, 'Low': 3}
+_UNSET_PRIORITY_RANK = 4
+
+def _fetch_worker_rates(conn, window_days):
+    """Returns ({worker_name: DNIs per day}, average rate per worker) from recent 'Zaključi' events."""
+    cursor = conn.cursor()
+    cursor.row_factory = None
+    # The window ends at the latest completion, so a stale copy of cas_baza still gives rates.
+    source = time_entries_source(conn)
+    rows = cursor.execute(f"""
+        SELECT COALESCE(worker_name, ''), ref_doc_no, event_datetime
+        FROM {source}
+        WHERE event_type = 'Zaključi' AND ref_doc_no IS NOT NULL AND event_datetime >= (
+            SELECT datetime(MAX(event_datetime), ?) FROM {source} WHERE event_type = 'Zaključi'
+        )
+    """, (f"-{int(window_days)} days",)).fetchall()
+    if not rows:
+        return {}, 0.0
+    workers, dnis, times = zip(*rows)
+    worker_names, worker_code = np.unique(np.array(workers, dtype=str), return_inverse=True)
+    dni_names, dni_code = np.unique(np.array(dnis, dtype=str), return_inverse=True)
+    ts = np.array(times, dtype='datetime64[ms]').astype(np.int64) / 1000.0
+    span_days = min(float(window_days), max(1.0, (ts.max() - ts.min()) / 86400))
+    # A DNI closed twice by the same worker counts once.
+    pairs = np.unique(worker_code.astype(np.int64) * len(dni_names) + dni_code)
+    rates = np.bincount(pairs // len(dni_names), minlength=len(worker_names)) / span_days
+    named = worker_names != ''
+    average = float(rates[named].mean()) if named.any() else float(rates.mean())
+    return {str(name): float(rate) for name, rate in zip(worker_names[named], rates[named])}, average
+
+def compute_forecasts(now=None):
+    """
+    Forecasts every layout project. Returns (project rows, worker rows) ready for the
+    forecast tables, or None without numpy or cas_baza.db.
+    """
+    if np is None:
+        return None
+    now = now or datetime.now()
+    conn = get_db_connection(current_app.config['CAS_DATABASE_FILE_PATH'])
+    if conn is None:
+        return None
+    try:
+        rates, average_rate = _fetch_worker_rates(conn, current_app.config['FORECAST_WINDOW_DAYS'])
+    finally:
+        conn.close()
+
+    layout_info = get_layout_project_info()
+    project_ids = sorted(layout_info)
+    if not project_ids or average_rate <= 0:
+        return [], []
+    statuses = get_project_statuses_from_db(project_ids)
+    completion = get_completion_data_from_db(project_ids)
+    latest_workers = get_latest_worker_from_cas_db(project_ids)
+
+    remaining = np.array([
+        max(0, statuses.get(pid, {}).get('total', 0) - statuses.get(pid, {}).get('completed', 0)) for pid in project_ids
+    ], dtype=np.float64)
+    worker_of = [latest_workers.get(pid) or layout_info[pid].get('details') or None for pid in project_ids]
+    # Projects without a known worker each form their own queue at the average rate.
+    queue_keys = [worker if worker else f"\x00{pid}" for pid, worker in zip(project_ids, worker_of)]
+    queue_names, queue = np.unique(np.array(queue_keys, dtype=str), return_inverse=True)
+    queue_rates = np.array([rates.get(name, average_rate) for name in queue_names], dtype=np.float64)
+    paused = np.array([bool(completion.get(pid, {}).get('pause_status')) for pid in project_ids])
+    priority = np.array([_PRIORITY_RANK.get(completion.get(pid, {}).get('priority'), _UNSET_PRIORITY_RANK) for pid in project_ids])
+
+    # Queue order: per worker, unpaused before paused, then priority, then name (project_ids is sorted).
+    order = np.lexsort((np.arange(len(project_ids)), priority, paused, queue))
+    queue_sorted = queue[order]
+    remaining_sorted = remaining[order]
+    cumulative = np.cumsum(remaining_sorted)
+    first_in_queue = np.r_[True, queue_sorted[1:] != queue_sorted[:-1]]
+    queue_offset = np.maximum.accumulate(np.where(first_in_queue, cumulative - remaining_sorted, 0))
+    days = (cumulative - queue_offset) / queue_rates[queue_sorted]
+
+    computed_at = now.isoformat(timespec='seconds')
+    project_rows = []
+    for position, index in enumerate(order):
+        pid = project_ids[index]
+        finish = None
+        if remaining[index] > 0:
+            finish = (now + timedelta(days=float(days[position]))).date().isoformat()
+        project_rows.append((
+            pid, worker_of[index], int(remaining[index]), round(float(queue_rates[queue_sorted[position]]), 3), finish, computed_at
+        ))
+
+    last_in_queue = np.r_[queue_sorted[1:] != queue_sorted[:-1], True]
+    worker_rows = []
+    for position in np.flatnonzero(last_in_queue):
+        name = queue_names[queue_sorted[position]]
+        if name.startswith('\x00'):
+            continue
+        members = queue_sorted == queue_sorted[position]
+        total_remaining = int(remaining_sorted[members].sum())
+        finish = (now + timedelta(days=float(days[position]))).date().isoformat() if total_remaining else None
+        worker_rows.append((
+            str(name), int(members.sum()), total_remaining, round(float(queue_rates[queue_sorted[position]]), 3), finish, computed_at
+        ))
+    return project_rows, worker_rows
+
+def _forecast_signature():
+    """Changes whenever cas_baza, projekti_baza or the layout change."""
+    return json.dumps([
+        file_generation(current_app.config['CAS_DATABASE_FILE_PATH']),
+        file_generation(current_app.config['DATABASE_FILE_PATH']),
+        get_generation('layout')
+    ])
+
+def refresh_forecasts(force=False):
+    """
+    Recomputes and stores the forecasts if an input changed or they are older than
+    FORECAST_MAX_AGE_SECONDS (manual DNI completions and priorities change without that).
+    Returns the number of projects forecast, or None if nothing was done.
+    """
+    signature = _forecast_signature()
+    conn = None
+    try:
+        conn = get_db_connection(current_app.config['VELIKA_MONTAZA_DB_PATH'])
+        if conn is None: raise sqlite3.OperationalError("Could not connect to montaza DB.")
+        state = conn.execute("SELECT signature, computed_at FROM forecast_state WHERE id = 1").fetchone()
+        if state and not force and state['signature'] == signature:
+            age = (datetime.now() - datetime.fromisoformat(state['computed_at'])).total_seconds()
+            if age < current_app.config['FORECAST_MAX_AGE_SECONDS']:
+                return None
+        conn.close()
+        conn = None # Don't hold a connection while reading the other databases
+
+        result = compute_forecasts()
+        if result is None:
+            return None
+        project_rows, worker_rows = result
+        conn = get_db_connection(current_app.config['VELIKA_MONTAZA_DB_PATH'])
+        if conn is None: raise sqlite3.OperationalError("Could not connect to montaza DB.")
+        conn.execute("DELETE FROM project_forecasts")
+        conn.executemany("""
+            INSERT INTO project_forecasts (project_task_no, worker_name, remaining_dnis, dnis_per_day, expected_finish, computed_at)
+            VALUES (?, ?, ?, ?, ?, ?)""", project_rows)
+        conn.execute("DELETE FROM worker_forecasts")
+        conn.executemany("""
+            INSERT INTO worker_forecasts (worker_name, projects, remaining_dnis, dnis_per_day, expected_finish, computed_at)
+            VALUES (?, ?, ?, ?, ?, ?)""", worker_rows)
+        conn.execute("INSERT OR REPLACE INTO forecast_state (id, signature, computed_at) VALUES (1, ?, ?)",
+                     (signature, datetime.now().isoformat(timespec='seconds')))
+        conn.commit()
+        return len(project_rows)
+    finally:
+        if conn: conn.close()
+
+def run_forecast_job():
+    """Scheduler entry point."""
+    if np is None:
+        return
+    forecast_count = refresh_forecasts()
+    if forecast_count is not None:
+        logger.info(f"Completion forecasts refreshed for {forecast_count} projects.")
+
+def get_worker_forecasts():
+    """Stored per-worker forecasts (soonest finish first) and when they were computed."""
+    conn = None
+    try:
+        conn = get_db_connection(current_app.config['VELIKA_MONTAZA_DB_PATH'])
+        if conn is None: raise sqlite3.OperationalError("Could not connect to montaza DB.")
+        state = conn.execute("SELECT computed_at FROM forecast_state WHERE id = 1").fetchone()
+        rows = conn.execute("""
+            SELECT worker_name, projects, remaining_dnis, dnis_per_day, expected_finish
+            FROM worker_forecasts ORDER BY expected_finish IS NULL, expected_finish, worker_name
+        """).fetchall()
+        return [dict(row) for row in rows], state['computed_at'] if state else None
+    finally:
+        if conn: conn.close()
@@ -0,0 +1,52 @@
+import os
+import sqlite3
+import logging
+from flask import current_app
+from .db import get_db_connection
+
+logger = logging.getLogger(__name__)
+
+# Generation counters are shared through velika_montaza.db so that every worker
+# process sees the same value. A process keeps a cached copy of some data together
+# with the generation it was built from, and rebuilds it once the counter moves.
+
+def get_generation(name):
+    """Returns the shared generation counter for a named cache (0 if it was never bumped)."""
+    conn = None
+    try:
+        conn = get_db_connection(current_app.config['VELIKA_MONTAZA_DB_PATH'])
+        if conn is None: raise sqlite3.OperationalError("Could not connect to montaza DB.")
+        row = conn.execute("SELECT generation FROM cache_generations WHERE name = ?", (name,)).fetchone()
+        return row['generation'] if row else 0
+    except (sqlite3.OperationalError, FileNotFoundError) as e:
+        logger.warning(f"Could not read generation '{name}': {e}", extra={'database': current_app.config['VELIKA_MONTAZA_DB_FILE']})
+        return 0
+    finally:
+        if conn: conn.close()
+
+def bump_generation(name):
+    """Increments a named generation counter so every process drops its cached copy."""
+    conn = None
+    try:
+        conn = get_db_connection(current_app.config['VELIKA_MONTAZA_DB_PATH'])
+        if conn is None: raise sqlite3.OperationalError("Could not connect to montaza DB.")
+        conn.execute("""
+            INSERT INTO cache_generations (name, generation) VALUES (?, 1)
+            ON CONFLICT(name) DO UPDATE SET generation = generation + 1
+        """, (name,))
+        conn.commit()
+    except (sqlite3.OperationalError, FileNotFoundError) as e:
+        logger.warning(f"Could not bump generation '{name}': {e}", extra={'database': current_app.config['VELIKA_MONTAZA_DB_FILE']})
+    finally:
+        if conn: conn.close()
+
+def file_generation(path):
+    """Cheap change signature for files written or replaced outside the app (None if missing)."""
+    signature = []
+    for candidate in (path, path + '-wal'):
+        try:
+            st = os.stat(candidate)
+            signature.append((st.st_ino, st.st_mtime_ns, st.st_size))
+        except FileNotFoundError:
+            signature.append(None)
+    return None if signature[0] is None else tuple(signature)
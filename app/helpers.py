@@ -1,9 +1,15 @@
 import os
 import json
 import sqlite3
+import logging
 from datetime import datetime
 from flask import jsonify, current_app
 from .db import get_db_connection
+from .layout_store import load_layout, load_layout_viewport, layout_project_names
+from .work_centers import default_work_centers, sql_placeholders
+from .time_archive import time_entries_source
+
+logger = logging.getLogger(__name__)
 
 # --- HELPER FUNCTION FOR OWNERSHIP CHECK ---
 def check_layout_item_ownership(project_id, layout_data, current_user):
@@ -21,7 +27,7 @@ def check_layout_item_ownership(project_id, layout_data, current_user):
     item_owner = item_found.get('owner')
     if item_owner is None or item_owner == current_user:
         return item_found, None # Permission granted
-    print(f"DENIED: User '{current_user}' tried to modify item '{project_id}' owned by '{item_owner}'.")
+    logger.warning(f"DENIED: User '{current_user}' tried to modify item '{project_id}' owned by '{item_owner}'.")
     return None, (jsonify({"status": "error", "message": f"Permission denied. This item is owned by '{item_owner}'."}), 403)
 
 # --- MODIFIED HELPER FUNCTION FOR CAS DB - NOW LINKS THROUGH DNI ---
@@ -35,7 +41,7 @@ def get_latest_worker_from_cas_db(project_ids):
         # Step 1: Get DNIs from projekti_baza.db
         main_conn = get_db_connection(current_app.config['DATABASE_FILE_PATH'])
         if main_conn is None:
-            print(f"Warning: Could not connect to main DB to get DNIs for worker lookup.")
+            logger.warning("Could not connect to main DB to get DNIs for worker lookup.")
             return {}
         placeholders_proj = ','.join('?' * len(project_ids))
         dni_query = f"SELECT project_task_no, work_order_no FROM work_orders WHERE project_task_no IN ({placeholders_proj})"
@@ -53,13 +59,13 @@ def get_latest_worker_from_cas_db(project_ids):
             return {}
         cas_conn = get_db_connection(current_app.config['CAS_DATABASE_FILE_PATH'])
         if cas_conn is None:
-            print(f"Warning: Could not connect to CAS DB to get worker names.")
+            logger.warning("Could not connect to CAS DB to get worker names.")
             return {}
         cursor_cas = cas_conn.cursor()
         placeholders_dni = ','.join('?' * len(all_dni_numbers))
         query_cas = f"""
             SELECT ref_doc_no, worker_name, MAX(event_datetime) as max_ts
-            FROM time_entries
+            FROM {time_entries_source(cas_conn)}
             WHERE ref_doc_no IN ({placeholders_dni})
             GROUP BY ref_doc_no
         """
@@ -79,97 +85,104 @@ def get_latest_worker_from_cas_db(project_ids):
             if latest_worker_for_project:
                 latest_workers[proj_id] = latest_worker_for_project
     except sqlite3.OperationalError as e:
-        print(f"ERROR querying databases for worker lookup: {e}.")
+        logger.error(f"Error querying databases for worker lookup: {e}.")
     except Exception as e:
-        print(f"Unexpected error fetching latest workers: {e}")
+        logger.error(f"Unexpected error fetching latest workers: {e}")
     finally:
         if main_conn: main_conn.close()
         if cas_conn: cas_conn.close()
     return latest_workers
 
-def get_project_statuses_from_db(project_ids):
+def get_center_statuses_from_db(project_ids, work_centers=None):
+    """
+    DNI progress per project and work center: {project_id: {center: {"total", "completed", "percentage"}}}.
+    One GROUP BY project_task_no, work_center pass covers every center (default: all of WORK_CENTERS);
+    centers without DNIs for a project are left out.
+    """
     if not project_ids: return {}
+    work_centers = tuple(work_centers or current_app.config['WORK_CENTERS'])
     placeholders_proj = ','.join('?' * len(project_ids))
-    statuses = {}
+    groups = {} # (project, center) -> (total, set of DNIs)
+    overall_completed_set = set()
     main_conn = None
     montaza_conn = None
     cas_conn = None
     try:
-        # Step 1: Get TOTAL DNI count (from projekti_baza)
+        # Step 1: DNI counts and numbers per project and center (from projekti_baza)
         main_conn = get_db_connection(current_app.config['DATABASE_FILE_PATH'])
         if main_conn is None: raise sqlite3.OperationalError("Could not connect to main DB")
-        totals_query = f"""
-            SELECT project_task_no, COUNT(work_order_no) as total
+        groups_query = f"""
+            SELECT project_task_no, work_center, COUNT(work_order_no) AS total,
+                   json_group_array(DISTINCT work_order_no) AS dnis
             FROM work_orders
-            WHERE project_task_no IN ({placeholders_proj}) AND work_center = ?
-            GROUP BY project_task_no
+            WHERE project_task_no IN ({placeholders_proj}) AND work_center IN ({sql_placeholders(work_centers)})
+            GROUP BY project_task_no, work_center
         """
-        totals = {r['project_task_no']: r['total'] for r in main_conn.execute(totals_query, project_ids + [current_app.config['UPRAVLJALNI_CENTER_SKLOP']])}
-        # Step 2: Get ALL DNI numbers (from projekti_baza)
-        all_dnis_query = f"""
-            SELECT project_task_no, work_order_no 
-            FROM work_orders
-            WHERE project_task_no IN ({placeholders_proj}) AND work_center = ?
-        """
-        project_dni_map = {}
-        all_dni_numbers_list = []
-        for row in main_conn.execute(all_dnis_query, project_ids + [current_app.config['UPRAVLJALNI_CENTER_SKLOP']]):
-            pid = row['project_task_no']
-            dni = row['work_order_no']
-            if pid not in project_dni_map:
-                project_dni_map[pid] = set()
-            project_dni_map[pid].add(dni)
-            all_dni_numbers_list.append(dni)
-        if not all_dni_numbers_list:
-            for pid in project_ids:
-                statuses[pid] = {"total": totals.get(pid, 0), "completed": 0, "percentage": 0}
-            return statuses
-        # Step 3: Get MANUALLY completed DNIs (from velika_montaza)
-        montaza_conn = get_db_connection(current_app.config['VELIKA_MONTAZA_DB_PATH'])
-        manual_completed_set = set()
-        if montaza_conn:
-            try:
-                completeds_query_montaza = f"""
-                    SELECT work_order_no 
-                    FROM dni_status
-                    WHERE project_task_no IN ({placeholders_proj}) AND is_completed = 1
-                """
-                manual_completed_set = {r['work_order_no'] for r in montaza_conn.execute(completeds_query_montaza, project_ids)}
-            except Exception as e_montaza:
-                print(f"ERROR accessing montaza DB for manual completed: {e_montaza}")
-        # Step 4: Get AUTOMATICALLY completed DNIs (from cas_baza)
-        cas_conn = get_db_connection(current_app.config['CAS_DATABASE_FILE_PATH'])
-        auto_completed_set = set()
-        if cas_conn:
-            try:
-                placeholders_dni_cas = ','.join('?' * len(all_dni_numbers_list))
-                query_cas = f"""
-                    SELECT DISTINCT ref_doc_no 
-                    FROM time_entries 
-                    WHERE ref_doc_no IN ({placeholders_dni_cas}) 
-                    AND event_type = 'Zaključi'
-                """
-                auto_completed_set = {row['ref_doc_no'] for row in cas_conn.execute(query_cas, all_dni_numbers_list)}
-            except sqlite3.OperationalError as e_cas:
-                print(f"Warning: Could not query cas_baza for auto-completion status: {e_cas}")
-        # Step 5: Combine and Calculate
-        overall_completed_set = manual_completed_set.union(auto_completed_set)
-        for pid in project_ids:
-            total_tasks = totals.get(pid, 0)
-            project_dnis = project_dni_map.get(pid, set())
-            completed_dnis_for_project = project_dnis.intersection(overall_completed_set)
-            completed_tasks = len(completed_dnis_for_project)
-            percentage = round((completed_tasks * 100) / total_tasks) if total_tasks > 0 else 0
-            statuses[pid] = {"total": total_tasks, "completed": completed_tasks, "percentage": percentage}
+        for row in main_conn.execute(groups_query, list(project_ids) + list(work_centers)):
+            dnis = {dni for dni in json.loads(row['dnis']) if dni is not None}
+            groups[(row['project_task_no'], row['work_center'])] = (row['total'], dnis)
+        all_dni_numbers_list = sorted(set().union(*(dnis for _, dnis in groups.values())))
+        if all_dni_numbers_list:
+            # Step 2: Get MANUALLY completed DNIs (from velika_montaza)
+            montaza_conn = get_db_connection(current_app.config['VELIKA_MONTAZA_DB_PATH'])
+            manual_completed_set = set()
+            if montaza_conn:
+                try:
+                    completeds_query_montaza = f"""
+                        SELECT work_order_no 
+                        FROM dni_status
+                        WHERE project_task_no IN ({placeholders_proj}) AND is_completed = 1
+                    """
+                    manual_completed_set = {r['work_order_no'] for r in montaza_conn.execute(completeds_query_montaza, list(project_ids))}
+                except Exception as e_montaza:
+                    logger.error(f"Error accessing montaza DB for manual completed: {e_montaza}")
+            # Step 3: Get AUTOMATICALLY completed DNIs (from cas_baza)
+            cas_conn = get_db_connection(current_app.config['CAS_DATABASE_FILE_PATH'])
+            auto_completed_set = set()
+            if cas_conn:
+                try:
+                    placeholders_dni_cas = ','.join('?' * len(all_dni_numbers_list))
+                    query_cas = f"""
+                        SELECT DISTINCT ref_doc_no 
+                        FROM {time_entries_source(cas_conn)} 
+                        WHERE ref_doc_no IN ({placeholders_dni_cas}) 
+                        AND event_type = 'Zaključi'
+                    """
+                    auto_completed_set = {row['ref_doc_no'] for row in cas_conn.execute(query_cas, all_dni_numbers_list)}
+                except sqlite3.OperationalError as e_cas:
+                    logger.warning(f"Could not query cas_baza for auto-completion status: {e_cas}")
+            overall_completed_set = manual_completed_set.union(auto_completed_set)
     except Exception as e:
-        print(f"General error calculating project statuses: {e}")
-        statuses = {pid: {"total": totals.get(pid, 0), "completed": 0, "percentage": 0} for pid in project_ids}
+        logger.error(f"General error calculating project statuses: {e}")
+        overall_completed_set = set()
     finally:
         if main_conn: main_conn.close()
         if montaza_conn: montaza_conn.close()
         if cas_conn: cas_conn.close()
+    # Step 4: Combine and Calculate
+    statuses = {pid: {} for pid in project_ids}
+    for (pid, center), (total_tasks, project_dnis) in groups.items():
+        completed_tasks = len(project_dnis & overall_completed_set)
+        statuses[pid][center] = _progress(total_tasks, completed_tasks)
+    return statuses
+
+def _progress(total_tasks, completed_tasks):
+    percentage = round((completed_tasks * 100) / total_tasks) if total_tasks > 0 else 0
+    return {"total": total_tasks, "completed": completed_tasks, "percentage": percentage}
+
+def combine_center_statuses(center_statuses, work_centers):
+    """Sums per-center progress over work_centers: {project_id: {"total", "completed", "percentage"}}."""
+    statuses = {}
+    for pid, centers in center_statuses.items():
+        selected = [centers[center] for center in work_centers if center in centers]
+        statuses[pid] = _progress(sum(s['total'] for s in selected), sum(s['completed'] for s in selected))
     return statuses
 
+def get_project_statuses_from_db(project_ids, work_centers=None):
+    """DNI progress per project over work_centers (default: DEFAULT_WORK_CENTERS)."""
+    work_centers = tuple(work_centers or default_work_centers())
+    return combine_center_statuses(get_center_statuses_from_db(project_ids, work_centers), work_centers)
+
 def get_completion_data_from_db(project_ids):
     if not project_ids: return {}
     placeholders = ','.join('?' * len(project_ids))
@@ -190,11 +203,28 @@ def get_completion_data_from_db(project_ids):
             if pid not in results: results[pid] = {}
         return results
     except Exception as e:
-        print(f"Error fetching completion data: {e}")
+        logger.error(f"Error fetching completion data: {e}")
         return {pid: {} for pid in project_ids}
     finally:
         if conn: conn.close()
 
+def get_expected_finish_from_db(project_ids):
+    """Returns {project_id: expected finish date (ISO) or None} from the stored forecasts."""
+    if not project_ids: return {}
+    placeholders = ','.join('?' * len(project_ids))
+    conn = None
+    try:
+        conn = get_db_connection(current_app.config['VELIKA_MONTAZA_DB_PATH'])
+        if conn is None: raise sqlite3.OperationalError("Could not connect to montaza DB.")
+        return {row['project_task_no']: row['expected_finish'] for row in conn.execute(
+            f"SELECT project_task_no, expected_finish FROM project_forecasts WHERE project_task_no IN ({placeholders})", list(project_ids)
+        )}
+    except Exception as e:
+        logger.error(f"Error fetching completion forecasts: {e}")
+        return {}
+    finally:
+        if conn: conn.close()
+
 def get_photo_info_from_db(project_ids):
     if not project_ids: return {}
     placeholders = ','.join('?' * len(project_ids))
@@ -208,7 +238,7 @@ def get_photo_info_from_db(project_ids):
             if pid not in results: results[pid] = {"photo_count": 0, "last_photo_upload": None}
         return results
     except Exception as e:
-        print(f"Error fetching photo info: {e}")
+        logger.error(f"Error fetching photo info: {e}")
         return {pid: {"photo_count": 0, "last_photo_upload": None} for pid in project_ids}
     finally:
         if conn: conn.close()
@@ -226,7 +256,7 @@ def check_notes_existence_from_db(project_ids):
             if pid not in results: results[pid] = False
         return results
     except Exception as e:
-        print(f"Error checking notes existence: {e}")
+        logger.error(f"Error checking notes existence: {e}")
         return {pid: False for pid in project_ids}
     finally:
         if conn: conn.close()
@@ -259,49 +289,127 @@ def update_project_status(project_id, column, status):
         conn.execute("INSERT OR IGNORE INTO project_notes (project_task_no) VALUES (?)", (project_id,))
         conn.execute(f"UPDATE project_notes SET {column} = ? WHERE project_task_no = ?", (status, project_id))
         conn.commit()
-        print(f"Updated {column} to {status} for project {project_id}")
+        logger.info(f"Updated {column} to {status} for project {project_id}")
         return jsonify({"status": "success"})
     except Exception as e:
-        print(f"Error updating project status ({column}) for {project_id}: {e}")
+        logger.error(f"Error updating project status ({column}) for {project_id}: {e}")
         return jsonify({"status": "error", "message": str(e)}), 500
     finally:
         if conn: conn.close()
 
-def get_project_inventory_status(project_task_no):
+def get_center_readiness_from_db(project_ids, work_centers=None):
+    """
+    Returns {project_id: {center: can_be_made}} with one aggregate over components, grouped by
+    project_task_no and work_center (default: all of WORK_CENTERS). A center can be made when
+    none of its components is out of stock; centers without components are left out.
+    Returns {} if the lookup failed.
+    """
+    if not project_ids: return {}
+    work_centers = tuple(work_centers or current_app.config['WORK_CENTERS'])
+    placeholders = ','.join('?' * len(project_ids))
+    readiness = {pid: {} for pid in project_ids}
+    conn = None
+    try:
+        conn = get_db_connection(current_app.config['DATABASE_FILE_PATH'])
+        if conn is None: raise sqlite3.OperationalError("Could not connect to main DB.")
+        # CAST does the numeric coercion: '' and non-numeric text become 0, NULL stays NULL (-> 0).
+        query = f"""
+            SELECT project_task_no, work_center,
+                   SUM(COALESCE(CAST(inventory AS REAL), 0) <= 0) AS out_of_stock
+            FROM components
+            WHERE project_task_no IN ({placeholders}) AND work_center IN ({sql_placeholders(work_centers)})
+            GROUP BY project_task_no, work_center
+        """
+        for row in conn.execute(query, list(project_ids) + list(work_centers)):
+            readiness[row['project_task_no']][row['work_center']] = row['out_of_stock'] == 0
+    except Exception as e:
+        logger.error(f"Error fetching inventory readiness: {e}")
+        return {}
+    finally:
+        if conn: conn.close()
+    return readiness
+
+def combine_center_readiness(center_readiness, work_centers):
+    """A project can be made when every selected center can (projects without components count as ready, as before)."""
+    return {pid: all(centers.get(center, True) for center in work_centers) for pid, centers in center_readiness.items()}
+
+def get_inventory_readiness_from_db(project_ids, work_centers=None):
+    """Returns {project_id: can_be_made} over work_centers (default: DEFAULT_WORK_CENTERS), {} on error."""
+    work_centers = tuple(work_centers or default_work_centers())
+    return combine_center_readiness(get_center_readiness_from_db(project_ids, work_centers), work_centers)
+
+def get_project_inventory_status(project_task_no, work_centers=None):
+    work_centers = tuple(work_centers or default_work_centers())
     work_order_statuses = {}
-    can_be_made_overall = True
     conn = None
     try:
+        # 1. Overall readiness from this project's assembly-center components (same aggregate as the bulk variant)
+        readiness = get_inventory_readiness_from_db([project_task_no], work_centers)
+        if not readiness:
+            return {}
+        can_be_made_overall = readiness[project_task_no]
         conn = get_db_connection(current_app.config['DATABASE_FILE_PATH'])
         if conn is None: raise sqlite3.OperationalError("Could not connect to main DB.")
-        sklop = current_app.config['UPRAVLJALNI_CENTER_SKLOP']
-        # 1. Get all components for this project's '303' work center
-        components_query = "SELECT item_no, inventory FROM components WHERE project_task_no = ? AND work_center = ?"
-        components = conn.execute(components_query, (project_task_no, sklop)).fetchall()
-        if components:
-            for comp in components:
-                try:
-                    inventory_val = float(comp['inventory']) if comp['inventory'] else 0.0
-                except (ValueError, TypeError):
-                    inventory_val = 0.0
-                if inventory_val <= 0:
-                    can_be_made_overall = False
-                    break
-        # 2. Get all work orders for this project's '303' work center
-        work_orders_query = "SELECT work_order_no, description FROM work_orders WHERE project_task_no = ? AND work_center = ?"
-        work_orders = conn.execute(work_orders_query, (project_task_no, sklop)).fetchall()
-        # 3. Apply the overall status to ALL '303' work orders
+        # 2. Get all work orders for this project's assembly work centers
+        work_orders_query = f"SELECT work_order_no, description FROM work_orders WHERE project_task_no = ? AND work_center IN ({sql_placeholders(work_centers)})"
+        work_orders = conn.execute(work_orders_query, (project_task_no,) + work_centers).fetchall()
+        # 3. Apply the overall status to ALL of those work orders
         for wo in work_orders:
             work_order_statuses[wo['work_order_no']] = {
                 "can_be_made": can_be_made_overall,
                 "description": wo['description']
             }
     except sqlite3.OperationalError as e:
-        print(f"Database error getting inventory status for {project_task_no}: {e}")
+        logger.error(f"Database error getting inventory status for {project_task_no}: {e}")
         return {}
     except Exception as e:
-        print(f"Unexpected error getting inventory status for {project_task_no}: {e}")
+        logger.error(f"Unexpected error getting inventory status for {project_task_no}: {e}")
         return {}
     finally:
         if conn: conn.close()
-    return work_order_statuses
\ No newline at end of file
+    return work_order_statuses
+
+def build_layout_payload(bbox=None, work_centers=None):
+    """
+    Reads the layout JSON and enriches project items with statuses, completion data and workers.
+    With a bbox (min_x, min_y, max_x, max_y) only the items intersecting it are returned and enriched.
+    'status' and 'can_be_made' cover work_centers (default: DEFAULT_WORK_CENTERS); 'work_centers'
+    holds the progress and readiness of every configured center the project has DNIs in.
+    """
+    work_centers = tuple(work_centers or default_work_centers())
+    # Read the layout data (cached per process, shared generation counter).
+    if bbox is None:
+        data = load_layout()
+    else:
+        data = load_layout_viewport(*bbox)
+    # Add the current server time to the data.
+    data['server_timestamp'] = datetime.now().strftime('%H:%M:%S')
+
+    # Get a list of project IDs that are present in the layout file.
+    project_ids_in_layout = layout_project_names(data)
+
+    # If there are projects in the layout, fetch their statuses and details.
+    if project_ids_in_layout:
+        # One grouped pass per source for all configured centers; the selection is combined from it.
+        center_statuses = get_center_statuses_from_db(project_ids_in_layout)
+        center_readiness = get_center_readiness_from_db(project_ids_in_layout)
+        statuses = combine_center_statuses(center_statuses, work_centers)
+        readiness = combine_center_readiness(center_readiness, work_centers)
+        completion_data = get_completion_data_from_db(project_ids_in_layout)
+        latest_workers = get_latest_worker_from_cas_db(project_ids_in_layout)
+
+        for item in data.get('items', []):
+            if item.get('type') == 'project':
+                name = item.get('name')
+                # Add its DNI status, task completion data and latest worker if found.
+                if name in statuses: item['status'] = statuses[name]
+                if name in completion_data: item.update(completion_data[name])
+                if name in latest_workers:
+                    item['details'] = latest_workers[name]
+                if name in readiness: item['can_be_made'] = readiness[name]
+                if name in center_statuses:
+                    item['work_centers'] = {
+                        center: dict(progress, can_be_made=center_readiness.get(name, {}).get(center, True))
+                        for center, progress in center_statuses[name].items()
+                    }
+    return data
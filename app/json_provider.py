@@ -0,0 +1,43 @@
+import json
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError: # Optional speed-up; the stdlib encoder is used without it
+    orjson = None
+
+class FastJSONProvider(DefaultJSONProvider):
+    """
+    Flask JSON provider that encodes with orjson when it is installed and falls back to
+    the stdlib provider otherwise (or for options orjson doesn't support, e.g. indent).
+    Output matches the default provider: sorted keys, and datetimes/dates/decimals
+    still go through DefaultJSONProvider.default.
+    """
+
+    def dumps(self, obj, **kwargs):
+        # response() asks for compact separators, which is what orjson produces anyway
+        if kwargs.get('separators') == (',', ':'):
+            kwargs.pop('separators')
+        if orjson is None or kwargs:
+            return super().dumps(obj, **kwargs)
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        try:
+            return orjson.dumps(obj, default=self.default, option=option).decode('utf-8')
+        except TypeError:
+            # e.g. integers beyond 64 bits; let the stdlib encoder handle (or report) it
+            return super().dumps(obj)
+
+    def loads(self, s, **kwargs):
+        if orjson is None or kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+def encode_json_file(obj, pretty=False):
+    """Encodes obj for writing to a JSON file (bytes). Compact by default, indent=4 when pretty."""
+    if pretty:
+        return json.dumps(obj, indent=4).encode('utf-8')
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(',', ':')).encode('utf-8')
@@ -0,0 +1,198 @@
+import time
+import sqlite3
+import threading
+import logging
+from flask import current_app
+from .db import get_db_connection
+from .generations import file_generation
+from .time_archive import get_archived_labour
+
+logger = logging.getLogger(__name__)
+
+try:
+    import numpy as np
+except ImportError: # Optional; the labour endpoints answer 501 without it
+    np = None
+
+# Labour hours from cas_baza time_entries. Events are sorted per worker by time; every
+# 'Start' opens an interval that ends at that worker's next event (a 'Start' on another
+# DNI or a 'Zaključi'). Intervals longer than LABOUR_MAX_INTERVAL_HOURS are treated as
+# forgotten clock-outs and dropped. Archived entries (see time_archive.py) contribute the
+# seconds summarised when they were moved. All pairing and summing is done on NumPy arrays
+# and cached per process. Once built, requests always get the cached data; when cas_baza.db
+# has changed a background thread rebuilds it (at most every LABOUR_CACHE_MIN_AGE_SECONDS)
+# and swaps it in. Only the very first build runs on a request.
+
+_FETCH_CHUNK = 200000
+_labour_lock = threading.Lock() # Guards _labour_cache
+_first_build_lock = threading.Lock()
+_labour_cache = {"key": None, "data": None, "built_at": 0, "rebuilding": False}
+
+class LabourData:
+    """Aggregated labour seconds per DNI, per worker and per (DNI, worker) pair."""
+
+    def __init__(self, dni_names, worker_nos, worker_names, pair_dni, pair_worker, pair_seconds):
+        self.dni_names = dni_names # code -> ref_doc_no
+        self.dni_codes = {name: code for code, name in enumerate(dni_names)}
+        self.worker_nos = worker_nos # code -> worker_no
+        self.worker_names = worker_names # code -> latest worker_name
+        self.pair_dni = pair_dni # arrays over distinct (dni, worker) pairs
+        self.pair_worker = pair_worker
+        self.pair_seconds = pair_seconds
+        self.dni_seconds = np.bincount(pair_dni, weights=pair_seconds, minlength=len(dni_names))
+        self.worker_seconds = np.bincount(pair_worker, weights=pair_seconds, minlength=len(worker_nos))
+
+    def for_dnis(self, dni_numbers):
+        """Hours per DNI and per worker restricted to the given DNIs."""
+        codes = np.array([self.dni_codes[d] for d in dni_numbers if d in self.dni_codes], dtype=np.int64)
+        mask = np.isin(self.pair_dni, codes)
+        per_worker = np.bincount(self.pair_worker[mask], weights=self.pair_seconds[mask], minlength=len(self.worker_nos))
+        per_dni = {self.dni_names[c]: round(float(self.dni_seconds[c]) / 3600, 2) for c in codes}
+        workers = [
+            {"worker_no": self.worker_nos[w], "worker_name": self.worker_names[w], "hours": round(float(per_worker[w]) / 3600, 2)}
+            for w in np.flatnonzero(per_worker)
+        ]
+        workers.sort(key=lambda entry: entry['hours'], reverse=True)
+        return per_dni, workers
+
+    def workers_total(self):
+        """Total hours per worker over all DNIs."""
+        totals = [
+            {"worker_no": self.worker_nos[w], "worker_name": self.worker_names[w], "hours": round(float(self.worker_seconds[w]) / 3600, 2)}
+            for w in np.flatnonzero(self.worker_seconds)
+        ]
+        totals.sort(key=lambda entry: entry['hours'], reverse=True)
+        return totals
+
+def _fetch_events(conn):
+    """Reads all events as NumPy arrays (fetched in chunks), sorted by worker and time."""
+    cursor = conn.cursor()
+    cursor.row_factory = None # Plain tuples; much faster than sqlite3.Row for bulk reads
+    # No ORDER BY / julianday() here: sorting and timestamp parsing are cheaper in NumPy.
+    cursor.execute("""
+        SELECT COALESCE(worker_no, ''), COALESCE(ref_doc_no, ''), event_type = 'Start', event_datetime
+        FROM time_entries
+        WHERE event_datetime IS NOT NULL
+    """)
+    workers, dnis, starts, times = [], [], [], []
+    while True:
+        rows = cursor.fetchmany(_FETCH_CHUNK)
+        if not rows:
+            break
+        w, d, s, t = zip(*rows)
+        workers.append(np.array(w, dtype=str))
+        dnis.append(np.array(d, dtype=str))
+        starts.append(np.array(s, dtype=bool))
+        times.append(np.array(t, dtype='datetime64[ms]'))
+    if not workers:
+        return None
+    worker_raw = np.concatenate(workers)
+    ts = np.concatenate(times).astype(np.int64) / 1000.0
+    order = np.lexsort((ts, worker_raw))
+    return worker_raw[order], np.concatenate(dnis)[order], np.concatenate(starts)[order], ts[order]
+
+def _build_labour_data(conn):
+    events = _fetch_events(conn)
+    archived = get_archived_labour(conn)
+    worker_name_rows = conn.execute("""
+        SELECT worker_no, worker_name FROM time_entries
+        WHERE id IN (SELECT MAX(id) FROM time_entries GROUP BY worker_no)
+    """).fetchall()
+    latest_names = {row['worker_no'] or '': row['worker_name'] for row in worker_name_rows}
+    for worker_no, _, worker_name, _ in archived:
+        latest_names.setdefault(worker_no, worker_name)
+    if events is None and not archived:
+        empty = np.array([], dtype=np.int64)
+        return LabourData([], [], [], empty, empty, np.array([], dtype=np.float64))
+    if events is None:
+        events = (np.array([], dtype=str), np.array([], dtype=str), np.array([], dtype=bool), np.array([], dtype=np.float64))
+    worker_raw, dni_raw, is_start, ts = events
+    archived_worker, archived_dni, _, archived_seconds = zip(*archived) if archived else ((), (), (), ())
+    # Codes over the hot events and the archive summaries together.
+    worker_nos, worker_code = np.unique(np.concatenate([worker_raw, np.array(archived_worker, dtype=str)]), return_inverse=True)
+    dni_names, dni_code = np.unique(np.concatenate([dni_raw, np.array(archived_dni, dtype=str)]), return_inverse=True)
+    archived_worker_code, worker_code = worker_code[len(worker_raw):], worker_code[:len(worker_raw)]
+    archived_dni_code, dni_code = dni_code[len(dni_raw):], dni_code[:len(dni_raw)]
+
+    # Interval i runs from event i to event i+1 when both belong to the same worker.
+    duration = np.diff(ts)
+    same_worker = worker_code[1:] == worker_code[:-1]
+    max_seconds = current_app.config['LABOUR_MAX_INTERVAL_HOURS'] * 3600
+    valid = is_start[:-1] & same_worker & (duration > 0) & (duration <= max_seconds) & (dni_raw[:-1] != '')
+
+    interval_dni = np.concatenate([dni_code[:-1][valid], archived_dni_code])
+    interval_worker = np.concatenate([worker_code[:-1][valid], archived_worker_code])
+    interval_seconds = np.concatenate([duration[valid], np.array(archived_seconds, dtype=np.float64)])
+
+    # Sum per distinct (dni, worker) pair.
+    pair_key = interval_dni.astype(np.int64) * len(worker_nos) + interval_worker
+    unique_keys, pair_index = np.unique(pair_key, return_inverse=True)
+    pair_seconds = np.bincount(pair_index, weights=interval_seconds, minlength=len(unique_keys))
+    return LabourData(
+        list(dni_names), list(worker_nos), [latest_names.get(w) for w in worker_nos],
+        unique_keys // len(worker_nos), unique_keys % len(worker_nos), pair_seconds
+    )
+
+def _build_and_store(db_path):
+    """Builds LabourData from cas_baza.db and makes it the cached copy. Returns it (None if the DB is missing)."""
+    key = file_generation(db_path)
+    conn = get_db_connection(db_path)
+    if conn is None:
+        return None
+    try:
+        data = _build_labour_data(conn)
+    finally:
+        conn.close()
+    with _labour_lock:
+        _labour_cache.update(key=key, data=data, built_at=time.monotonic())
+    logger.info(f"Labour data rebuilt: {len(data.dni_names)} DNIs, {len(data.worker_nos)} workers.")
+    return data
+
+def _rebuild_in_background(app, db_path):
+    try:
+        with app.app_context():
+            _build_and_store(db_path)
+    except Exception as e:
+        logger.exception(f"Could not rebuild labour data, keeping the previous copy: {e}")
+    finally:
+        with _labour_lock:
+            _labour_cache['rebuilding'] = False
+
+def get_labour_data():
+    """
+    Returns the cached LabourData without waiting for a rebuild (None if unavailable).
+    Starts a background rebuild when cas_baza.db has changed.
+    """
+    if np is None:
+        return None
+    db_path = current_app.config['CAS_DATABASE_FILE_PATH']
+    key = file_generation(db_path)
+    with _labour_lock:
+        data = _labour_cache['data']
+        if data is not None:
+            # cas_baza gets new clock events all day; rebuild at most every LABOUR_CACHE_MIN_AGE_SECONDS.
+            old_enough = time.monotonic() - _labour_cache['built_at'] >= current_app.config['LABOUR_CACHE_MIN_AGE_SECONDS']
+            if _labour_cache['key'] != key and old_enough and not _labour_cache['rebuilding']:
+                _labour_cache['rebuilding'] = True
+                threading.Thread(target=_rebuild_in_background, args=(current_app._get_current_object(), db_path),
+                                 name='labour-rebuild', daemon=True).start()
+            return data
+    # Nothing built yet in this process: build it here, once.
+    with _first_build_lock:
+        with _labour_lock:
+            if _labour_cache['data'] is not None:
+                return _labour_cache['data']
+        return _build_and_store(db_path)
+
+def get_project_dnis(project_id):
+    """Returns [(work_order_no, description, work_center)] for a project from projekti_baza."""
+    conn = None
+    try:
+        conn = get_db_connection(current_app.config['DATABASE_FILE_PATH'])
+        if conn is None: raise sqlite3.OperationalError("Could not connect to main DB.")
+        return [tuple(row) for row in conn.execute(
+            "SELECT work_order_no, description, work_center FROM work_orders WHERE project_task_no = ? ORDER BY work_order_no",
+            (project_id,)
+        )]
+    finally:
+        if conn: conn.close()
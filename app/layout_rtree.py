@@ -0,0 +1,162 @@
+import sqlite3
+import logging
+from flask import current_app, jsonify
+from .db import get_db_connection
+from .generations import get_generation, file_generation
+from .layout_store import save_layout
+from .spatial_index import item_rect
+
+logger = logging.getLogger(__name__)
+
+# The layout_rtree virtual table in velika_montaza.db mirrors the rectangles of the
+# project cards in layout_data.json. layout_rtree_state remembers which version of the
+# layout it mirrors; if that doesn't match the current layout it is rebuilt from scratch.
+# All functions here except find_free_slot() are meant to be called inside
+# layout_store.layout_lock(); find_free_slot() only reads and never rebuilds the mirror.
+
+def _layout_signature():
+    layout_path = current_app.config['LAYOUT_DATA_FILE_PATH']
+    return f"{get_generation('layout')}:{file_generation(layout_path)}"
+
+def _project_rects(layout_data):
+    """Yields (name, rect) for every positioned project card in the layout."""
+    for item in layout_data.get('items', []):
+        if item.get('type') == 'project' and item.get('name'):
+            rect = item_rect(item)
+            if rect is not None:
+                yield item['name'], rect
+
+def _sync_rtree(conn, layout_data):
+    """Rebuilds the R*Tree from layout_data unless it already mirrors the current layout."""
+    signature = _layout_signature()
+    row = conn.execute("SELECT signature FROM layout_rtree_state WHERE id = 1").fetchone()
+    if row and row['signature'] == signature:
+        return
+    conn.execute("DELETE FROM layout_rtree")
+    conn.executemany(
+        "INSERT INTO layout_rtree (min_x, max_x, min_y, max_y, project_task_no) VALUES (?, ?, ?, ?, ?)",
+        [(r[0], r[2], r[1], r[3], name) for name, r in _project_rects(layout_data)]
+    )
+    conn.execute("INSERT OR REPLACE INTO layout_rtree_state (id, signature) VALUES (1, ?)", (signature,))
+    conn.commit()
+
+def _overlapping(conn, rect, exact_rects, exclude_name=None):
+    """Names of cards overlapping rect (touching edges don't count). Without conn every card is checked."""
+    if conn is None:
+        candidates = list(exact_rects)
+    else:
+        # The R*Tree stores 32-bit floats rounded outwards, so candidates are re-checked exactly.
+        candidates = [row['project_task_no'] for row in conn.execute(
+            "SELECT project_task_no FROM layout_rtree WHERE max_x > ? AND min_x < ? AND max_y > ? AND min_y < ?",
+            (rect[0], rect[2], rect[1], rect[3])
+        )]
+    names = []
+    for name in candidates:
+        other = exact_rects.get(name)
+        if name == exclude_name or other is None:
+            continue
+        if other[2] > rect[0] and other[0] < rect[2] and other[3] > rect[1] and other[1] < rect[3]:
+            names.append(name)
+    return names
+
+def _nearest_free_slot(conn, x, y, width, height, exact_rects, exclude_name=None):
+    """Nearest free position on a grid of card-sized steps around (x, y), or None."""
+    gap = current_app.config['LAYOUT_SNAP_GAP']
+    max_rings = current_app.config['LAYOUT_SNAP_MAX_RINGS']
+    step_x, step_y = width + gap, height + gap
+    candidates = [(i, j) for i in range(-max_rings, max_rings + 1) for j in range(-max_rings, max_rings + 1)]
+    candidates.sort(key=lambda c: (c[0] * step_x) ** 2 + (c[1] * step_y) ** 2)
+    for i, j in candidates:
+        cx, cy = x + i * step_x, y + j * step_y
+        if not _overlapping(conn, (cx, cy, cx + width, cy + height), exact_rects, exclude_name):
+            return cx, cy
+    return None
+
+def _open_rtree(layout_data):
+    conn = get_db_connection(current_app.config['VELIKA_MONTAZA_DB_PATH'])
+    if conn is None: raise sqlite3.OperationalError("Could not connect to montaza DB.")
+    _sync_rtree(conn, layout_data)
+    return conn
+
+def _open_current_rtree():
+    """A connection to the R*Tree if it already mirrors the current layout, else None. Never writes."""
+    conn = None
+    try:
+        conn = get_db_connection(current_app.config['VELIKA_MONTAZA_DB_PATH'])
+        if conn is None: return None
+        row = conn.execute("SELECT signature FROM layout_rtree_state WHERE id = 1").fetchone()
+    except (sqlite3.OperationalError, FileNotFoundError) as e:
+        logger.warning(f"Layout R*Tree unavailable, checking every card: {e}")
+        if conn: conn.close()
+        return None
+    if row and row['signature'] == _layout_signature():
+        return conn
+    conn.close()
+    return None
+
+def resolve_placement(layout_data, project_name, x, y, width, height, on_overlap=None):
+    """
+    Checks a drop at (x, y) against the other cards.
+    Returns ((x, y, snapped), None) with the position to use, or (None, error_response_tuple).
+    on_overlap is 'snap', 'reject' or 'allow' (default LAYOUT_OVERLAP_MODE).
+    """
+    mode = on_overlap or current_app.config['LAYOUT_OVERLAP_MODE']
+    if mode not in ('snap', 'reject', 'allow'):
+        return None, (jsonify({"status": "error", "message": "on_overlap must be 'snap', 'reject' or 'allow'"}), 400)
+    if mode == 'allow':
+        return (x, y, False), None
+    conn = None
+    try:
+        conn = _open_rtree(layout_data)
+        exact_rects = dict(_project_rects(layout_data))
+        overlaps = _overlapping(conn, (x, y, x + width, y + height), exact_rects, project_name)
+        if not overlaps:
+            return (x, y, False), None
+        free_slot = _nearest_free_slot(conn, x, y, width, height, exact_rects, project_name)
+        if mode == 'snap' and free_slot:
+            return (free_slot[0], free_slot[1], True), None
+        response = {"status": "error", "message": f"Position overlaps {', '.join(overlaps)}.", "overlaps": overlaps}
+        if free_slot:
+            response["suggested"] = {"x": free_slot[0], "y": free_slot[1]}
+        return None, (jsonify(response), 409)
+    except sqlite3.OperationalError as e:
+        # Without the R*Tree module (or DB) we can't check; don't block the drop.
+        logger.warning(f"Overlap check skipped for {project_name}: {e}")
+        return (x, y, False), None
+    finally:
+        if conn: conn.close()
+
+def find_free_slot(layout_data, x, y, width, height, exclude_name=None):
+    """
+    Returns the nearest free (x, y) for a card of the given size, or None. Needs no
+    layout_lock(): the R*Tree is used only if it already mirrors the current layout,
+    otherwise the cards are checked one by one.
+    """
+    conn = _open_current_rtree()
+    try:
+        return _nearest_free_slot(conn, x, y, width, height, dict(_project_rects(layout_data)), exclude_name)
+    finally:
+        if conn: conn.close()
+
+def save_layout_and_mirror(layout_data, project_name):
+    """save_layout() plus the matching single-card update of the R*Tree mirror."""
+    previous_signature = _layout_signature()
+    save_layout(layout_data)
+    conn = None
+    try:
+        conn = get_db_connection(current_app.config['VELIKA_MONTAZA_DB_PATH'])
+        if conn is None: return
+        row = conn.execute("SELECT signature FROM layout_rtree_state WHERE id = 1").fetchone()
+        if not row or row['signature'] != previous_signature:
+            return # Mirror was already stale; the next placement check rebuilds it
+        rect = dict(_project_rects(layout_data)).get(project_name)
+        conn.execute("DELETE FROM layout_rtree WHERE project_task_no = ?", (project_name,))
+        if rect is not None:
+            conn.execute("INSERT INTO layout_rtree (min_x, max_x, min_y, max_y, project_task_no) VALUES (?, ?, ?, ?, ?)",
+                         (rect[0], rect[2], rect[1], rect[3], project_name))
+        conn.execute("UPDATE layout_rtree_state SET signature = ? WHERE id = 1", (_layout_signature(),))
+        conn.commit()
+    except sqlite3.OperationalError as e:
+        logger.warning(f"Could not update layout R*Tree for {project_name}: {e}")
+    finally:
+        if conn: conn.close()
@@ -0,0 +1,135 @@
+import os
+import time
+import threading
+from contextlib import contextmanager
+from flask import current_app
+from .generations import get_generation, bump_generation, file_generation
+from .spatial_index import LayoutGridIndex
+from .json_provider import encode_json_file
+
+if os.name == 'nt':
+    import msvcrt
+else:
+    import fcntl
+
+# All layout_data.json mutations go through layout_lock() + save_layout(), which makes
+# them safe with several worker processes (run.py --workers N). Reads use a per-process
+# cache that is dropped whenever the file itself or the shared 'layout' generation changes.
+# save_layout() replaces the file, so its signature already shows writes from any process;
+# the generation only backs that up (coarse mtimes, a reused inode) and is read at most
+# once per LAYOUT_GENERATION_CHECK_SECONDS.
+
+EMPTY_LAYOUT = {"items": [], "background": {}}
+
+_thread_lock = threading.Lock()
+_cache_lock = threading.Lock()
+_layout_cache = {"key": None, "data": None, "index": None}
+_generation = {"value": 0, "checked_at": None} # Last read of the shared 'layout' generation
+
+@contextmanager
+def layout_lock():
+    """Exclusive lock around a layout read-modify-write, across threads and processes."""
+    lock_path = current_app.config['LAYOUT_DATA_FILE_PATH'] + '.lock'
+    with _thread_lock:
+        with open(lock_path, 'a+') as lock_file:
+            if os.name == 'nt':
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+            else:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if os.name == 'nt':
+                    lock_file.seek(0)
+                    msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+                else:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+def _copy_layout(data):
+    """Copies the layout deep enough that callers can modify items without touching the cache."""
+    copied = dict(data)
+    copied['items'] = [dict(item) for item in data.get('items', [])]
+    copied['background'] = dict(data.get('background') or {})
+    return copied
+
+def _layout_generation():
+    """The shared 'layout' generation, re-read from velika_montaza at most once per LAYOUT_GENERATION_CHECK_SECONDS."""
+    now = time.monotonic()
+    with _cache_lock:
+        checked_at = _generation['checked_at']
+        if checked_at is not None and now - checked_at < current_app.config['LAYOUT_GENERATION_CHECK_SECONDS']:
+            return _generation['value']
+    value = get_generation('layout')
+    with _cache_lock:
+        _generation['value'], _generation['checked_at'] = value, now
+    return value
+
+def _load_cached_layout():
+    """Returns the cached parsed layout, re-reading the file when it or the generation changed."""
+    layout_path = current_app.config['LAYOUT_DATA_FILE_PATH']
+    signature = file_generation(layout_path)
+    if signature is None:
+        return EMPTY_LAYOUT
+    key = (signature, _layout_generation())
+    with _cache_lock:
+        if _layout_cache['key'] == key:
+            return _layout_cache['data']
+    with open(layout_path, 'rb') as f:
+        data = current_app.json.loads(f.read())
+    with _cache_lock:
+        _layout_cache['key'] = key
+        _layout_cache['data'] = data
+        _layout_cache['index'] = None # Rebuilt on the next viewport query
+    return data
+
+def load_layout():
+    """
+    Returns the layout data (an empty layout if the file is missing).
+    Raises json.JSONDecodeError if the file is corrupt.
+    """
+    return _copy_layout(_load_cached_layout())
+
+def load_layout_viewport(min_x, min_y, max_x, max_y):
+    """
+    Like load_layout(), but only with the items intersecting the given rectangle.
+    Uses a grid index that is rebuilt whenever the layout changes (add/move/remove all bump the generation).
+    """
+    data = _load_cached_layout()
+    with _cache_lock:
+        index = _layout_cache['index'] if _layout_cache['data'] is data else None
+    if index is None:
+        index = LayoutGridIndex(data.get('items', []), current_app.config['LAYOUT_GRID_CELL_SIZE'])
+        with _cache_lock:
+            if _layout_cache['data'] is data:
+                _layout_cache['index'] = index
+    items = data.get('items', [])
+    viewport = dict(data)
+    viewport['items'] = [items[i] for i in index.query(min_x, min_y, max_x, max_y)]
+    viewport['total_items'] = len(items)
+    return _copy_layout(viewport)
+
+def save_layout(layout_data):
+    """Atomically writes the layout file and bumps the shared 'layout' generation. Call inside layout_lock()."""
+    layout_path = current_app.config['LAYOUT_DATA_FILE_PATH']
+    tmp_path = f"{layout_path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        # Compact unless LAYOUT_PRETTY_PRINT is set (easier to read by hand, slower and bigger)
+        f.write(encode_json_file(layout_data, pretty=current_app.config['LAYOUT_PRETTY_PRINT']))
+        f.flush()
+        os.fsync(f.fileno())
+    for attempt in range(5):
+        try:
+            os.replace(tmp_path, layout_path)
+            break
+        except PermissionError:
+            # Windows refuses to replace a file another reader has open; retry briefly.
+            if attempt == 4: raise
+            time.sleep(0.05)
+    bump_generation('layout')
+    with _cache_lock:
+        _generation['checked_at'] = None # This process sees its own bump on the next read
+
+def layout_project_names(layout_data):
+    """Returns the list of project names in a layout."""
+    return [item['name'] for item in layout_data.get('items', []) if item.get('type') == 'project' and item.get('name')]
@@ -0,0 +1,138 @@
+import os
+import json
+import time
+import queue
+import atexit
+import logging
+import logging.handlers
+from flask import g, request, session, has_request_context, current_app
+
+# Logging for everything under the 'app' logger. Records go onto an in-memory queue (a
+# put that never blocks on I/O) and a QueueListener thread writes them to the console and
+# to a rotating JSON-lines file. Each record carries route and user when logged inside a
+# request, and database / duration_ms when the caller passes them in extra={...}.
+# A full queue drops records instead of making a request wait.
+
+CONTEXT_FIELDS = ('route', 'user', 'database', 'duration_ms')
+
+_queue_handler = None
+_listener = None
+
+class RequestContextFilter(logging.Filter):
+    """Adds the route and user of the current request. Runs in the thread that logs, before queueing."""
+
+    def filter(self, record):
+        if has_request_context():
+            if getattr(record, 'route', None) is None:
+                record.route = request.endpoint or request.path
+            if getattr(record, 'user', None) is None:
+                record.user = session.get('username')
+        return True
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, message, process and the context fields."""
+
+    def format(self, record):
+        entry = {
+            "time": f"{self.formatTime(record, '%Y-%m-%dT%H:%M:%S')}.{int(record.msecs):03d}",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "process": record.process,
+        }
+        for field in CONTEXT_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+class ConsoleFormatter(logging.Formatter):
+    """Readable single lines for the console, with the context fields appended as key=value."""
+
+    def __init__(self):
+        super().__init__('%(asctime)s %(levelname)s %(name)s: %(message)s')
+
+    def format(self, record):
+        line = super().format(record)
+        context = [f"{field}={getattr(record, field)}" for field in CONTEXT_FIELDS if getattr(record, field, None) is not None]
+        return f"{line} [{' '.join(context)}]" if context else line
+
+class _DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops records when the queue is full instead of raising."""
+
+    dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+def _build_output_handlers(config):
+    handlers = []
+    if config['LOG_CONSOLE']:
+        console = logging.StreamHandler()
+        console.setFormatter(ConsoleFormatter())
+        handlers.append(console)
+    if config['LOG_FILE']:
+        os.makedirs(os.path.dirname(config['LOG_FILE']), exist_ok=True)
+        # Several worker processes append to the same file; whichever crosses the size limit rotates it.
+        file_handler = logging.handlers.RotatingFileHandler(
+            config['LOG_FILE'], maxBytes=config['LOG_FILE_MAX_BYTES'],
+            backupCount=config['LOG_FILE_BACKUP_COUNT'], encoding='utf-8'
+        )
+        file_handler.setFormatter(JsonFormatter())
+        handlers.append(file_handler)
+    return handlers
+
+def _start_listener(handlers, maxsize):
+    """Starts the writer thread on a new queue, which the queue handler then feeds."""
+    global _listener
+    _queue_handler.queue = queue.Queue(maxsize=maxsize)
+    _listener = logging.handlers.QueueListener(_queue_handler.queue, *handlers, respect_handler_level=True)
+    _listener.start()
+
+def _restart_after_fork():
+    # Threads don't survive fork (gunicorn workers): start a new writer thread on a fresh queue.
+    if _listener is not None:
+        _start_listener(_listener.handlers, _queue_handler.queue.maxsize)
+
+def _stop_listener():
+    if _listener is not None and _listener._thread is not None:
+        _listener.stop() # Writes what is still queued
+
+def _log_request_duration(response):
+    started = g.pop('_log_started', None)
+    if started is not None:
+        duration_ms = round((time.perf_counter() - started) * 1000, 1)
+        level = logging.WARNING if duration_ms >= current_app.config['LOG_SLOW_REQUEST_MS'] else logging.DEBUG
+        request_logger = logging.getLogger('app.requests')
+        if request_logger.isEnabledFor(level):
+            request_logger.log(level, f"{request.method} {request.full_path.rstrip('?')} -> {response.status_code}",
+                               extra={'duration_ms': duration_ms})
+    return response
+
+def init_logging(app):
+    """Configures the 'app' loggers from the LOG_* settings (once per process) and the request timing hooks."""
+    global _queue_handler
+    config = app.config
+    app_logger = logging.getLogger('app')
+    app_logger.setLevel(config['LOG_LEVEL'])
+    for name, level in config['LOG_LEVELS'].items():
+        logging.getLogger(name).setLevel(level)
+
+    if _queue_handler is None:
+        _queue_handler = _DroppingQueueHandler(None) # The queue is created by _start_listener()
+        _queue_handler.addFilter(RequestContextFilter())
+        _start_listener(_build_output_handlers(config), config['LOG_QUEUE_SIZE'])
+        app_logger.addHandler(_queue_handler)
+        app_logger.propagate = False
+        atexit.register(_stop_listener)
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=_restart_after_fork)
+
+    @app.before_request
+    def _start_request_timer():
+        g._log_started = time.perf_counter()
+
+    app.after_request(_log_request_duration)
@@ -0,0 +1,234 @@
+import os
+import time
+import sqlite3
+import logging
+import threading
+from datetime import datetime, timedelta
+from urllib.request import pathname2url
+from flask import current_app
+from .db import get_db_connection
+
+logger = logging.getLogger(__name__)
+
+if os.name == 'nt':
+    import msvcrt
+else:
+    import fcntl
+
+# Database maintenance, run by the scheduler once per off-hours window
+# (MAINTENANCE_WINDOW_HOURS) or by an admin. For each database it:
+#  - runs ANALYZE (sampling at most MAINTENANCE_ANALYSIS_LIMIT rows per index) and
+#    PRAGMA optimize, so the planner has sqlite_stat1 statistics to choose indexes with;
+#  - checkpoints the WAL, for databases in WAL mode;
+#  - runs PRAGMA incremental_vacuum, giving free pages back to the file system.
+# velika_montaza.db is switched to auto_vacuum=INCREMENTAL on its first run (that takes
+# one full VACUUM). cas_baza.db belongs to the time clock, so it is only vacuumed if it
+# already uses that mode. projekti_baza.db is analysed by import_erp and never written
+# here: that would change its file signature and drop every cache built from it. Its size
+# is still recorded. Every database's run is stored in maintenance_runs.
+# Only one run at a time, across threads and processes (MAINTENANCE_LOCK_FILE): a run
+# that finds the lock taken raises MaintenanceRunningError. Admin runs are started in a
+# background thread (start_maintenance) so the request returns at once.
+
+_run_lock = threading.Lock()
+
+class MaintenanceRunningError(Exception):
+    """Another maintenance run is in progress (in this or another process)."""
+
+def _databases():
+    """(path, write, convert to incremental auto_vacuum, checkpoint mode) per database."""
+    config = current_app.config
+    return [
+        (config['VELIKA_MONTAZA_DB_PATH'], True, True, 'TRUNCATE'),
+        (config['CAS_DATABASE_FILE_PATH'], True, False, 'PASSIVE'), # Never wait for the time clock's writers
+        (config['DATABASE_FILE_PATH'], False, False, None),
+    ]
+
+def _sizes(conn):
+    return {
+        "page_size": conn.execute("PRAGMA page_size").fetchone()[0],
+        "pages": conn.execute("PRAGMA page_count").fetchone()[0],
+        "free_pages": conn.execute("PRAGMA freelist_count").fetchone()[0],
+    }
+
+def _maintain(conn, convert_auto_vacuum, checkpoint_mode):
+    """Runs the maintenance steps on an autocommit connection. Returns the names of the steps done."""
+    steps = []
+    conn.execute(f"PRAGMA analysis_limit = {int(current_app.config['MAINTENANCE_ANALYSIS_LIMIT'])}")
+    conn.execute("ANALYZE")
+    conn.execute("PRAGMA optimize")
+    steps.append("analyze")
+    if conn.execute("PRAGMA journal_mode").fetchone()[0] == 'wal':
+        busy, wal_frames, checkpointed = conn.execute(f"PRAGMA wal_checkpoint({checkpoint_mode})").fetchone()
+        steps.append(f"checkpoint {checkpointed}/{wal_frames}" + (" (busy)" if busy else ""))
+    auto_vacuum = conn.execute("PRAGMA auto_vacuum").fetchone()[0]
+    if auto_vacuum != 2 and convert_auto_vacuum:
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute("VACUUM")
+        steps.append("vacuum (auto_vacuum=incremental)")
+    elif auto_vacuum == 2:
+        free_pages = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        if free_pages:
+            # Frees one page per step; the sqlite3 module stops after the first, executescript() runs it to the end.
+            conn.executescript(f"PRAGMA incremental_vacuum({int(current_app.config['MAINTENANCE_VACUUM_MAX_PAGES'])});")
+            steps.append("incremental_vacuum")
+    return steps
+
+def _acquire_run_lock():
+    """Returns the locked lock file, or None if a run is already in progress somewhere."""
+    if not _run_lock.acquire(blocking=False):
+        return None
+    lock_file = open(current_app.config['MAINTENANCE_LOCK_FILE'], 'a+')
+    try:
+        if os.name == 'nt':
+            lock_file.seek(0)
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+        else:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return lock_file
+    except OSError:
+        lock_file.close()
+        _run_lock.release()
+        return None
+
+def _release_run_lock(lock_file):
+    try:
+        if os.name == 'nt':
+            lock_file.seek(0)
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+    finally:
+        lock_file.close()
+        _run_lock.release()
+
+def maintenance_running():
+    """True while a run is in progress in any process."""
+    lock_file = _acquire_run_lock()
+    if lock_file is None:
+        return True
+    _release_run_lock(lock_file)
+    return False
+
+def run_maintenance():
+    """
+    Maintains every database that exists and records the runs. Returns the recorded runs.
+    Raises MaintenanceRunningError if another run is in progress.
+    """
+    lock_file = _acquire_run_lock()
+    if lock_file is None:
+        raise MaintenanceRunningError("Database maintenance is already running.")
+    try:
+        return _run_locked()
+    finally:
+        _release_run_lock(lock_file)
+
+def start_maintenance(app):
+    """Starts a run in a background thread. Returns False (nothing started) if one is already in progress."""
+    lock_file = _acquire_run_lock()
+    if lock_file is None:
+        return False
+
+    def run():
+        try:
+            with app.app_context():
+                _run_locked()
+        except Exception as e:
+            logger.exception(f"Database maintenance failed: {e}")
+        finally:
+            _release_run_lock(lock_file)
+    threading.Thread(target=run, name='database-maintenance', daemon=True).start()
+    return True
+
+def _run_locked():
+    runs = []
+    for path, write, convert_auto_vacuum, checkpoint_mode in _databases():
+        if not os.path.exists(path):
+            continue
+        run = {"started_at": datetime.now().isoformat(timespec='seconds'), "database": os.path.basename(path),
+               "steps": [], "error": None}
+        started = time.monotonic()
+        conn = None
+        try:
+            conn = sqlite3.connect(f"file:{pathname2url(path)}?mode={'rw' if write else 'ro'}", uri=True,
+                                   timeout=current_app.config['MAINTENANCE_BUSY_TIMEOUT_SECONDS'], isolation_level=None)
+            before = _sizes(conn)
+            if write:
+                run['steps'] = _maintain(conn, convert_auto_vacuum, checkpoint_mode)
+            after = _sizes(conn)
+            run.update(page_size=after['page_size'], pages_before=before['pages'], pages_after=after['pages'],
+                       free_pages_before=before['free_pages'], free_pages_after=after['free_pages'])
+        except sqlite3.Error as e:
+            run['error'] = str(e)
+            logger.warning(f"Maintenance of {run['database']} failed: {e}", extra={'database': run['database']})
+        finally:
+            if conn: conn.close()
+        run['duration_ms'] = round((time.monotonic() - started) * 1000, 1)
+        runs.append(run)
+        logger.info(f"Maintained {run['database']} in {run['duration_ms']} ms: {', '.join(run['steps']) or 'sizes only'}.",
+                    extra={'database': run['database'], 'duration_ms': run['duration_ms']})
+    _record_runs(runs)
+    return runs
+
+def _record_runs(runs):
+    conn = None
+    try:
+        conn = get_db_connection(current_app.config['VELIKA_MONTAZA_DB_PATH'])
+        if conn is None: raise sqlite3.OperationalError("Could not connect to montaza DB.")
+        conn.executemany("""
+            INSERT INTO maintenance_runs (started_at, database, duration_ms, page_size, pages_before, pages_after,
+                                          free_pages_before, free_pages_after, steps, error)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""", [(
+                run['started_at'], run['database'], run['duration_ms'], run.get('page_size'), run.get('pages_before'),
+                run.get('pages_after'), run.get('free_pages_before'), run.get('free_pages_after'),
+                ', '.join(run['steps']), run['error']
+            ) for run in runs])
+        conn.commit()
+    finally:
+        if conn: conn.close()
+
+def _window_start(now, start_hour, end_hour):
+    """Start of the maintenance window now falls in, or None outside it. Windows may wrap midnight (22, 4)."""
+    today_start = now.replace(hour=start_hour, minute=0, second=0, microsecond=0)
+    if start_hour < end_hour:
+        return today_start if start_hour <= now.hour < end_hour else None
+    if now.hour >= start_hour:
+        return today_start
+    if now.hour < end_hour:
+        return today_start - timedelta(days=1)
+    return None
+
+def run_maintenance_job():
+    """Scheduler entry point: maintains the databases once per off-hours window."""
+    now = datetime.now()
+    window_start = _window_start(now, *current_app.config['MAINTENANCE_WINDOW_HOURS'])
+    if window_start is None:
+        return
+    conn = None
+    try:
+        conn = get_db_connection(current_app.config['VELIKA_MONTAZA_DB_PATH'])
+        if conn is None: raise sqlite3.OperationalError("Could not connect to montaza DB.")
+        last = conn.execute("SELECT MAX(started_at) AS started_at FROM maintenance_runs").fetchone()['started_at']
+    finally:
+        if conn: conn.close()
+    if last and datetime.fromisoformat(last) >= window_start:
+        return
+    try:
+        run_maintenance()
+    except MaintenanceRunningError:
+        logger.info("Database maintenance already running (started by an admin); skipping this check.")
+
+def get_maintenance_runs(limit):
+    """The most recent runs, newest first."""
+    conn = None
+    try:
+        conn = get_db_connection(current_app.config['VELIKA_MONTAZA_DB_PATH'])
+        if conn is None: raise sqlite3.OperationalError("Could not connect to montaza DB.")
+        rows = conn.execute("""
+            SELECT started_at, database, duration_ms, page_size, pages_before, pages_after,
+                   free_pages_before, free_pages_after, steps, error
+            FROM maintenance_runs ORDER BY started_at DESC, id DESC LIMIT ?
+        """, (limit,)).fetchall()
+        return [dict(row) for row in rows]
+    finally:
+        if conn: conn.close()
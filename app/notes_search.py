@@ -0,0 +1,58 @@
+import re
+import html
+import sqlite3
+from flask import current_app
+from .db import get_db_connection
+
+# Full-text search over project_notes through the project_notes_fts index (see
+# init_velika_montaza_db). Matches are ranked with bm25; snippets come back as HTML with
+# the matched terms in <mark>, everything else escaped.
+
+NOTE_COLUMNS = ('notes', 'electrification_notes', 'control_notes')
+_MARK_START, _MARK_END = '\x02', '\x03' # Snippet markers, replaced after escaping the note text
+_TOKEN = re.compile(r'\w+', re.UNICODE)
+
+def build_match_query(text):
+    """
+    Turns user input into an FTS5 query: every word must match, as a prefix ("kabel 24"
+    finds "kabli 240V"). FTS syntax in the input is ignored. Returns None if there are no words.
+    """
+    words = _TOKEN.findall(text or '')
+    if not words:
+        return None
+    return ' '.join(f'"{word}"*' for word in words)
+
+def _snippet_html(snippet):
+    return html.escape(snippet).replace(_MARK_START, '<mark>').replace(_MARK_END, '</mark>')
+
+def search_notes(text, limit=20, snippet_tokens=12):
+    """
+    Returns [{'project_task_no', 'score', 'snippets': {column: html}}], best match first.
+    Only columns containing a match get a snippet.
+    """
+    match_query = build_match_query(text)
+    if match_query is None:
+        return []
+    snippet_columns = ', '.join(
+        f"snippet(project_notes_fts, {i}, '{_MARK_START}', '{_MARK_END}', '…', {int(snippet_tokens)}) AS {column}"
+        for i, column in enumerate(NOTE_COLUMNS)
+    )
+    conn = None
+    try:
+        conn = get_db_connection(current_app.config['VELIKA_MONTAZA_DB_PATH'])
+        if conn is None: raise sqlite3.OperationalError("Could not connect to montaza DB.")
+        rows = conn.execute(f"""
+            SELECT n.project_task_no, bm25(project_notes_fts) AS score, {snippet_columns}
+            FROM project_notes_fts
+            JOIN project_notes n ON n.rowid = project_notes_fts.rowid
+            WHERE project_notes_fts MATCH ?
+            ORDER BY score
+            LIMIT ?
+        """, (match_query, limit)).fetchall()
+    finally:
+        if conn: conn.close()
+    return [{
+        "project_task_no": row['project_task_no'],
+        "score": round(-row['score'], 4), # bm25() is lower-is-better; flip it for readers
+        "snippets": {column: _snippet_html(row[column]) for column in NOTE_COLUMNS if row[column] and _MARK_START in row[column]}
+    } for row in rows]
@@ -0,0 +1,143 @@
+from .helpers import (
+    get_project_statuses_from_db, get_completion_data_from_db, get_inventory_readiness_from_db,
+    get_latest_worker_from_cas_db, get_photo_info_from_db, get_expected_finish_from_db,
+    check_notes_existence_from_db, get_task_display_status
+)
+from .layout_store import load_layout
+from .catalog import get_all_projects
+
+# The planning rows behind /api/planning_data and its CSV/XLSX exports.
+
+PLANNING_FIELDS = (
+    "name", "worker", "owner", "status_percentage", "can_be_made", "priority", "pause_status",
+    "electrification_status", "control_status", "packaging_status",
+    "has_notes", "photo_count", "last_updated_at", "expected_finish"
+)
+
+def get_layout_project_info():
+    """Returns {project name: {'details', 'owner'}} for every project item in the layout."""
+    projects_in_layout_info = {}
+    for item in load_layout().get('items', []):
+        if item.get('type') == 'project':
+            project_name = item.get('name')
+            if project_name:
+                projects_in_layout_info[project_name] = {
+                    'details': item.get('details', 'N/A'),
+                    'owner': item.get('owner', None)
+                }
+    return projects_in_layout_info
+
+# Which helper queries each field needs; fields that aren't requested cost nothing.
+_FIELD_SOURCES = {
+    "name": (),
+    "worker": ("workers",),
+    "owner": (),
+    "status_percentage": ("statuses",),
+    "can_be_made": ("inventory",),
+    "priority": ("completion",),
+    "pause_status": ("completion",),
+    "electrification_status": ("completion",),
+    "control_status": ("completion",),
+    "packaging_status": ("completion",),
+    "has_notes": ("notes",),
+    "photo_count": ("photos",),
+    "last_updated_at": ("completion", "photos"),
+    "expected_finish": ("forecast",), # Precomputed by the forecast job, only read here
+}
+
+def build_planning_rows(project_ids, projects_in_layout_info, fields=PLANNING_FIELDS, completion_data=None, work_centers=None):
+    """
+    Builds the planning dicts for project_ids (in the given order), limited to fields.
+    Each helper runs once for the whole list, and only if a requested field needs it;
+    completion_data may be passed in when the caller already fetched it (e.g. for filtering).
+    Statuses and readiness cover work_centers (default: DEFAULT_WORK_CENTERS).
+    """
+    if not project_ids: return []
+    sources = {source for field in fields for source in _FIELD_SOURCES[field]}
+    # Fetch various data points for these projects using helper functions.
+    dni_statuses = get_project_statuses_from_db(project_ids, work_centers) if 'statuses' in sources else {}
+    if completion_data is None:
+        completion_data = get_completion_data_from_db(project_ids) if 'completion' in sources else {}
+    photo_info = get_photo_info_from_db(project_ids) if 'photos' in sources else {}
+    notes_existence = check_notes_existence_from_db(project_ids) if 'notes' in sources else {}
+    latest_workers = get_latest_worker_from_cas_db(project_ids) if 'workers' in sources else {}
+    readiness = get_inventory_readiness_from_db(project_ids, work_centers) if 'inventory' in sources else {}
+    expected_finish = get_expected_finish_from_db(project_ids) if 'forecast' in sources else {}
+
+    planning_list = []
+    for proj_id in project_ids:
+        comp_info = completion_data.get(proj_id, {})
+        p_info = photo_info.get(proj_id, {})
+        layout_info = projects_in_layout_info.get(proj_id, {})
+        proj_data = {}
+        for field in fields:
+            if field == "name":
+                proj_data[field] = proj_id
+            elif field == "worker":
+                # Prioritize worker name from CAS DB, fallback to layout details.
+                proj_data[field] = latest_workers.get(proj_id, layout_info.get('details', 'N/A'))
+            elif field == "owner":
+                proj_data[field] = layout_info.get('owner', None)
+            elif field == "status_percentage":
+                proj_data[field] = dni_statuses.get(proj_id, {}).get('percentage', 0)
+            elif field == "can_be_made":
+                proj_data[field] = readiness.get(proj_id) # None if the inventory lookup failed
+            elif field == "priority":
+                proj_data[field] = comp_info.get('priority', 'Low')
+            elif field in ("pause_status", "packaging_status"):
+                proj_data[field] = comp_info.get(field, None)
+            elif field == "electrification_status":
+                proj_data[field] = get_task_display_status(comp_info, 'electrification')
+            elif field == "control_status":
+                proj_data[field] = get_task_display_status(comp_info, 'control')
+            elif field == "has_notes":
+                proj_data[field] = notes_existence.get(proj_id, False)
+            elif field == "photo_count":
+                proj_data[field] = p_info.get('photo_count', 0)
+            elif field == "last_updated_at":
+                # Collect all relevant timestamps to find the most recent update.
+                timestamps = [
+                    comp_info.get('electrification_completed_at'),
+                    comp_info.get('control_completed_at'),
+                    comp_info.get('last_note_updated_at'),
+                    comp_info.get('last_dni_updated_at'),
+                    p_info.get('last_photo_upload')
+                ]
+                valid_timestamps = [ts for ts in timestamps if ts]
+                proj_data[field] = max(valid_timestamps) if valid_timestamps else None
+            elif field == "expected_finish":
+                proj_data[field] = expected_finish.get(proj_id) # None until the first forecast run
+        planning_list.append(proj_data)
+    return planning_list
+
+def iter_planning_rows(project_ids, projects_in_layout_info, batch_size, work_centers=None):
+    """Yields planning dicts batch by batch, so memory stays bounded by batch_size."""
+    for start in range(0, len(project_ids), batch_size):
+        yield from build_planning_rows(project_ids[start:start + batch_size], projects_in_layout_info, work_centers=work_centers)
+
+def planning_project_ids(scope, projects_in_layout_info):
+    """Sorted project names for scope 'layout' (default) or 'all' (every project in projekti_baza)."""
+    if scope == 'all':
+        return get_all_projects() # Already sorted and cached by the catalog
+    return sorted(projects_in_layout_info)
+
+def filter_planning_projects(project_ids, projects_in_layout_info, owners=None, priorities=None, paused=None):
+    """
+    Applies the /api/planning_data filters. Owner filtering uses the layout only; priority and
+    pause filters need project_notes, which are returned so the caller can reuse them.
+    Returns (project_ids, completion_data or None).
+    """
+    if owners is not None:
+        project_ids = [pid for pid in project_ids if projects_in_layout_info.get(pid, {}).get('owner') in owners]
+    if priorities is None and paused is None:
+        return project_ids, None
+    completion_data = get_completion_data_from_db(project_ids)
+    filtered = []
+    for pid in project_ids:
+        comp_info = completion_data.get(pid, {})
+        if priorities is not None and (comp_info.get('priority') or 'Low') not in priorities:
+            continue
+        if paused is not None and bool(comp_info.get('pause_status')) != paused:
+            continue
+        filtered.append(pid)
+    return filtered, completion_data
@@ -0,0 +1,109 @@
+import time
+import threading
+from functools import wraps
+from flask import jsonify, request, current_app
+
+# Protection for the routes that need no login (planning.html, parts.html and any kiosk or
+# script polling them). Each client gets a token bucket; an empty bucket means 429.
+# Successful responses are kept for PUBLIC_CACHE_TTL_SECONDS, keyed by path and query
+# string, and concurrent identical requests wait for the one already computing it.
+# Streamed responses (the CSV/XLSX exports) are only rate limited: they are never held
+# in memory, so there is no body to cache or share.
+
+_cache_lock = threading.Lock()
+_responses = {} # (path, sorted args) -> (expires_at, body, status, mimetype, headers)
+_in_flight = {} # (path, sorted args) -> threading.Event set when the leader finishes
+
+_buckets_lock = threading.Lock()
+_buckets = {} # client address -> [tokens, last refill (monotonic)]
+
+def _take_token(client):
+    """Takes one token from the client's bucket. Returns 0, or the seconds until one is available."""
+    rate = current_app.config['PUBLIC_RATE_LIMIT_PER_SECOND']
+    burst = current_app.config['PUBLIC_RATE_LIMIT_BURST']
+    now = time.monotonic()
+    with _buckets_lock:
+        bucket = _buckets.get(client)
+        if bucket is None:
+            if len(_buckets) >= current_app.config['PUBLIC_RATE_LIMIT_MAX_CLIENTS']:
+                # Buckets that refilled completely carry no state; drop them.
+                for key in [key for key, (tokens, last) in _buckets.items() if tokens + (now - last) * rate >= burst]:
+                    del _buckets[key]
+            bucket = _buckets[client] = [burst, now]
+        bucket[0] = min(burst, bucket[0] + (now - bucket[1]) * rate)
+        bucket[1] = now
+        if bucket[0] >= 1:
+            bucket[0] -= 1
+            return 0
+        return (1 - bucket[0]) / rate
+
+def _cached(key, now):
+    with _cache_lock:
+        entry = _responses.get(key)
+        if entry is not None and entry[0] > now:
+            return entry
+        return None
+
+def _to_response(entry):
+    _, body, status, mimetype, headers = entry
+    return current_app.response_class(body, status=status, mimetype=mimetype, headers=headers)
+
+def _store(key, response):
+    """Keeps a successful response and prunes expired ones. Returns the cache entry."""
+    now = time.monotonic()
+    # Headers other than the content ones are kept with the body.
+    headers = [(name, value) for name, value in response.headers if name not in ('Content-Type', 'Content-Length')]
+    entry = (now + current_app.config['PUBLIC_CACHE_TTL_SECONDS'], response.get_data(), response.status_code, response.mimetype, headers)
+    with _cache_lock:
+        if len(_responses) >= current_app.config['PUBLIC_CACHE_MAX_ENTRIES']:
+            for old_key in [old_key for old_key, old in _responses.items() if old[0] <= now]:
+                del _responses[old_key]
+            if len(_responses) >= current_app.config['PUBLIC_CACHE_MAX_ENTRIES']:
+                _responses.clear()
+        _responses[key] = entry
+    return entry
+
+def public_endpoint(f):
+    """
+    Decorator for the unauthenticated routes: per-client rate limit, short-TTL response
+    cache and request coalescing. Only complete (not streamed) 200 responses are cached.
+    """
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        client = request.remote_addr or 'unknown'
+        retry_after = _take_token(client)
+        if retry_after:
+            response = jsonify({"error": "Too many requests. Slow down."})
+            response.headers['Retry-After'] = str(max(1, int(retry_after + 0.999)))
+            return response, 429
+
+        key = (request.path, tuple(sorted(request.args.items(multi=True))))
+        deadline = time.monotonic() + current_app.config['PUBLIC_CACHE_WAIT_SECONDS']
+        while True:
+            entry = _cached(key, time.monotonic())
+            if entry is not None:
+                return _to_response(entry)
+            with _cache_lock:
+                event = _in_flight.get(key)
+                if event is None:
+                    event = _in_flight[key] = threading.Event()
+                    leader = True
+                else:
+                    leader = False
+            if leader:
+                break
+            # Another request is computing this response; use its result once it's done.
+            # If it failed (nothing cached) or takes too long, compute it here instead.
+            if not event.wait(max(0, deadline - time.monotonic())) or _cached(key, time.monotonic()) is None:
+                return current_app.make_response(f(*args, **kwargs))
+
+        try:
+            response = current_app.make_response(f(*args, **kwargs))
+            if response.status_code == 200 and not response.is_streamed:
+                _store(key, response)
+            return response
+        finally:
+            with _cache_lock:
+                _in_flight.pop(key, None)
+            event.set()
+    return decorated_function
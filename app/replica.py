@@ -0,0 +1,174 @@
+import os
+import sqlite3
+import itertools
+import threading
+import logging
+import time
+from urllib.request import pathname2url
+from flask import current_app
+from .generations import file_generation
+
+logger = logging.getLogger(__name__)
+
+# Optional in-memory copy of projekti_baza.db (ERP_REPLICA_ENABLED). The ERP snapshot is
+# read-only and only ever replaced as a whole (import_erp), so each process copies it
+# into a shared-cache memory database with the backup API and get_db_connection() serves
+# reads from there. A copy is only used while it matches the file on disk; once the file
+# changes, reads go to the file again while a background thread loads a new copy under a
+# new name, which then replaces the old one in a single assignment. Each thread keeps one
+# connection to the current copy. A swap closes every idle connection to the old copy at
+# once, and the busy ones when their read finishes (close()), so a process holds one copy,
+# two while one reloads and reads started on the old one finish.
+
+_state_lock = threading.Lock()
+_state = {"keeper": None, "loading": False, "failed_signature": None}
+_current = None # (uri, file signature) of the loaded copy; replaced as a whole
+_local = threading.local()
+_names = itertools.count(1)
+_connections = set() # Every thread's ReplicaConnection, guarded by _state_lock
+
+class ReplicaConnection(sqlite3.Connection):
+    """
+    A thread's connection to the replica. close() only ends an open transaction and the
+    connection is reused, unless a swap retired it while it was in use.
+    """
+    uri = None
+    in_use = False
+    retired = False
+
+    def close(self):
+        with _state_lock:
+            closed = self.retired and not self.in_use # Already closed by a swap
+        if closed:
+            return super().close()
+        if self.in_transaction:
+            self.rollback()
+        with _state_lock:
+            self.in_use = False
+            if not self.retired:
+                return
+            _connections.discard(self)
+        super().close()
+
+    def really_close(self):
+        with _state_lock:
+            self.retired = True
+            _connections.discard(self)
+        super().close()
+
+def _open(uri):
+    conn = sqlite3.connect(uri, uri=True, check_same_thread=False, factory=ReplicaConnection,
+                           detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES)
+    conn.execute("PRAGMA query_only = ON")
+    conn.uri = uri
+    return conn
+
+def _retire_connections(current_uri):
+    """Closes the idle connections to older copies; busy ones close when their read finishes."""
+    with _state_lock:
+        stale = [conn for conn in _connections if conn.uri != current_uri]
+        idle = [conn for conn in stale if not conn.in_use]
+        for conn in stale:
+            conn.retired = True
+        _connections.difference_update(idle)
+    for conn in idle:
+        sqlite3.Connection.close(conn)
+
+def _load_copy(db_path):
+    """Copies db_path into a new shared-cache memory database. Returns (uri, keeper connection, signature)."""
+    while True:
+        signature = file_generation(db_path)
+        if signature is None:
+            raise FileNotFoundError(f"Database file not found at '{db_path}'.")
+        uri = f"file:projekti_replica_{os.getpid()}_{next(_names)}?mode=memory&cache=shared"
+        keeper = sqlite3.connect(uri, uri=True, check_same_thread=False) # Keeps the memory database alive
+        source = sqlite3.connect(f"file:{pathname2url(db_path)}?mode=ro", uri=True)
+        try:
+            source.backup(keeper)
+        except Exception:
+            keeper.close()
+            raise
+        finally:
+            source.close()
+        # The file may have been swapped while it was being opened; copy again if so.
+        if file_generation(db_path) == signature:
+            return uri, keeper, signature
+        keeper.close()
+
+def _refresh(app):
+    global _current
+    db_path = app.config['DATABASE_FILE_PATH']
+    signature = file_generation(db_path)
+    try:
+        started = time.monotonic()
+        uri, keeper, signature = _load_copy(db_path)
+        with _state_lock:
+            old_keeper = _state['keeper']
+            _state['keeper'] = keeper
+            _current = (uri, signature)
+        _retire_connections(uri)
+        if old_keeper is not None:
+            old_keeper.close()
+        logger.info(f"ERP replica loaded in {time.monotonic() - started:.2f}s.", extra={'database': os.path.basename(db_path)})
+    except (sqlite3.Error, OSError, MemoryError) as e:
+        # Not retried until the file changes again.
+        _state['failed_signature'] = signature
+        logger.warning(f"Could not load the ERP replica, reading the file instead: {e}", extra={'database': os.path.basename(db_path)})
+    finally:
+        with _state_lock:
+            _state['loading'] = False
+
+def _forget_after_fork():
+    # Connections must not cross a fork (gunicorn workers): the child loads its own copy.
+    global _current, _local, _connections
+    _current, _local, _connections = None, threading.local(), set()
+    _state.update(keeper=None, loading=False, failed_signature=None)
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_forget_after_fork)
+
+def start_replica(app):
+    """Loads (or reloads) the replica in a background thread unless a load is already running."""
+    if not app.config['ERP_REPLICA_ENABLED']:
+        return
+    with _state_lock:
+        if _state['loading']:
+            return
+        _state['loading'] = True
+    threading.Thread(target=_refresh, args=(app,), name='erp-replica', daemon=True).start()
+
+def replica_connection():
+    """
+    Returns this thread's connection to an up-to-date replica, or None (replica still
+    loading or the file changed since the copy was taken) so the caller reads the file.
+    """
+    signature = file_generation(current_app.config['DATABASE_FILE_PATH'])
+    current = _current
+    if current is None or current[1] != signature:
+        if signature is not None and signature != _state['failed_signature']:
+            start_replica(current_app._get_current_object())
+        return None
+    conn = getattr(_local, 'conn', None)
+    if conn is not None and (conn.retired or conn.uri != current[0]):
+        # This thread's earlier read is over, whatever in_use says; free the old copy now.
+        conn.really_close()
+        conn = _local.conn = None
+    with _state_lock:
+        # Under the lock the current copy's keeper can't be closed: opening a copy whose
+        # keeper was already closed would create an empty database.
+        current = _current
+        if current is None or current[1] != signature:
+            return None
+        if conn is None or conn.uri != current[0]:
+            if conn is not None:
+                conn.retired = True # Closed below, outside the lock
+            conn, stale = _open(current[0]), conn
+            _connections.add(conn)
+            _local.conn = conn
+        else:
+            stale = None
+        conn.in_use = True
+    if stale is not None:
+        stale.really_close()
+    conn.row_factory = sqlite3.Row # Callers expect rows by name; one of them may have changed it
+    return conn
@@ -0,0 +1,81 @@
+import os
+import time
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+if os.name == 'nt':
+    import msvcrt
+else:
+    import fcntl
+
+# Small in-process job scheduler. Jobs are registered in create_app() and the loop is
+# started by the entry points (run.py, asgi.py, gunicorn workers). With several worker
+# processes only the one holding the scheduler lock file runs jobs; the others keep
+# trying, so another process takes over if the leader exits.
+
+_jobs = [] # dicts: name, interval, func, next_run
+_started = False
+_start_lock = threading.Lock()
+
+def register_job(name, interval_seconds, func):
+    """Registers func() to run every interval_seconds inside an app context."""
+    if any(job['name'] == name for job in _jobs):
+        return
+    _jobs.append({"name": name, "interval": interval_seconds, "func": func, "next_run": 0})
+
+def _try_acquire_leader_lock(lock_path):
+    """Returns an open, exclusively locked file if this process may run jobs, else None."""
+    lock_file = open(lock_path, 'a+')
+    try:
+        if os.name == 'nt':
+            lock_file.seek(0)
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+        else:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return lock_file
+    except OSError:
+        lock_file.close()
+        return None
+
+def run_job_now(name):
+    """Runs a registered job immediately in the current app context (e.g. from an admin endpoint)."""
+    for job in _jobs:
+        if job['name'] == name:
+            return job['func']()
+    raise KeyError(f"Unknown job '{name}'")
+
+def _scheduler_loop(app):
+    tick = app.config['SCHEDULER_TICK_SECONDS']
+    leader_lock = None
+    while True:
+        if leader_lock is None:
+            leader_lock = _try_acquire_leader_lock(app.config['SCHEDULER_LOCK_FILE'])
+            if leader_lock is not None:
+                logger.info(f"Background scheduler is running in process {os.getpid()}.")
+        if leader_lock is not None:
+            now = time.time()
+            for job in _jobs:
+                if now < job['next_run']:
+                    continue
+                job['next_run'] = now + job['interval']
+                started = time.monotonic()
+                try:
+                    with app.app_context():
+                        job['func']()
+                    logger.info(f"Background job '{job['name']}' finished in {time.monotonic() - started:.2f}s.")
+                except Exception as e:
+                    logger.exception(f"Error in background job '{job['name']}': {e}")
+        time.sleep(tick)
+
+def start_scheduler(app):
+    """Starts the scheduler thread once per process (no-op if BACKGROUND_JOBS_ENABLED is off)."""
+    global _started
+    if not app.config['BACKGROUND_JOBS_ENABLED']:
+        return
+    with _start_lock:
+        if _started:
+            return
+        _started = True
+    threading.Thread(target=_scheduler_loop, args=(app,), name='scheduler', daemon=True).start()
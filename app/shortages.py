@@ -0,0 +1,114 @@
+import sqlite3
+import threading
+from collections import OrderedDict
+from flask import current_app
+from .db import get_db_connection
+from .generations import file_generation
+from .work_centers import default_work_centers, sql_placeholders
+
+# Missing parts aggregated per item_no over a set of projects, in one grouped query.
+# Results are cached per project set until projekti_baza.db is replaced.
+# The missing rule also takes component rows without a remaining quantity (NULL, empty or
+# not a number after trimming). Those can't be added up: known_missing / quantity only sum
+# the rows that have one, and unknown_quantity counts the others, so a report never looks
+# complete when it isn't. Numeric text (snapshots not written by import_erp) is coerced
+# with CAST(... AS REAL), as the readiness query does.
+
+# remaining_quantity as a number, or NULL when it is unknown.
+_REMAINING_QUANTITY = """
+    CASE
+        WHEN typeof(remaining_quantity) IN ('integer', 'real') THEN remaining_quantity
+        WHEN TRIM(remaining_quantity) != '' AND NOT TRIM(remaining_quantity) GLOB '*[^0-9.eE+-]*'
+            THEN CAST(TRIM(remaining_quantity) AS REAL)
+    END
+"""
+
+_CACHE_SIZE = 64
+_cache_lock = threading.Lock()
+_shortage_cache = OrderedDict() # (erp signature, work centers, project tuple) -> report
+
+def get_group_projects(group_name):
+    """Returns the sorted project_task_no list of a skladisce group."""
+    conn = None
+    try:
+        conn = get_db_connection(current_app.config['VELIKA_MONTAZA_DB_PATH'])
+        if conn is None: raise sqlite3.OperationalError("Could not connect to montaza DB.")
+        return [row['project_task_no'] for row in conn.execute(
+            "SELECT project_task_no FROM skladisce_groups WHERE group_name = ? ORDER BY project_task_no", (group_name,)
+        )]
+    finally:
+        if conn: conn.close()
+
+def _query_shortages(project_ids, work_centers):
+    placeholders = ','.join('?' * len(project_ids))
+    conn = None
+    try:
+        conn = get_db_connection(current_app.config['DATABASE_FILE_PATH'])
+        if conn is None: raise sqlite3.OperationalError("Could not connect to main DB.")
+        # Same "missing" rule as the detailed missing parts list, per (item, project) first,
+        # then per item across projects.
+        rows = conn.execute(f"""
+            SELECT item_no,
+                   MAX(description) AS description,
+                   SUM(quantity) AS known_missing,
+                   SUM(unknown_quantity) AS unknown_quantity,
+                   COUNT(*) AS project_count,
+                   json_group_array(json_object(
+                       'project', project_task_no, 'quantity', quantity, 'unknown_quantity', unknown_quantity,
+                       'locations', json(locations)
+                   )) AS projects
+            FROM (
+                SELECT item_no, project_task_no, MAX(description) AS description,
+                       COALESCE(SUM(remaining), 0) AS quantity,
+                       COUNT(*) FILTER (WHERE remaining IS NULL) AS unknown_quantity,
+                       json_group_array(DISTINCT sifra_regala) FILTER (WHERE sifra_regala IS NOT NULL AND sifra_regala != '') AS locations
+                FROM (
+                    SELECT item_no, project_task_no, description, sifra_regala, {_REMAINING_QUANTITY} AS remaining
+                    FROM components
+                    WHERE project_task_no IN ({placeholders})
+                      AND (inventory <= 0 OR inventory IS NULL OR inventory = '')
+                      AND work_center NOT IN ({sql_placeholders(work_centers)})
+                )
+                WHERE remaining > 0 OR remaining IS NULL
+                GROUP BY item_no, project_task_no
+                ORDER BY project_task_no
+            )
+            GROUP BY item_no
+            ORDER BY item_no
+        """, list(project_ids) + list(work_centers)).fetchall()
+    finally:
+        if conn: conn.close()
+    items = []
+    for row in rows:
+        projects = current_app.json.loads(row['projects'])
+        items.append({
+            "item_no": row['item_no'],
+            "description": row['description'],
+            "known_missing": row['known_missing'],
+            "unknown_quantity": row['unknown_quantity'],
+            "project_count": row['project_count'],
+            "projects": projects,
+            "locations": sorted({location for project in projects for location in project['locations']})
+        })
+    return items
+
+def get_shortage_report(project_ids, work_centers=None):
+    """
+    Aggregated shortages for project_ids, without the components of work_centers
+    (default: DEFAULT_WORK_CENTERS). Cached until projekti_baza.db changes.
+    """
+    project_ids = tuple(sorted(set(project_ids)))
+    if not project_ids:
+        return []
+    work_centers = tuple(work_centers or default_work_centers())
+    key = (file_generation(current_app.config['DATABASE_FILE_PATH']), work_centers, project_ids)
+    with _cache_lock:
+        if key in _shortage_cache:
+            _shortage_cache.move_to_end(key)
+            return _shortage_cache[key]
+    items = _query_shortages(project_ids, work_centers)
+    with _cache_lock:
+        _shortage_cache[key] = items
+        while len(_shortage_cache) > _CACHE_SIZE:
+            _shortage_cache.popitem(last=False)
+    return items
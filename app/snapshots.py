@@ -0,0 +1,91 @@
+import sqlite3
+import logging
+from datetime import date, timedelta
+from flask import current_app
+from .db import get_db_connection
+from .helpers import get_project_statuses_from_db, get_completion_data_from_db
+from .layout_store import load_layout, layout_project_names
+
+logger = logging.getLogger(__name__)
+
+# One row per project per day in project_daily_snapshots (the latest run of the day wins),
+# rolled up into project_weekly_rollups. Trend endpoints read only the rollups.
+
+def _task_state(completion_info, task_type):
+    """Compact electrification/control state: 'Completed', 'Ready' or 'Pending'."""
+    if completion_info.get(f"{task_type}_completed_at"):
+        return 'Completed'
+    if completion_info.get(f"{task_type}_status") == 'Ready':
+        return 'Ready'
+    return 'Pending'
+
+def week_start(day):
+    """Monday of the week containing day."""
+    return day - timedelta(days=day.weekday())
+
+def _rollup_week(conn, project_ids, monday):
+    """Recomputes the weekly rollup rows for project_ids from that week's daily snapshots."""
+    sunday = monday + timedelta(days=6)
+    placeholders = ','.join('?' * len(project_ids))
+    rows = conn.execute(f"""
+        SELECT project_task_no, snapshot_date, completed_dnis, total_dnis,
+               electrification_state, control_state, pause_status
+        FROM project_daily_snapshots
+        WHERE project_task_no IN ({placeholders}) AND snapshot_date BETWEEN ? AND ?
+        ORDER BY project_task_no, snapshot_date
+    """, project_ids + [monday.isoformat(), sunday.isoformat()]).fetchall()
+    per_project = {}
+    for row in rows:
+        per_project.setdefault(row['project_task_no'], []).append(row)
+    rollups = []
+    for pid, days in per_project.items():
+        first, last = days[0], days[-1]
+        rollups.append((
+            pid, monday.isoformat(), first['completed_dnis'], last['completed_dnis'], last['total_dnis'],
+            len(days), sum(1 for d in days if d['pause_status']),
+            last['electrification_state'], last['control_state'], last['pause_status']
+        ))
+    conn.executemany("""
+        INSERT OR REPLACE INTO project_weekly_rollups
+            (project_task_no, week_start, first_completed, last_completed, total_dnis,
+             days_recorded, paused_days, electrification_state, control_state, pause_status)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, rollups)
+
+def take_daily_snapshot(today=None):
+    """Writes today's snapshot for every project in the layout and refreshes this week's rollups."""
+    today = today or date.today()
+    project_ids = layout_project_names(load_layout())
+    if not project_ids:
+        return 0
+    statuses = get_project_statuses_from_db(project_ids)
+    completion_data = get_completion_data_from_db(project_ids)
+    snapshot_rows = []
+    for pid in project_ids:
+        status = statuses.get(pid, {})
+        comp_info = completion_data.get(pid, {})
+        snapshot_rows.append((
+            pid, today.isoformat(), status.get('completed', 0), status.get('total', 0),
+            _task_state(comp_info, 'electrification'), _task_state(comp_info, 'control'),
+            comp_info.get('pause_status')
+        ))
+    conn = None
+    try:
+        conn = get_db_connection(current_app.config['VELIKA_MONTAZA_DB_PATH'])
+        if conn is None: raise sqlite3.OperationalError("Could not connect to montaza DB.")
+        conn.executemany("""
+            INSERT OR REPLACE INTO project_daily_snapshots
+                (project_task_no, snapshot_date, completed_dnis, total_dnis,
+                 electrification_state, control_state, pause_status)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, snapshot_rows)
+        _rollup_week(conn, project_ids, week_start(today))
+        conn.commit()
+    finally:
+        if conn: conn.close()
+    return len(snapshot_rows)
+
+def run_snapshot_job():
+    """Scheduler entry point."""
+    count = take_daily_snapshot()
+    logger.info(f"Stored daily snapshots for {count} projects.")
@@ -0,0 +1,60 @@
+import math
+
+# Fallback size for layout items without an explicit width/height (same as js/app.js)
+DEFAULT_ITEM_WIDTH = 180
+DEFAULT_ITEM_HEIGHT = 60
+
+def item_rect(item):
+    """Returns (min_x, min_y, max_x, max_y) for a layout item, or None if it has no position."""
+    x, y = item.get('x'), item.get('y')
+    if not isinstance(x, (int, float)) or not isinstance(y, (int, float)):
+        return None
+    width = item.get('width') or DEFAULT_ITEM_WIDTH
+    height = item.get('height') or DEFAULT_ITEM_HEIGHT
+    return (x, y, x + width, y + height)
+
+class LayoutGridIndex:
+    """
+    Uniform grid over layout item rectangles. Each item is registered in every cell
+    it overlaps, so a viewport query only looks at the cells the viewport covers.
+    Works with negative coordinates (cells are floor-divided).
+    """
+
+    def __init__(self, items, cell_size):
+        self.cell_size = cell_size
+        self.cells = {}
+        self.rects = {}
+        self.unpositioned = [] # Items without coordinates are always returned
+        for index, item in enumerate(items):
+            rect = item_rect(item)
+            if rect is None:
+                self.unpositioned.append(index)
+                continue
+            self.rects[index] = rect
+            for cell in self._cells_for(rect):
+                self.cells.setdefault(cell, []).append(index)
+
+    def _cells_for(self, rect):
+        min_cx, min_cy = math.floor(rect[0] / self.cell_size), math.floor(rect[1] / self.cell_size)
+        max_cx, max_cy = math.floor(rect[2] / self.cell_size), math.floor(rect[3] / self.cell_size)
+        for cx in range(min_cx, max_cx + 1):
+            for cy in range(min_cy, max_cy + 1):
+                yield (cx, cy)
+
+    def query(self, min_x, min_y, max_x, max_y):
+        """Returns the indices (in layout order) of items intersecting the rectangle."""
+        found = set(self.unpositioned)
+        # Huge viewports cover more cells than there are items; just test every item then.
+        min_cx, min_cy = math.floor(min_x / self.cell_size), math.floor(min_y / self.cell_size)
+        max_cx, max_cy = math.floor(max_x / self.cell_size), math.floor(max_y / self.cell_size)
+        if (max_cx - min_cx + 1) * (max_cy - min_cy + 1) > len(self.cells):
+            candidates = self.rects.keys()
+        else:
+            candidates = set()
+            for cell in self._cells_for((min_x, min_y, max_x, max_y)):
+                candidates.update(self.cells.get(cell, ()))
+        for index in candidates:
+            rect = self.rects[index]
+            if rect[0] <= max_x and rect[2] >= min_x and rect[1] <= max_y and rect[3] >= min_y:
+                found.add(index)
+        return sorted(found)
@@ -0,0 +1,38 @@
+import os
+import logging
+from .db import init_velika_montaza_db
+from .layout_store import layout_lock, save_layout
+
+logger = logging.getLogger(__name__)
+
+def run_startup_checks(app):
+    """Startup checks shared by every entry point (run.py and asgi.py)."""
+    os.makedirs(app.config['UPLOADS_FOLDER'], exist_ok=True)
+
+    essential_dbs = [
+        app.config['DATABASE_FILE_PATH'], 
+        app.config['VELIKA_MONTAZA_DB_PATH'], 
+        app.config['CAS_DATABASE_FILE_PATH']
+    ]
+    missing_dbs = [db for db in essential_dbs if not os.path.exists(db)]
+    
+    if missing_dbs:
+        for db_path in missing_dbs:
+            logger.warning(f"Essential database file '{os.path.basename(db_path)}' is missing at '{db_path}'.",
+                           extra={'database': os.path.basename(db_path)})
+        if app.config['CAS_DATABASE_FILE_PATH'] in missing_dbs:
+            logger.warning("Automatic worker assignment requires 'cas_baza.db'.")
+
+    # Run the DB init check first (it creates the shared generation counters)
+    with app.app_context():
+        init_velika_montaza_db()
+
+    layout_path = app.config['LAYOUT_DATA_FILE_PATH']
+    if not os.path.exists(layout_path):
+        logger.warning(f"Layout file '{os.path.basename(layout_path)}' not found. Creating a new empty file.")
+        try:
+            with app.app_context():
+                with layout_lock():
+                    save_layout({"items": [], "background": {}})
+        except Exception as e:
+            logger.error(f"Could not create '{layout_path}': {e}")
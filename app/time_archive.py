@@ -0,0 +1,211 @@
+import os
+import sqlite3
+import logging
+from datetime import datetime, timedelta
+from flask import current_app
+from .db import get_db_connection
+
+logger = logging.getLogger(__name__)
+
+# Hot/cold split of cas_baza time_entries. archive_time_entries() moves old entries, and
+# the entries of DNIs of finished projects (packaging_status 'Ready'), into yearly
+# archive databases (CAS_ARCHIVE_FOLDER/cas_archive_<year>.db) and leaves one summary row
+# per (DNI, worker) behind in time_entry_summaries: entry count, last activity, last
+# completion and labour seconds. The view time_entries_all shows the summaries as
+# synthetic events next to the hot rows, so the worker, completion and forecast queries
+# read it instead of time_entries (time_entries_source()) and see the same answers.
+# Labour hours add the summarised seconds to the intervals of the hot rows.
+#
+# A labour interval runs from a 'Start' to that worker's next event, so an entry is only
+# moved if no 'Start' that stays behind ends on it, and a worker's last event stays when
+# it is a 'Start' (its interval isn't closed yet).
+
+_SUMMARY_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS time_entry_summaries (
+        ref_doc_no TEXT NOT NULL,
+        worker_no TEXT NOT NULL, -- '' for entries without a worker number
+        worker_name TEXT,
+        entries INTEGER NOT NULL,
+        first_event_at TIMESTAMP,
+        last_event_at TIMESTAMP,
+        completed_at TIMESTAMP, -- Last 'Zaključi', NULL if none was archived
+        labour_seconds REAL NOT NULL,
+        PRIMARY KEY (ref_doc_no, worker_no)
+    ) WITHOUT ROWID;
+    CREATE VIEW IF NOT EXISTS time_entries_all (worker_no, worker_name, event_datetime, event_type, ref_doc_no) AS
+        SELECT worker_no, worker_name, event_datetime, event_type, ref_doc_no FROM time_entries
+        UNION ALL
+        SELECT NULLIF(worker_no, ''), worker_name, last_event_at, 'Archived', ref_doc_no FROM time_entry_summaries
+        UNION ALL
+        SELECT NULLIF(worker_no, ''), worker_name, completed_at, 'Zaključi', ref_doc_no
+        FROM time_entry_summaries WHERE completed_at IS NOT NULL;
+"""
+
+_ARCHIVE_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS archive.time_entries (
+        id INTEGER PRIMARY KEY,
+        worker_no TEXT,
+        worker_name TEXT,
+        event_datetime TIMESTAMP,
+        event_type TEXT,
+        ref_doc_no TEXT
+    );
+    CREATE INDEX IF NOT EXISTS archive.idx_ref_doc_no ON time_entries (ref_doc_no);
+"""
+
+def time_entries_source(conn):
+    """The table to read clock events from: 'time_entries_all' once entries have been archived, else 'time_entries'."""
+    row = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'view' AND name = 'time_entries_all'").fetchone()
+    return 'time_entries_all' if row else 'time_entries'
+
+def get_archived_labour(conn):
+    """[(worker_no, ref_doc_no, worker_name, labour_seconds)] summarised by the archive ([] if never archived)."""
+    if time_entries_source(conn) == 'time_entries':
+        return []
+    cursor = conn.cursor()
+    cursor.row_factory = None
+    return cursor.execute("SELECT worker_no, ref_doc_no, worker_name, labour_seconds FROM time_entry_summaries").fetchall()
+
+def _finished_dnis():
+    """DNIs of projects whose electrification and control are both done (packaging_status 'Ready')."""
+    montaza_conn, main_conn = None, None
+    try:
+        montaza_conn = get_db_connection(current_app.config['VELIKA_MONTAZA_DB_PATH'])
+        if montaza_conn is None: raise sqlite3.OperationalError("Could not connect to montaza DB.")
+        projects = [row['project_task_no'] for row in montaza_conn.execute(
+            "SELECT project_task_no FROM project_notes WHERE packaging_status = 'Ready'"
+        )]
+        if not projects:
+            return set()
+        main_conn = get_db_connection(current_app.config['DATABASE_FILE_PATH'])
+        if main_conn is None: raise sqlite3.OperationalError("Could not connect to main DB.")
+        dnis = set()
+        for start in range(0, len(projects), 500): # Stay under SQLite's parameter limit
+            chunk = projects[start:start + 500]
+            dnis.update(row['work_order_no'] for row in main_conn.execute(
+                f"SELECT work_order_no FROM work_orders WHERE project_task_no IN ({','.join('?' * len(chunk))})", chunk
+            ) if row['work_order_no'])
+        return dnis
+    finally:
+        if montaza_conn: montaza_conn.close()
+        if main_conn: main_conn.close()
+
+def _plan(conn, horizon, finished_dnis, max_interval_seconds):
+    """
+    Walks every worker's events in time order and picks the entries to move.
+    Returns ({year: [id]}, {(ref_doc_no, worker_no): summary dict}).
+    """
+    cursor = conn.execute("""
+        SELECT id, COALESCE(worker_no, ''), worker_name, event_datetime, event_type, COALESCE(ref_doc_no, '')
+        FROM time_entries
+        WHERE event_datetime IS NOT NULL
+        ORDER BY COALESCE(worker_no, ''), event_datetime, id
+    """)
+    moves, summaries = {}, {}
+
+    def visit(event, following, previous_stays_start):
+        """Returns True if event moves. following is the worker's next event or None."""
+        entry_id, worker_no, worker_name, at, event_type, dni = event
+        is_start = event_type == 'Start'
+        if previous_stays_start or (is_start and following is None):
+            return False
+        if not (at < horizon or dni in finished_dnis):
+            return False
+        moves.setdefault(at[:4], []).append(entry_id)
+        if not dni:
+            return True # Without a DNI an entry only matters as an interval end, checked above
+        summary = summaries.setdefault((dni, worker_no), {
+            "worker_name": worker_name, "entries": 0, "first": at, "last": at, "completed": None, "seconds": 0.0
+        })
+        summary['entries'] += 1
+        summary['first'] = min(summary['first'], at)
+        if at >= summary['last']:
+            summary['last'], summary['worker_name'] = at, worker_name
+        if event_type == 'Zaključi':
+            summary['completed'] = max(summary['completed'] or at, at)
+        if is_start and following is not None:
+            # Same rule as labour.py: the interval ends at the worker's next event.
+            seconds = (datetime.fromisoformat(following[3]) - datetime.fromisoformat(at)).total_seconds()
+            if 0 < seconds <= max_interval_seconds:
+                summary['seconds'] += seconds
+        return True
+
+    previous, previous_stays_start = None, False
+    for event in cursor:
+        if previous is not None:
+            same_worker = event[1] == previous[1]
+            moved = visit(previous, event if same_worker else None, previous_stays_start)
+            previous_stays_start = same_worker and not moved and previous[4] == 'Start'
+        previous = event
+    if previous is not None:
+        visit(previous, None, previous_stays_start)
+    return moves, summaries
+
+def archive_time_entries(horizon_days=None, include_finished=True, dry_run=False):
+    """
+    Moves entries older than horizon_days (default CAS_ARCHIVE_HORIZON_DAYS) and, with
+    include_finished, every entry of a finished project's DNIs into the yearly archives.
+    Returns {"entries": moved, "summaries": summary rows written, "years": {year: entries}}.
+    """
+    horizon_days = current_app.config['CAS_ARCHIVE_HORIZON_DAYS'] if horizon_days is None else horizon_days
+    horizon = (datetime.now() - timedelta(days=horizon_days)).strftime('%Y-%m-%d %H:%M:%S')
+    finished_dnis = _finished_dnis() if include_finished else set()
+    cas_path = current_app.config['CAS_DATABASE_FILE_PATH']
+    archive_folder = current_app.config['CAS_ARCHIVE_FOLDER']
+    if not os.path.exists(cas_path):
+        raise FileNotFoundError(f"Database file not found at '{cas_path}'.")
+    # Raw strings for the timestamps (no detect_types): they are compared and copied as stored.
+    conn = sqlite3.connect(cas_path, timeout=30)
+    try:
+        moves, summaries = _plan(conn, horizon, finished_dnis, current_app.config['LABOUR_MAX_INTERVAL_HOURS'] * 3600)
+        result = {"entries": sum(len(ids) for ids in moves.values()), "summaries": len(summaries),
+                  "years": {year: len(ids) for year, ids in sorted(moves.items())}}
+        if dry_run or not moves:
+            return result
+
+        conn.executescript(_SUMMARY_SCHEMA)
+        conn.execute("CREATE TEMP TABLE archive_ids (id INTEGER PRIMARY KEY, year TEXT NOT NULL)")
+        conn.executemany("INSERT INTO temp.archive_ids (id, year) VALUES (?, ?)",
+                         ((entry_id, year) for year, ids in moves.items() for entry_id in ids))
+        conn.commit()
+
+        # 1. Copy into the yearly archives. Committed before anything is deleted; copying
+        # again after an interrupted run is harmless (same ids).
+        os.makedirs(archive_folder, exist_ok=True)
+        for year in sorted(moves):
+            conn.execute("ATTACH DATABASE ? AS archive", (os.path.join(archive_folder, f"cas_archive_{year}.db"),))
+            try:
+                conn.executescript(_ARCHIVE_SCHEMA)
+                conn.execute("""
+                    INSERT OR IGNORE INTO archive.time_entries (id, worker_no, worker_name, event_datetime, event_type, ref_doc_no)
+                    SELECT t.id, t.worker_no, t.worker_name, t.event_datetime, t.event_type, t.ref_doc_no
+                    FROM main.time_entries t JOIN temp.archive_ids a ON a.id = t.id
+                    WHERE a.year = ?
+                """, (year,))
+                conn.commit()
+            finally:
+                conn.execute("DETACH DATABASE archive")
+
+        # 2. Summaries and the delete in one transaction; merges with earlier runs.
+        conn.executemany("""
+            INSERT INTO time_entry_summaries
+                (ref_doc_no, worker_no, worker_name, entries, first_event_at, last_event_at, completed_at, labour_seconds)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (ref_doc_no, worker_no) DO UPDATE SET
+                worker_name = CASE WHEN excluded.last_event_at >= last_event_at THEN excluded.worker_name ELSE worker_name END,
+                entries = entries + excluded.entries,
+                first_event_at = MIN(first_event_at, excluded.first_event_at),
+                last_event_at = MAX(last_event_at, excluded.last_event_at),
+                completed_at = MAX(COALESCE(completed_at, excluded.completed_at), COALESCE(excluded.completed_at, completed_at)),
+                labour_seconds = labour_seconds + excluded.labour_seconds
+        """, [
+            (dni, worker_no, s['worker_name'], s['entries'], s['first'], s['last'], s['completed'], s['seconds'])
+            for (dni, worker_no), s in summaries.items()
+        ])
+        conn.execute("DELETE FROM time_entries WHERE id IN (SELECT id FROM temp.archive_ids)")
+        conn.commit()
+        logger.info(f"Archived {result['entries']} time entries into {len(moves)} yearly archive(s).",
+                    extra={'database': os.path.basename(cas_path)})
+        return result
+    finally:
+        conn.close()
@@ -5,6 +5,7 @@ from flask import (
 from werkzeug.security import generate_password_hash
 from .auth import admin_required
 from .db import get_db_connection
+from .maintenance import start_maintenance, maintenance_running, get_maintenance_runs
 
 # All routes here will be prefixed with /api/admin
 bp = Blueprint('admin', __name__, url_prefix='/api/admin')
@@ -34,7 +35,7 @@ def create_new_user():
     if role not in ['admin', 'viewer']:
         return jsonify({"status": "error", "message": "Invalid role"}), 400
     
-    password_hash = generate_password_hash(password)
+    password_hash = generate_password_hash(password, current_app.config['PASSWORD_HASH_METHOD'])
     conn = None
     try:
         conn = get_db_connection(current_app.config['VELIKA_MONTAZA_DB_PATH'])
@@ -65,7 +66,7 @@ def update_user(user_id):
         if conn is None: raise sqlite3.OperationalError("Could not connect to montaza DB.")
         
         if password:
-            password_hash = generate_password_hash(password)
+            password_hash = generate_password_hash(password, current_app.config['PASSWORD_HASH_METHOD'])
             conn.execute("UPDATE users SET role = ?, password_hash = ? WHERE id = ?",
                          (role, password_hash, user_id))
         else:
@@ -100,4 +101,32 @@ def delete_user(user_id):
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
     finally:
-        if conn: conn.close()
\ No newline at end of file
+        if conn: conn.close()
+
+@bp.route('/maintenance', methods=['GET'])
+@admin_required
+def get_maintenance():
+    """Recent database maintenance runs (one entry per database per run) and the nightly window."""
+    try:
+        limit = max(1, min(int(request.args.get('limit', current_app.config['MAINTENANCE_RUNS_LIMIT'])), 500))
+    except ValueError:
+        return jsonify({"status": "error", "message": "limit must be an integer"}), 400
+    try:
+        return jsonify({"runs": get_maintenance_runs(limit), "window_hours": list(current_app.config['MAINTENANCE_WINDOW_HOURS']),
+                        "running": maintenance_running()})
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+@bp.route('/maintenance/run', methods=['POST'])
+@admin_required
+def run_maintenance_now():
+    """
+    Starts the database maintenance now instead of waiting for the window. It runs in the
+    background (202); poll GET /maintenance for the runs. 409 while a run is in progress.
+    """
+    try:
+        if not start_maintenance(current_app._get_current_object()):
+            return jsonify({"status": "error", "message": "Database maintenance is already running."}), 409
+        return jsonify({"status": "accepted", "message": "Database maintenance started."}), 202
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 500
@@ -0,0 +1,61 @@
+import os
+import logging
+from flask import (
+    Blueprint, jsonify
+)
+from .auth import login_required
+from .labour import get_labour_data, get_project_dnis
+from .forecast import get_worker_forecasts
+
+logger = logging.getLogger(__name__)
+
+# All routes here will be prefixed with /api
+bp = Blueprint('analytics', __name__, url_prefix='/api')
+
+@bp.route('/project/<project_id>/labour')
+@login_required
+def get_project_labour(project_id):
+    """Labour hours for a project: total, per DNI and per worker (from cas_baza time entries)."""
+    try:
+        project_id = os.path.basename(project_id)
+        labour = get_labour_data()
+        if labour is None:
+            return jsonify({"error": "Labour analytics unavailable (needs numpy and cas_baza.db)."}), 501
+        dnis = get_project_dnis(project_id)
+        per_dni, workers = labour.for_dnis([wo[0] for wo in dnis])
+        return jsonify({
+            "project": project_id,
+            "total_hours": round(sum(per_dni.values()), 2),
+            "dnis": [
+                {"work_order_no": wo_no, "description": description, "work_center": work_center, "hours": per_dni.get(wo_no, 0.0)}
+                for wo_no, description, work_center in dnis
+            ],
+            "workers": workers
+        })
+    except Exception as e:
+        logger.error(f"Error computing labour for {project_id}: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@bp.route('/labour/workers')
+@login_required
+def get_worker_labour():
+    """Total labour hours per worker over all DNIs."""
+    try:
+        labour = get_labour_data()
+        if labour is None:
+            return jsonify({"error": "Labour analytics unavailable (needs numpy and cas_baza.db)."}), 501
+        return jsonify(labour.workers_total())
+    except Exception as e:
+        logger.error(f"Error computing worker labour: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@bp.route('/forecast/workers')
+@login_required
+def get_worker_forecast():
+    """Per-worker completion forecast: queued projects, remaining DNIs, rate and expected finish."""
+    try:
+        workers, computed_at = get_worker_forecasts()
+        return jsonify({"computed_at": computed_at, "workers": workers})
+    except Exception as e:
+        logger.error(f"Error fetching worker forecasts: {e}")
+        return jsonify({"error": str(e)}), 500
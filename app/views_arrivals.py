@@ -0,0 +1,93 @@
+import logging
+from flask import (
+    Blueprint, jsonify, request, session, current_app
+)
+from .auth import login_required
+from .layout_store import load_layout
+from .arrivals import (
+    get_unseen_for_user, get_unseen_for_group, mark_seen_for_user, mark_seen_for_group
+)
+
+logger = logging.getLogger(__name__)
+
+# All routes here will be prefixed with /api
+bp = Blueprint('arrivals', __name__, url_prefix='/api')
+
+def _limit_arg():
+    try:
+        return max(1, min(int(request.args.get('limit', current_app.config['ARRIVALS_FEED_LIMIT'])), 1000))
+    except ValueError:
+        return current_app.config['ARRIVALS_FEED_LIMIT']
+
+def _keys_from_body():
+    """Returns (arrival_keys or None for 'all', error response or None)."""
+    data = request.get_json(silent=True) or {}
+    if data.get('all'):
+        return None, None
+    keys = data.get('arrival_keys')
+    if not isinstance(keys, list) or not all(isinstance(key, str) for key in keys):
+        return None, (jsonify({"status": "error", "message": "Send 'arrival_keys' (list) or 'all': true"}), 400)
+    return keys, None
+
+@bp.route('/arrivals/unseen')
+@login_required
+def get_user_arrivals():
+    """
+    Arrivals the current user hasn't marked seen. By default only for projects the user
+    owns in the layout; ?scope=all covers every project.
+    """
+    username = session.get('username')
+    try:
+        project_ids = None
+        if request.args.get('scope') != 'all':
+            project_ids = [
+                item.get('name') for item in load_layout().get('items', [])
+                if item.get('type') == 'project' and item.get('name') and item.get('owner') == username
+            ]
+        items, total = get_unseen_for_user(username, project_ids, _limit_arg())
+        return jsonify({"items": items, "total_unseen": total})
+    except Exception as e:
+        logger.error(f"Error fetching arrivals for {username}: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@bp.route('/arrivals/seen', methods=['POST'])
+@login_required
+def mark_user_arrivals_seen():
+    """Marks arrivals seen for the current user: {"arrival_keys": [...]} or {"all": true}."""
+    username = session.get('username')
+    keys, error = _keys_from_body()
+    if error: return error
+    try:
+        if keys is None:
+            # Everything currently in the user's full feed
+            unseen, _ = get_unseen_for_user(username, None, limit=-1)
+            keys = [item['arrival_key'] for item in unseen]
+        marked = mark_seen_for_user(username, keys)
+        return jsonify({"status": "success", "marked": marked})
+    except Exception as e:
+        logger.error(f"Error marking arrivals seen for {username}: {e}")
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+@bp.route('/groups/<group_name>/arrivals/unseen')
+@login_required
+def get_group_arrivals(group_name):
+    """Arrivals for a skladisce group's projects not yet marked seen on the shared warehouse screen."""
+    try:
+        items, total = get_unseen_for_group(group_name, _limit_arg())
+        return jsonify({"group": group_name, "items": items, "total_unseen": total})
+    except Exception as e:
+        logger.error(f"Error fetching arrivals for group {group_name}: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@bp.route('/groups/<group_name>/arrivals/seen', methods=['POST'])
+@login_required
+def mark_group_arrivals_seen(group_name):
+    """Sets the shared seen flag: {"arrival_keys": [...]} or {"all": true} for the whole group."""
+    keys, error = _keys_from_body()
+    if error: return error
+    try:
+        marked = mark_seen_for_group(group_name, keys)
+        return jsonify({"status": "success", "marked": marked})
+    except Exception as e:
+        logger.error(f"Error marking arrivals seen for group {group_name}: {e}")
+        return jsonify({"status": "error", "message": str(e)}), 500
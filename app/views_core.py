@@ -1,15 +1,26 @@
 import os
 import json
+import base64
+import bisect
+import math
+import binascii
+import logging
 from datetime import datetime
 from flask import (
-    Blueprint, jsonify, request, send_from_directory, current_app
+    Blueprint, jsonify, request, send_from_directory, current_app,
+    Response, stream_with_context
 )
 from .auth import login_required, admin_required # Import decorators from auth.py
-from .helpers import ( # Import helpers from helpers.py
-    get_project_statuses_from_db, get_completion_data_from_db,
-    get_latest_worker_from_cas_db, get_photo_info_from_db,
-    check_notes_existence_from_db, get_task_display_status
+from .helpers import build_layout_payload # Import helpers from helpers.py
+from .planning import (
+    PLANNING_FIELDS, get_layout_project_info, build_planning_rows,
+    filter_planning_projects, iter_planning_rows, planning_project_ids
 )
+from .exporters import iter_csv, iter_xlsx
+from .public_cache import public_endpoint
+from .work_centers import work_centers_arg
+
+logger = logging.getLogger(__name__)
 
 # Create a Blueprint named 'core'. Routes defined here will be accessible
 # without a specific prefix (like / or /planning) unless added in the route decorator.
@@ -56,143 +67,166 @@ def serve_uploaded_file(project_id, filename):
 @bp.route('/api/layout_data')
 @login_required # Requires login to fetch layout data.
 def get_layout_data():
-    """Fetches layout data from JSON and combines it with project statuses from DB."""
+    """
+    Fetches layout data from JSON and combines it with project statuses from DB.
+    Optional ?bbox=min_x,min_y,max_x,max_y (layout coordinates) and ?zoom= limit the
+    response, and the status lookups, to the items visible in that viewport.
+    ?work_center= picks the centers behind each item's status and can_be_made.
+    """
+    work_centers, error = work_centers_arg()
+    if error: return error
+    bbox = None
+    if request.args.get('bbox'):
+        try:
+            min_x, min_y, max_x, max_y = [float(v) for v in request.args['bbox'].split(',')]
+            zoom = float(request.args.get('zoom', 1))
+        except ValueError:
+            return jsonify({"error": "bbox must be 'min_x,min_y,max_x,max_y' and zoom a number"}), 400
+        # float() also accepts 'nan' and 'inf', which the grid index can't place.
+        if not all(math.isfinite(v) for v in (min_x, min_y, max_x, max_y, zoom)) or min_x > max_x or min_y > max_y or zoom <= 0:
+            return jsonify({"error": "Invalid bbox or zoom"}), 400
+        # Pad by a fixed on-screen margin, so small pans don't reveal missing cards.
+        margin = current_app.config['LAYOUT_VIEWPORT_MARGIN_PX'] / zoom
+        bbox = (min_x - margin, min_y - margin, max_x + margin, max_y + margin)
     try:
-        # Get the full path to the layout JSON file from config.
-        layout_path = current_app.config['LAYOUT_DATA_FILE_PATH']
-        # If the file doesn't exist, create an empty one.
-        if not os.path.exists(layout_path):
-            print(f"Warning: Layout file not found. Creating an empty one.")
-            with open(layout_path, 'w', encoding='utf-8') as f:
-                json.dump({"items": [], "background": {}}, f, indent=4)
-        
-        # Read the layout data from the JSON file.
-        with open(layout_path, 'r', encoding='utf-8') as f: data = json.load(f)
-        # Add the current server time to the data.
-        data['server_timestamp'] = datetime.now().strftime('%H:%M:%S')
-
-        # Get a list of project IDs that are present in the layout file.
-        project_ids_in_layout = [item['name'] for item in data.get('items', []) if item.get('type') == 'project']
-
-        # If there are projects in the layout, fetch their statuses and details.
-        if project_ids_in_layout:
-            # Fetch DNI completion statuses using the helper function.
-            statuses = get_project_statuses_from_db(project_ids_in_layout)
-            # Fetch task completion data (electrification, control, etc.) using the helper.
-            completion_data = get_completion_data_from_db(project_ids_in_layout)
-            # Fetch the latest worker associated with each project using the helper.
-            latest_workers = get_latest_worker_from_cas_db(project_ids_in_layout)
-
-            # Iterate through the items in the layout data again.
-            for item in data.get('items', []):
-                # If the item is a project...
-                if item.get('type') == 'project':
-                    name = item.get('name')
-                    # Add its DNI status if found.
-                    if name in statuses: item['status'] = statuses[name]
-                    # Add its task completion data if found.
-                    if name in completion_data: item.update(completion_data[name])
-                    # Update its 'details' field with the latest worker if found.
-                    if name in latest_workers:
-                        item['details'] = latest_workers[name]
+        # Build the enriched layout (shared with the ASGI layout stream).
+        data = build_layout_payload(bbox, work_centers)
         # Return the combined data as JSON.
         return jsonify(data)
     except Exception as e:
         # Log any errors and return a server error response.
-        print(f"Error fetching layout data: {e}")
+        logger.error(f"Error fetching layout data: {e}")
         return jsonify({"error": str(e)}), 500
 
+def _encode_cursor(name):
+    return base64.urlsafe_b64encode(name.encode('utf-8')).decode('ascii')
+
+def _decode_cursor(cursor):
+    return base64.b64decode(cursor.encode('ascii'), altchars=b'-_', validate=True).decode('utf-8')
+
+def _csv_arg(name):
+    """Comma-separated query argument as a set (None if absent)."""
+    value = request.args.get(name)
+    if value is None:
+        return None
+    return {part.strip() for part in value.split(',') if part.strip()}
+
 @bp.route('/api/planning_data')
 # @login_required # Uncomment if planning data requires login
+@public_endpoint
 def get_planning_data():
-    """Gathers comprehensive data ONLY for projects PRESENT IN THE LAYOUT."""
+    """
+    Gathers comprehensive data ONLY for projects PRESENT IN THE LAYOUT.
+    Optional: ?fields=name,priority,... (only the helpers those fields need are queried),
+    ?owner=, ?priority= (comma-separated), ?paused=true|false, and ?limit= / ?cursor= for
+    keyset pagination, which returns {"items": [...], "next_cursor": ...} instead of a list.
+    ?work_center= picks the centers behind status_percentage and can_be_made.
+    """
+    work_centers, error = work_centers_arg()
+    if error: return error
+    requested_fields = _csv_arg('fields')
+    if requested_fields is None:
+        fields = PLANNING_FIELDS
+    else:
+        unknown = requested_fields - set(PLANNING_FIELDS)
+        if unknown:
+            return jsonify({"error": f"Unknown fields: {', '.join(sorted(unknown))}"}), 400
+        # Keep the canonical order; name is always included as the row key.
+        fields = tuple(f for f in PLANNING_FIELDS if f in requested_fields or f == 'name')
+    paused = request.args.get('paused')
+    if paused is not None:
+        if paused.lower() not in ('true', 'false', '1', '0'):
+            return jsonify({"error": "paused must be true or false"}), 400
+        paused = paused.lower() in ('true', '1')
+    paginate = 'limit' in request.args or 'cursor' in request.args
+    try:
+        limit = min(int(request.args.get('limit', current_app.config['PLANNING_PAGE_SIZE'])), current_app.config['PLANNING_MAX_PAGE_SIZE'])
+        after = _decode_cursor(request.args['cursor']) if request.args.get('cursor') else None
+    except (ValueError, UnicodeDecodeError, binascii.Error):
+        return jsonify({"error": "limit must be an integer and cursor a value returned as next_cursor"}), 400
+    if limit < 1:
+        return jsonify({"error": "limit must be at least 1"}), 400
+
     try:
-        # Get the path to the layout file.
-        layout_path = current_app.config['LAYOUT_DATA_FILE_PATH']
-        projects_in_layout_info = {} # Store owner and manually set details.
-        project_ids_in_layout = [] # List of project names found in the layout.
-        
-        # Check if the layout file exists.
-        if os.path.exists(layout_path):
-            try:
-                # Read the layout file content.
-                with open(layout_path, 'r', encoding='utf-8') as f:
-                    layout_data_content = json.load(f)
-                    # Loop through items to find projects.
-                    for item in layout_data_content.get('items', []):
-                        if item.get('type') == 'project':
-                            project_name = item.get('name')
-                            if project_name:
-                                # Store details and owner from the layout item.
-                                projects_in_layout_info[project_name] = {
-                                    'details': item.get('details', 'N/A'),
-                                    'owner': item.get('owner', None)
-                                }
-                                project_ids_in_layout.append(project_name)
-            except json.JSONDecodeError:
-                # Handle error if the JSON is invalid.
-                return jsonify({"error": "Invalid JSON in layout file."}), 500
-        else:
-            # If layout file doesn't exist, return empty list.
-            return jsonify([])
-        
-        # If no projects were found in the layout, return empty list.
-        if not project_ids_in_layout: return jsonify([])
-
-        # Sort the project IDs alphabetically.
-        project_ids_in_layout.sort()
-        # Fetch various data points for these projects using helper functions.
-        dni_statuses = get_project_statuses_from_db(project_ids_in_layout)
-        completion_data = get_completion_data_from_db(project_ids_in_layout)
-        photo_info = get_photo_info_from_db(project_ids_in_layout)
-        notes_existence = check_notes_existence_from_db(project_ids_in_layout)
-        latest_workers = get_latest_worker_from_cas_db(project_ids_in_layout)
-
-        planning_list = [] # List to hold the final data for each project.
-        # Iterate through the projects found in the layout.
-        for proj_id in project_ids_in_layout:
-            # Get the fetched data for the current project ID, defaulting to empty dicts.
-            comp_info = completion_data.get(proj_id, {})
-            p_info = photo_info.get(proj_id, {})
-            layout_info = projects_in_layout_info.get(proj_id, {})
-            
-            # Collect all relevant timestamps to find the most recent update.
-            timestamps = [
-                comp_info.get('electrification_completed_at'),
-                comp_info.get('control_completed_at'),
-                comp_info.get('last_note_updated_at'),
-                comp_info.get('last_dni_updated_at'),
-                p_info.get('last_photo_upload')
-            ]
-            valid_timestamps = [ts for ts in timestamps if ts] # Filter out None values.
-            last_updated = max(valid_timestamps) if valid_timestamps else None # Find the latest timestamp.
-            
-            # Prioritize worker name from CAS DB, fallback to layout details.
-            worker_name = latest_workers.get(proj_id, layout_info.get('details', 'N/A'))
-
-            # Construct the data object for the planning view for this project.
-            proj_data = {
-                "name": proj_id,
-                "worker": worker_name,
-                "owner": layout_info.get('owner', None),
-                "status_percentage": dni_statuses.get(proj_id, {}).get('percentage', 0),
-                "priority": comp_info.get('priority', 'Low'),
-                "pause_status": comp_info.get('pause_status', None),
-                "electrification_status": get_task_display_status(comp_info, 'electrification'),
-                "control_status": get_task_display_status(comp_info, 'control'),
-                "packaging_status": comp_info.get('packaging_status', None),
-                "has_notes": notes_existence.get(proj_id, False),
-                "photo_count": p_info.get('photo_count', 0),
-                "last_updated_at": last_updated
-            }
-            planning_list.append(proj_data)
+        try:
+            # Read the layout (cached per process) and collect owner and details per project.
+            projects_in_layout_info = get_layout_project_info()
+        except json.JSONDecodeError:
+            # Handle error if the JSON is invalid.
+            return jsonify({"error": "Invalid JSON in layout file."}), 500
+
+        # Sorted project IDs; the cursor is the last name of the previous page.
+        project_ids = sorted(projects_in_layout_info)
+        if after is not None:
+            project_ids = project_ids[bisect.bisect_right(project_ids, after):]
+        project_ids, completion_data = filter_planning_projects(
+            project_ids, projects_in_layout_info,
+            owners=_csv_arg('owner'), priorities=_csv_arg('priority'), paused=paused
+        )
+
+        next_cursor = None
+        if paginate:
+            if len(project_ids) > limit:
+                next_cursor = _encode_cursor(project_ids[limit - 1])
+            project_ids = project_ids[:limit]
+
+        # Build the planning rows with the shared helpers (only those the fields need).
+        planning_list = build_planning_rows(project_ids, projects_in_layout_info, fields, completion_data, work_centers)
+        if paginate:
+            return jsonify({"items": planning_list, "next_cursor": next_cursor})
         # Return the list of project data for the planning view.
         return jsonify(planning_list)
     except Exception as e:
         # Log errors and return a server error response.
-        print(f"Error fetching planning data: {e}")
+        logger.error(f"Error fetching planning data: {e}")
         return jsonify({"error": str(e)}), 500
 
+def _planning_export_rows(scope, work_centers):
+    """Row tuples for the planning exports, computed batch by batch (see app/planning.py)."""
+    projects_in_layout_info = get_layout_project_info()
+    project_ids = planning_project_ids(scope, projects_in_layout_info)
+    batch_size = current_app.config['EXPORT_BATCH_SIZE']
+    for row in iter_planning_rows(project_ids, projects_in_layout_info, batch_size, work_centers):
+        yield tuple(row[field] for field in PLANNING_FIELDS)
+
+def _export_filename(prefix, extension):
+    return f"{prefix}_{datetime.now().strftime('%Y%m%d_%H%M')}.{extension}"
+
+@bp.route('/api/planning_data.csv')
+# @login_required # Same access as /api/planning_data
+@public_endpoint # Rate limited only: streamed responses are never cached
+def export_planning_csv():
+    """
+    Streams the planning data as CSV. ?scope=all exports every project in projekti_baza
+    instead of only the layout; ?delimiter=; suits Excel with a decimal-comma locale.
+    ?work_center= applies as for /api/planning_data.
+    """
+    scope = request.args.get('scope', 'layout')
+    delimiter = request.args.get('delimiter', ',')
+    if scope not in ('layout', 'all') or delimiter not in (',', ';'):
+        return jsonify({"error": "scope must be 'layout' or 'all' and delimiter ',' or ';'"}), 400
+    work_centers, error = work_centers_arg()
+    if error: return error
+    body = iter_csv(PLANNING_FIELDS, _planning_export_rows(scope, work_centers), delimiter=delimiter)
+    return Response(stream_with_context(body), mimetype='text/csv', headers={
+        "Content-Disposition": f"attachment; filename={_export_filename('planning', 'csv')}"
+    })
+
+@bp.route('/api/planning_data.xlsx')
+# @login_required # Same access as /api/planning_data
+@public_endpoint # Rate limited only: streamed responses are never cached
+def export_planning_xlsx():
+    """Streams the planning data as an Excel workbook (?scope=all as for the CSV export)."""
+    scope = request.args.get('scope', 'layout')
+    if scope not in ('layout', 'all'):
+        return jsonify({"error": "scope must be 'layout' or 'all'"}), 400
+    work_centers, error = work_centers_arg()
+    if error: return error
+    body = iter_xlsx(PLANNING_FIELDS, _planning_export_rows(scope, work_centers), sheet_name='Planning')
+    return Response(stream_with_context(body), mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', headers={
+        "Content-Disposition": f"attachment; filename={_export_filename('planning', 'xlsx')}"
+    })
+
 @bp.route('/api/get_image')
 @login_required # Requires login to fetch background image.
 def get_image():
@@ -208,7 +242,7 @@ def get_image():
         return send_from_directory(current_app.config['APP_ROOT'], filename)
     else:
         # Log warning if image not found.
-        print(f"Warning: Image not found at {image_path}")
+        logger.warning(f"Image not found at {image_path}")
         return "Image not found", 404
 
 # --- NEW Static File Serving Routes ---
@@ -1,45 +1,61 @@
 import os
 import json
+import math
 from flask import (
-    Blueprint, jsonify, request, session, current_app
+    Blueprint, jsonify, request, session
 )
 import sqlite3
 from .auth import login_required, admin_required
-from .db import get_db_connection
 from .helpers import check_layout_item_ownership, get_latest_worker_from_cas_db
+from .layout_store import layout_lock, load_layout, layout_project_names
+from .layout_rtree import resolve_placement, find_free_slot, save_layout_and_mirror
+from .catalog import get_all_projects, search_projects
 
 # All routes in this file will be prefixed with /api
 bp = Blueprint('layout', __name__, url_prefix='/api')
 
+def _is_coordinate(value):
+    """True for a finite JSON number (not a string or a bool)."""
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)
+
 @bp.route('/available_projects')
 @login_required
 def get_available_projects():
-    """Gets a list of projects from the DB that are not in the layout file."""
-    conn = None
+    """
+    Gets the projects from the DB that are not in the layout file (sorted list of names).
+    With ?q=, ?limit=, ?offset=, ?match=prefix|substring or ?include_layout=1 it returns a page
+    instead: {"items": [{"name", "in_layout"}], "total", "offset", "limit"}.
+    """
     try:
-        conn = get_db_connection(current_app.config['DATABASE_FILE_PATH'])
-        if conn is None: raise sqlite3.OperationalError("Could not connect to main DB.")
-        
-        all_db_projects = {row['project_task_no'] for row in conn.execute("SELECT DISTINCT project_task_no FROM work_orders")}
-        
-        layout_path = current_app.config['LAYOUT_DATA_FILE_PATH']
         projects_in_layout = set()
-        if os.path.exists(layout_path):
-            try:
-                with open(layout_path, 'r', encoding='utf-8') as f:
-                    layout_data = json.load(f)
-                    projects_in_layout = {item['name'] for item in layout_data.get('items', []) if item.get('type') == 'project'}
-            except (json.JSONDecodeError, FileNotFoundError):
-                pass # Ignore if file is bad, just return full list
-        
-        available_projects = sorted(list(all_db_projects - projects_in_layout))
-        return jsonify(available_projects)
+        try:
+            projects_in_layout = set(layout_project_names(load_layout()))
+        except json.JSONDecodeError:
+            pass # Ignore if file is bad, just return full list
+
+        paged_args = ('q', 'limit', 'offset', 'match', 'include_layout')
+        if not any(arg in request.args for arg in paged_args):
+            return jsonify([name for name in get_all_projects() if name not in projects_in_layout])
+
+        match = request.args.get('match', 'prefix')
+        if match not in ('prefix', 'substring'):
+            return jsonify({"error": "match must be 'prefix' or 'substring'"}), 400
+        try:
+            limit = min(int(request.args.get('limit', 50)), 500)
+            offset = max(int(request.args.get('offset', 0)), 0)
+        except ValueError:
+            return jsonify({"error": "limit and offset must be integers"}), 400
+        include_layout = request.args.get('include_layout') in ('1', 'true')
+
+        matches = search_projects(request.args.get('q', ''), match)
+        if not include_layout:
+            matches = [name for name in matches if name not in projects_in_layout]
+        page = [{"name": name, "in_layout": name in projects_in_layout} for name in matches[offset:offset + limit]]
+        return jsonify({"items": page, "total": len(matches), "offset": offset, "limit": limit})
     except sqlite3.OperationalError as e:
         return jsonify({"error": f"Database error: {e}"}), 500
     except Exception as e:
         return jsonify({"error": str(e)}), 500
-    finally:
-        if conn: conn.close()
 
 @bp.route('/add_project_to_layout', methods=['POST'])
 @admin_required
@@ -52,34 +68,38 @@ def add_project_to_layout():
 
     if not all([project_name, x is not None, y is not None]):
         return jsonify({"status": "error", "message": "Missing data"}), 400
+    if not (_is_coordinate(x) and _is_coordinate(y)):
+        return jsonify({"status": "error", "message": "x and y must be numbers"}), 400
     
-    layout_path = current_app.config['LAYOUT_DATA_FILE_PATH']
     try:
-        layout_data = {"items": [], "background": {}}
-        if os.path.exists(layout_path):
+        # Look up the worker before taking the lock; it only needs the databases.
+        initial_worker = get_latest_worker_from_cas_db([project_name]).get(project_name, "")
+
+        with layout_lock():
+            layout_data = {"items": [], "background": {}}
             try:
-                with open(layout_path, 'r', encoding='utf-8') as f:
-                    layout_data = json.load(f)
+                layout_data = load_layout()
             except json.JSONDecodeError:
                 pass # Start with fresh data
-        
-        if any(item.get('name') == project_name for item in layout_data.get('items', []) if item.get('type') == 'project'):
-            return jsonify({"status": "error", "message": "Project already exists in layout"}), 409
+            
+            if project_name in layout_project_names(layout_data):
+                return jsonify({"status": "error", "message": "Project already exists in layout"}), 409
 
-        initial_worker = get_latest_worker_from_cas_db([project_name]).get(project_name, "")
-        
-        new_project = {
-            "type": "project", "name": project_name,
-            "details": initial_worker, "image_path": None,
-            "pinned": False, "status": {}, "width": 270, "height": 90, "x": x, "y": y,
-            "owner": current_user
-        }
-        layout_data.setdefault('items', []).append(new_project)
-        
-        with open(layout_path, 'w', encoding='utf-8') as f:
-            json.dump(layout_data, f, indent=4)
+            # Reject or snap drops that overlap another card (R*Tree lookup).
+            placement, error = resolve_placement(layout_data, project_name, x, y, 270, 90, data.get('on_overlap'))
+            if error: return error
+            x, y, snapped = placement
+
+            new_project = {
+                "type": "project", "name": project_name,
+                "details": initial_worker, "image_path": None,
+                "pinned": False, "status": {}, "width": 270, "height": 90, "x": x, "y": y,
+                "owner": current_user
+            }
+            layout_data.setdefault('items', []).append(new_project)
+            save_layout_and_mirror(layout_data, project_name)
         
-        return jsonify({"status": "success"})
+        return jsonify({"status": "success", "x": x, "y": y, "snapped": snapped})
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
 
@@ -89,24 +109,19 @@ def remove_project_from_layout(project_id):
     """Removes a project from the layout JSON file."""
     project_id = os.path.basename(project_id)
     current_user = session.get('username')
-    layout_path = current_app.config['LAYOUT_DATA_FILE_PATH']
     try:
-        layout_data = {"items": [], "background": {}}
-        if os.path.exists(layout_path):
+        with layout_lock():
             try:
-                with open(layout_path, 'r', encoding='utf-8') as f:
-                    layout_data = json.load(f)
+                layout_data = load_layout()
             except json.JSONDecodeError:
                 return jsonify({"status": "error", "message": "Corrupt layout file."}), 500
-        
-        item_to_remove, error = check_layout_item_ownership(project_id, layout_data, current_user)
-        if error: return error
-        
-        updated_items = [item for item in layout_data.get('items', []) if not (item.get('type') == 'project' and item.get('name') == project_id)]
-        layout_data['items'] = updated_items
-        
-        with open(layout_path, 'w', encoding='utf-8') as f:
-            json.dump(layout_data, f, indent=4)
+            
+            item_to_remove, error = check_layout_item_ownership(project_id, layout_data, current_user)
+            if error: return error
+            
+            updated_items = [item for item in layout_data.get('items', []) if not (item.get('type') == 'project' and item.get('name') == project_id)]
+            layout_data['items'] = updated_items
+            save_layout_and_mirror(layout_data, project_id)
         
         return jsonify({"status": "success"})
     except Exception as e:
@@ -122,28 +137,57 @@ def move_project_in_layout():
 
     if not all([project_name, x is not None, y is not None]):
         return jsonify({"status": "error", "message": "Missing data"}), 400
+    if not (_is_coordinate(x) and _is_coordinate(y)):
+        return jsonify({"status": "error", "message": "x and y must be numbers"}), 400
     
     project_name = os.path.basename(project_name)
     current_user = session.get('username')
-    layout_path = current_app.config['LAYOUT_DATA_FILE_PATH']
     try:
-        layout_data = {"items": [], "background": {}}
-        if os.path.exists(layout_path):
+        with layout_lock():
             try:
-                with open(layout_path, 'r', encoding='utf-8') as f:
-                    layout_data = json.load(f)
+                layout_data = load_layout()
             except json.JSONDecodeError:
                 return jsonify({"status": "error", "message": "Corrupt layout file."}), 500
+            
+            item_to_move, error = check_layout_item_ownership(project_name, layout_data, current_user)
+            if error: return error
+
+            # Reject or snap drops that overlap another card (R*Tree lookup).
+            placement, error = resolve_placement(layout_data, project_name, x, y,
+                                                 item_to_move.get('width') or 270, item_to_move.get('height') or 90,
+                                                 data.get('on_overlap'))
+            if error: return error
+            x, y, snapped = placement
+            
+            item_to_move['x'] = x
+            item_to_move['y'] = y
+            save_layout_and_mirror(layout_data, project_name)
         
-        item_to_move, error = check_layout_item_ownership(project_name, layout_data, current_user)
-        if error: return error
-        
-        item_to_move['x'] = x
-        item_to_move['y'] = y
-        
-        with open(layout_path, 'w', encoding='utf-8') as f:
-            json.dump(layout_data, f, indent=4)
-        
-        return jsonify({"status": "success"})
+        return jsonify({"status": "success", "x": x, "y": y, "snapped": snapped})
     except Exception as e:
-        return jsonify({"status": "error", "message": str(e)}), 500
\ No newline at end of file
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+@bp.route('/layout/free_slot')
+@login_required
+def get_free_layout_slot():
+    """Suggests the nearest position around ?x=&y= where a card (?width=&height=, default 270x90) fits without overlap."""
+    try:
+        x, y = float(request.args['x']), float(request.args['y'])
+        width = float(request.args.get('width', 270))
+        height = float(request.args.get('height', 90))
+    except (KeyError, ValueError):
+        return jsonify({"status": "error", "message": "x and y are required numbers"}), 400
+    if not all(math.isfinite(v) for v in (x, y, width, height)) or width <= 0 or height <= 0:
+        return jsonify({"status": "error", "message": "x, y, width and height must be finite (width and height positive)"}), 400
+    project_name = request.args.get('project_name') # Ignore this card itself when it is being moved
+    try:
+        # Read-only: no layout_lock(), so suggestions never hold up layout writes.
+        layout_data = load_layout()
+        slot = find_free_slot(layout_data, x, y, width, height, project_name)
+        if slot is None:
+            return jsonify({"status": "error", "message": "No free slot found nearby"}), 404
+        return jsonify({"status": "success", "x": slot[0], "y": slot[1]})
+    except json.JSONDecodeError:
+        return jsonify({"status": "error", "message": "Corrupt layout file."}), 500
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 500
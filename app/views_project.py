@@ -2,13 +2,23 @@ import os
 import json
 import uuid
 import sqlite3
+import logging
+from contextlib import nullcontext
 from datetime import datetime, timezone
 from flask import (
-    Blueprint, jsonify, request, session, current_app
+    Blueprint, jsonify, request, session, current_app,
+    Response, stream_with_context
 )
 from .auth import login_required, admin_required
 from .db import get_db_connection
 from .helpers import check_layout_item_ownership, update_project_status, get_project_inventory_status
+from .layout_store import layout_lock, load_layout, save_layout
+from .exporters import iter_csv
+from .public_cache import public_endpoint
+from .work_centers import work_centers_arg, sql_placeholders
+from .time_archive import time_entries_source
+
+logger = logging.getLogger(__name__)
 
 # All routes here will be prefixed with /api
 # e.g., @bp.route('/project/<id>/...') becomes /api/project/<id>/...
@@ -25,9 +35,8 @@ def upload_project_photo(project_id):
     if file.filename == '': return jsonify({"status": "error", "message": "No selected file"}), 400
     
     current_user = session.get('username')
-    layout_path = current_app.config['LAYOUT_DATA_FILE_PATH']
     try:
-        with open(layout_path, 'r', encoding='utf-8') as f: layout_data = json.load(f)
+        layout_data = load_layout()
     except Exception: layout_data = {}
     
     item, error = check_layout_item_ownership(project_id, layout_data, current_user)
@@ -63,9 +72,7 @@ def get_project_photos(project_id):
         project_id = os.path.basename(project_id)
         conn = get_db_connection(current_app.config['VELIKA_MONTAZA_DB_PATH'])
         if conn is None: raise sqlite3.OperationalError("Could not connect to montaza DB.")
-        photos = conn.execute("SELECT filename, uploaded_at FROM project_photos WHERE project_task_no = ? ORDER BY uploaded_at DESC", (project_id,)).fetchall()
-        photo_list = [{"url": f"/uploads/{project_id}/{row['filename']}", "filename": row['filename'], "uploaded_at": row['uploaded_at']} for row in photos]
-        return jsonify(photo_list)
+        return jsonify(_load_photos(conn, project_id))
     except Exception as e:
         return jsonify({"error": str(e)}), 500
     finally:
@@ -78,9 +85,8 @@ def delete_project_photo(project_id, filename):
     project_id = os.path.basename(project_id)
     filename = os.path.basename(filename)
     current_user = session.get('username')
-    layout_path = current_app.config['LAYOUT_DATA_FILE_PATH']
     try:
-        with open(layout_path, 'r', encoding='utf-8') as f: layout_data = json.load(f)
+        layout_data = load_layout()
     except Exception: layout_data = {}
     
     item, error = check_layout_item_ownership(project_id, layout_data, current_user)
@@ -102,6 +108,104 @@ def delete_project_photo(project_id, filename):
     finally:
         if conn: conn.close()
 
+# --- Project Data Loaders (shared by the single routes and the /bundle route) ---
+def _load_photos(montaza_conn, project_id):
+    photos = montaza_conn.execute("SELECT filename, uploaded_at FROM project_photos WHERE project_task_no = ? ORDER BY uploaded_at DESC", (project_id,)).fetchall()
+    return [{"url": f"/uploads/{project_id}/{row['filename']}", "filename": row['filename'], "uploaded_at": row['uploaded_at']} for row in photos]
+
+def _load_extra_details(montaza_conn, project_id):
+    notes_row = montaza_conn.execute("SELECT notes, electrification_notes, control_notes FROM project_notes WHERE project_task_no = ?", (project_id,)).fetchone()
+    return {"notes": dict(notes_row) if notes_row else {"notes": "", "electrification_notes": "", "control_notes": ""}}
+
+def _load_work_orders(main_conn, montaza_conn, cas_conn, project_id, work_centers):
+    """Work orders (DNIs) of the project's assembly work centers with completion status and source."""
+    # Get all work orders for this project and work centers
+    work_orders = [dict(row) for row in main_conn.execute(
+        f"SELECT work_order_no, description, work_center FROM work_orders WHERE project_task_no = ? AND work_center IN ({sql_placeholders(work_centers)}) ORDER BY work_order_no",
+        (project_id,) + tuple(work_centers)
+    )]
+    
+    if not work_orders: return [] # No work orders found
+    
+    dni_numbers = [wo['work_order_no'] for wo in work_orders]
+    placeholders_dni = ','.join('?' * len(dni_numbers))
+    
+    # --- Step 1: Get MANUALLY completed DNIs (from velika_montaza) ---
+    manual_completed_set = set()
+    if montaza_conn:
+        try:
+            manual_completed_set = {row['work_order_no'] for row in montaza_conn.execute(
+                "SELECT work_order_no FROM dni_status WHERE project_task_no = ? AND is_completed = 1", (project_id,)
+            )}
+        except Exception as e_m:
+             logger.warning(f"Could not query montaza DB for manual DNI status: {e_m}")
+    else:
+         logger.warning("Montaza DB not connected for manual DNI status.")
+
+
+    # --- Step 2: Get AUTOMATICALLY completed DNIs (from cas_baza) ---
+    auto_completed_set = set()
+    if cas_conn:
+        try:
+            # Ensure placeholders_dni is not empty before querying
+            if placeholders_dni:
+                query_cas = f"""
+                    SELECT DISTINCT ref_doc_no 
+                    FROM {time_entries_source(cas_conn)} 
+                    WHERE ref_doc_no IN ({placeholders_dni}) 
+                    AND event_type = 'Zaključi'
+                """
+                auto_completed_set = {row['ref_doc_no'] for row in cas_conn.execute(query_cas, dni_numbers)}
+            else:
+                logger.warning(f"No DNI numbers found for project {project_id} to check in CAS DB.")
+
+        except sqlite3.OperationalError as e_c:
+            logger.warning(f"Could not query cas_baza for auto-completion: {e_c}")
+    else:
+         logger.warning("CAS DB not connected for auto DNI status.")
+    
+    # --- Step 3: Combine and Determine Source ---
+    for wo in work_orders:
+        wo_no = wo['work_order_no']
+        is_manual = wo_no in manual_completed_set
+        is_auto = wo_no in auto_completed_set
+        
+        wo['is_completed'] = is_manual or is_auto # Mark completed if either is true
+
+        # Determine the source
+        if is_manual and is_auto:
+            wo['completion_source'] = 'both'
+        elif is_manual:
+            wo['completion_source'] = 'manual'
+        elif is_auto:
+            wo['completion_source'] = 'auto'
+        else:
+             wo['completion_source'] = 'none'
+    return work_orders
+
+def _load_missing_and_arrived_parts(main_conn, project_id, work_centers):
+    """
+    Missing and arrived parts from one components scan. The flags use the same SQL
+    comparisons as the missing_parts and arrived_parts queries, so both lists match them.
+    """
+    rows = main_conn.execute(f"""
+        SELECT item_no, description, sifra_regala,
+               (inventory <= 0 OR inventory IS NULL OR inventory = '') AS is_missing,
+               (inventory > 0) AS is_arrived
+        FROM components
+        WHERE project_task_no = ? AND (remaining_quantity > 0 OR remaining_quantity IS NULL)
+          AND work_center NOT IN ({sql_placeholders(work_centers)})
+        ORDER BY item_no
+    """, (project_id,) + tuple(work_centers)).fetchall()
+    missing_parts, arrived_parts, missing_items = [], [], set()
+    for row in rows:
+        if row['is_missing'] and row['item_no'] not in missing_items:
+            missing_items.add(row['item_no']) # missing_parts lists each item once
+            missing_parts.append({"item_no": row['item_no'], "description": row['description']})
+        if row['is_arrived']:
+            arrived_parts.append({"item_no": row['item_no'], "part": row['description'], "location": row['sifra_regala']})
+    return missing_parts, arrived_parts
+
 # --- Project Data Routes ---
 @bp.route('/project/<project_id>/extra_details')
 @login_required
@@ -112,9 +216,7 @@ def get_project_extra_details(project_id):
         project_id = os.path.basename(project_id)
         conn = get_db_connection(current_app.config['VELIKA_MONTAZA_DB_PATH'])
         if conn is None: raise sqlite3.OperationalError("Could not connect to montaza DB.")
-        notes_row = conn.execute("SELECT notes, electrification_notes, control_notes FROM project_notes WHERE project_task_no = ?", (project_id,)).fetchone()
-        details = {"notes": dict(notes_row) if notes_row else {"notes": "", "electrification_notes": "", "control_notes": ""}}
-        return jsonify(details)
+        return jsonify(_load_extra_details(conn, project_id))
     except Exception as e:
         return jsonify({"error": str(e)}), 500
     finally:
@@ -126,83 +228,22 @@ def get_project_extra_details(project_id):
 def get_project_work_orders(project_id):
     """
     Fetches work orders (DNIs) for a project, including completion status
-    and the source of completion (manual, auto, both).
+    and the source of completion (manual, auto, both). ?work_center= selects the centers.
     """
+    work_centers, error = work_centers_arg()
+    if error: return error
     main_conn, montaza_conn, cas_conn = None, None, None
     try:
         project_id = os.path.basename(project_id) # Sanitize
         main_conn = get_db_connection(current_app.config['DATABASE_FILE_PATH'])
         if main_conn is None: raise sqlite3.OperationalError("Could not connect to main DB.")
         
-        sklop = current_app.config['UPRAVLJALNI_CENTER_SKLOP']
-        # Get all work orders for this project and work center
-        work_orders = [dict(row) for row in main_conn.execute(
-            "SELECT work_order_no, description FROM work_orders WHERE project_task_no = ? AND work_center = ? ORDER BY work_order_no",
-            (project_id, sklop)
-        )]
-        
-        if not work_orders: return jsonify([]) # No work orders found
-        
-        dni_numbers = [wo['work_order_no'] for wo in work_orders]
-        placeholders_dni = ','.join('?' * len(dni_numbers))
-        
-        # --- Step 1: Get MANUALLY completed DNIs (from velika_montaza) ---
         montaza_conn = get_db_connection(current_app.config['VELIKA_MONTAZA_DB_PATH'])
-        manual_completed_set = set()
-        if montaza_conn:
-            try:
-                manual_completed_set = {row['work_order_no'] for row in montaza_conn.execute(
-                    "SELECT work_order_no FROM dni_status WHERE project_task_no = ? AND is_completed = 1", (project_id,)
-                )}
-            except Exception as e_m:
-                 print(f"Warning: Could not query montaza DB for manual DNI status: {e_m}")
-        else:
-             print(f"Warning: Montaza DB not connected for manual DNI status.")
-
-
-        # --- Step 2: Get AUTOMATICALLY completed DNIs (from cas_baza) ---
-        auto_completed_set = set()
         cas_conn = get_db_connection(current_app.config['CAS_DATABASE_FILE_PATH'])
-        if cas_conn:
-            try:
-                # Ensure placeholders_dni is not empty before querying
-                if placeholders_dni:
-                    query_cas = f"""
-                        SELECT DISTINCT ref_doc_no 
-                        FROM time_entries 
-                        WHERE ref_doc_no IN ({placeholders_dni}) 
-                        AND event_type = 'Zaključi'
-                    """
-                    auto_completed_set = {row['ref_doc_no'] for row in cas_conn.execute(query_cas, dni_numbers)}
-                else:
-                    print(f"Warning: No DNI numbers found for project {project_id} to check in CAS DB.")
-
-            except sqlite3.OperationalError as e_c:
-                print(f"Warning: Could not query cas_baza for auto-completion: {e_c}")
-        else:
-             print(f"Warning: CAS DB not connected for auto DNI status.")
-        
-        # --- Step 3: Combine and Determine Source ---
-        for wo in work_orders:
-            wo_no = wo['work_order_no']
-            is_manual = wo_no in manual_completed_set
-            is_auto = wo_no in auto_completed_set
-            
-            wo['is_completed'] = is_manual or is_auto # Mark completed if either is true
-
-            # Determine the source
-            if is_manual and is_auto:
-                wo['completion_source'] = 'both'
-            elif is_manual:
-                wo['completion_source'] = 'manual'
-            elif is_auto:
-                wo['completion_source'] = 'auto'
-            else:
-                 wo['completion_source'] = 'none'
-
+        work_orders = _load_work_orders(main_conn, montaza_conn, cas_conn, project_id, work_centers)
         return jsonify(work_orders)
     except Exception as e:
-        print(f"Error fetching work orders for {project_id}: {e}")
+        logger.error(f"Error fetching work orders for {project_id}: {e}")
         # Return empty list or error object? Let's return error object for better debugging
         return jsonify({"error": f"Failed to fetch work orders: {str(e)}"}), 500
     finally:
@@ -212,19 +253,70 @@ def get_project_work_orders(project_id):
         if cas_conn: cas_conn.close()
 # --- END MODIFIED FUNCTION ---
 
+BUNDLE_SECTIONS = ('work_orders', 'extra_details', 'missing_parts', 'arrived_parts', 'photos')
+
+@bp.route('/project/<project_id>/bundle')
+@login_required
+def get_project_bundle(project_id):
+    """
+    Everything the details panel needs in one request: the payloads of /work_orders,
+    /extra_details, /missing_parts, /arrived_parts and /photos, keyed by section name.
+    ?include=a,b limits the sections and ?work_center= applies as on the single routes.
+    Each database is opened at most once and missing/arrived parts come from a single components scan.
+    """
+    project_id = os.path.basename(project_id)
+    work_centers, error = work_centers_arg()
+    if error: return error
+    include = request.args.get('include')
+    sections = set(BUNDLE_SECTIONS) if not include else {part.strip() for part in include.split(',') if part.strip()}
+    unknown = sections - set(BUNDLE_SECTIONS)
+    if unknown or not sections:
+        return jsonify({"error": f"include must be a subset of {', '.join(BUNDLE_SECTIONS)}"}), 400
+
+    main_conn, montaza_conn, cas_conn = None, None, None
+    try:
+        if sections & {'work_orders', 'missing_parts', 'arrived_parts'}:
+            main_conn = get_db_connection(current_app.config['DATABASE_FILE_PATH'])
+            if main_conn is None: raise sqlite3.OperationalError("Could not connect to main DB.")
+        if sections & {'work_orders', 'extra_details', 'photos'}:
+            montaza_conn = get_db_connection(current_app.config['VELIKA_MONTAZA_DB_PATH'])
+            if montaza_conn is None and sections & {'extra_details', 'photos'}:
+                raise sqlite3.OperationalError("Could not connect to montaza DB.")
+
+        bundle = {}
+        if 'work_orders' in sections:
+            cas_conn = get_db_connection(current_app.config['CAS_DATABASE_FILE_PATH'])
+            bundle['work_orders'] = _load_work_orders(main_conn, montaza_conn, cas_conn, project_id, work_centers)
+        if 'extra_details' in sections:
+            bundle['extra_details'] = _load_extra_details(montaza_conn, project_id)
+        if sections & {'missing_parts', 'arrived_parts'}:
+            missing_parts, arrived_parts = _load_missing_and_arrived_parts(main_conn, project_id, work_centers)
+            if 'missing_parts' in sections: bundle['missing_parts'] = missing_parts
+            if 'arrived_parts' in sections: bundle['arrived_parts'] = arrived_parts
+        if 'photos' in sections:
+            bundle['photos'] = _load_photos(montaza_conn, project_id)
+        return jsonify(bundle)
+    except Exception as e:
+        logger.error(f"Error fetching project bundle for {project_id}: {e}")
+        return jsonify({"error": str(e)}), 500
+    finally:
+        if main_conn: main_conn.close()
+        if montaza_conn: montaza_conn.close()
+        if cas_conn: cas_conn.close()
+
 
 @bp.route('/project/<project_id>/missing_parts')
 @login_required
 def get_project_missing_parts(project_id):
-    # --- Code is identical to previous version ---
+    work_centers, error = work_centers_arg()
+    if error: return error
     conn = None
     try:
         project_id = os.path.basename(project_id)
         conn = get_db_connection(current_app.config['DATABASE_FILE_PATH'])
         if conn is None: raise sqlite3.OperationalError("Could not connect to main DB.")
-        sklop = current_app.config['UPRAVLJALNI_CENTER_SKLOP']
-        query = """ SELECT item_no, description FROM components WHERE project_task_no = ? AND (inventory <= 0 OR inventory IS NULL OR inventory = '') AND (remaining_quantity > 0 OR remaining_quantity IS NULL) AND work_center != ? GROUP BY item_no ORDER BY item_no """
-        missing_parts = [dict(row) for row in conn.execute(query, (project_id, sklop)).fetchall()]
+        query = f""" SELECT item_no, description FROM components WHERE project_task_no = ? AND (inventory <= 0 OR inventory IS NULL OR inventory = '') AND (remaining_quantity > 0 OR remaining_quantity IS NULL) AND work_center NOT IN ({sql_placeholders(work_centers)}) GROUP BY item_no ORDER BY item_no """
+        missing_parts = [dict(row) for row in conn.execute(query, (project_id,) + work_centers).fetchall()]
         return jsonify(missing_parts)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -233,19 +325,21 @@ def get_project_missing_parts(project_id):
 
 @bp.route('/project/<project_id>/detailed_missing_parts')
 # NO login required for this public page
+@public_endpoint
 def get_project_detailed_missing_parts(project_id):
     """
     Fetches a detailed list of missing parts for the public parts.html page.
     """
+    work_centers, error = work_centers_arg()
+    if error: return error
     conn = None
     try:
         project_id = os.path.basename(project_id)
         conn = get_db_connection(current_app.config['DATABASE_FILE_PATH'])
         if conn is None: raise sqlite3.OperationalError("Could not connect to main DB.")
-        sklop = current_app.config['UPRAVLJALNI_CENTER_SKLOP']
         
         # This query is for the detailed parts.html page
-        query = """ 
+        query = f""" 
             SELECT 
                 item_no, 
                 description, 
@@ -255,15 +349,15 @@ def get_project_detailed_missing_parts(project_id):
             WHERE project_task_no = ? 
               AND (inventory <= 0 OR inventory IS NULL OR inventory = '') 
               AND (remaining_quantity > 0 OR remaining_quantity IS NULL) 
-              AND work_center != ? 
+              AND work_center NOT IN ({sql_placeholders(work_centers)}) 
             GROUP BY item_no, description, sifra_regala, remaining_quantity 
             ORDER BY item_no 
         """
         
-        missing_parts = [dict(row) for row in conn.execute(query, (project_id, sklop)).fetchall()]
+        missing_parts = [dict(row) for row in conn.execute(query, (project_id,) + work_centers).fetchall()]
         return jsonify(missing_parts)
     except Exception as e:
-        print(f"Error fetching detailed missing parts for {project_id}: {e}")
+        logger.error(f"Error fetching detailed missing parts for {project_id}: {e}")
         return jsonify({"error": str(e)}), 500
     finally:
         if conn: conn.close()
@@ -271,15 +365,15 @@ def get_project_detailed_missing_parts(project_id):
 @bp.route('/project/<project_id>/arrived_parts')
 @login_required
 def get_project_arrived_parts(project_id):
-    # --- Code is identical to previous version ---
+    work_centers, error = work_centers_arg()
+    if error: return error
     conn = None
     try:
         project_id = os.path.basename(project_id)
         conn = get_db_connection(current_app.config['DATABASE_FILE_PATH'])
         if conn is None: raise sqlite3.OperationalError("Could not connect to main DB.")
-        sklop = current_app.config['UPRAVLJALNI_CENTER_SKLOP']
-        query = """ SELECT item_no, description as part, sifra_regala as location FROM components WHERE project_task_no = ? AND inventory > 0 AND (remaining_quantity > 0 OR remaining_quantity IS NULL) AND work_center != ? ORDER BY item_no """
-        arrived_parts = [dict(row) for row in conn.execute(query, (project_id, sklop)).fetchall()]
+        query = f""" SELECT item_no, description as part, sifra_regala as location FROM components WHERE project_task_no = ? AND inventory > 0 AND (remaining_quantity > 0 OR remaining_quantity IS NULL) AND work_center NOT IN ({sql_placeholders(work_centers)}) ORDER BY item_no """
+        arrived_parts = [dict(row) for row in conn.execute(query, (project_id,) + work_centers).fetchall()]
         return jsonify(arrived_parts)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -288,19 +382,21 @@ def get_project_arrived_parts(project_id):
 
 @bp.route('/project/<project_id>/detailed_arrived_parts')
 # NO login required for this public page
+@public_endpoint
 def get_project_detailed_arrived_parts(project_id):
     """
     Fetches a detailed list of ARRIVED parts for the public parts.html page.
     """
+    work_centers, error = work_centers_arg()
+    if error: return error
     conn = None
     try:
         project_id = os.path.basename(project_id)
         conn = get_db_connection(current_app.config['DATABASE_FILE_PATH'])
         if conn is None: raise sqlite3.OperationalError("Could not connect to main DB.")
-        sklop = current_app.config['UPRAVLJALNI_CENTER_SKLOP']
         
         # This query is for the detailed parts.html page, for ARRIVED parts
-        query = """ 
+        query = f""" 
             SELECT 
                 item_no, 
                 description, 
@@ -310,25 +406,74 @@ def get_project_detailed_arrived_parts(project_id):
             WHERE project_task_no = ? 
               AND inventory > 0  -- This is the "arrived" logic
               AND (remaining_quantity > 0 OR remaining_quantity IS NULL) 
-              AND work_center != ? 
+              AND work_center NOT IN ({sql_placeholders(work_centers)}) 
             GROUP BY item_no, description, sifra_regala, remaining_quantity 
             ORDER BY item_no 
         """
         
-        arrived_parts = [dict(row) for row in conn.execute(query, (project_id, sklop)).fetchall()]
+        arrived_parts = [dict(row) for row in conn.execute(query, (project_id,) + work_centers).fetchall()]
         return jsonify(arrived_parts)
     except Exception as e:
-        print(f"Error fetching detailed arrived parts for {project_id}: {e}")
+        logger.error(f"Error fetching detailed arrived parts for {project_id}: {e}")
         return jsonify({"error": str(e)}), 500
     finally:
         if conn: conn.close()
+@bp.route('/project/<project_id>/parts.csv')
+# NO login required, same as the detailed parts lists on parts.html
+@public_endpoint
+def export_project_parts_csv(project_id):
+    """Streams every component of a project (outside the assembly centers) with its missing/arrived state as CSV."""
+    project_id = os.path.basename(project_id)
+    delimiter = request.args.get('delimiter', ',')
+    if delimiter not in (',', ';'):
+        return jsonify({"error": "delimiter must be ',' or ';'"}), 400
+    work_centers, error = work_centers_arg()
+    if error: return error
+    # Checked before streaming, so a missing database still gives a proper error response.
+    # The connection itself is opened by the generator, so a response that is never
+    # iterated (client gone, HEAD) leaves nothing open.
+    if not os.path.exists(current_app.config['DATABASE_FILE_PATH']):
+        return jsonify({"error": f"Database file not found at '{current_app.config['DATABASE_FILE_PATH']}'."}), 500
+
+    def rows():
+        conn = get_db_connection(current_app.config['DATABASE_FILE_PATH'])
+        if conn is None: raise sqlite3.OperationalError("Could not connect to main DB.")
+        try:
+            # Same missing/arrived rules as the detailed parts queries above.
+            cursor = conn.execute(f"""
+                SELECT item_no, description, sifra_regala, work_center, inventory, remaining_quantity,
+                       CASE
+                           WHEN NOT (remaining_quantity > 0 OR remaining_quantity IS NULL) THEN 'done'
+                           WHEN inventory > 0 THEN 'arrived'
+                           ELSE 'missing'
+                       END AS state
+                FROM components
+                WHERE project_task_no = ? AND work_center NOT IN ({sql_placeholders(work_centers)})
+                ORDER BY item_no
+            """, (project_id,) + work_centers)
+            while True:
+                batch = cursor.fetchmany(current_app.config['EXPORT_BATCH_SIZE'])
+                if not batch:
+                    break
+                for row in batch:
+                    yield tuple(row)
+        finally:
+            conn.close()
+
+    header = ("item_no", "description", "sifra_regala", "work_center", "inventory", "remaining_quantity", "state")
+    filename = f"parts_{project_id}_{datetime.now().strftime('%Y%m%d_%H%M')}.csv"
+    return Response(stream_with_context(iter_csv(header, rows(), delimiter=delimiter)), mimetype='text/csv', headers={
+        "Content-Disposition": f'attachment; filename="{filename}"'
+    })
+
 @bp.route('/project_inventory_status/<project_id>')
 @login_required
 def get_project_inventory_status_api(project_id):
-    # --- Code is identical to previous version ---
+    work_centers, error = work_centers_arg()
+    if error: return error
     try:
         project_id = os.path.basename(project_id)
-        statuses = get_project_inventory_status(project_id) # Uses helper
+        statuses = get_project_inventory_status(project_id, work_centers) # Uses helper
         return jsonify(statuses)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -344,53 +489,33 @@ def update_project_details(project_id):
     
     project_id = os.path.basename(project_id)
     current_user = session.get('username')
-    layout_path = current_app.config['LAYOUT_DATA_FILE_PATH']
     try:
-        layout_data = {}
-        if os.path.exists(layout_path):
-             # Ensure file exists before trying to open read-write
-            with open(layout_path, 'r', encoding='utf-8') as f: layout_data = json.load(f)
-        else:
-             # Handle case where layout file doesn't exist yet
-             print(f"Warning: Layout file not found at {layout_path} during details update.")
-             # Depending on desired behavior, could return error or proceed if item found later
-             # For now, let's allow proceeding, assuming item might be added soon.
-             pass # layout_data remains {}
+        with layout_lock():
+            layout_data = load_layout()
 
-
-        item_to_update, error = check_layout_item_ownership(project_id, layout_data, current_user)
-        
-        # If the item wasn't found in the layout_data (even if file existed)
-        if error and error[1] == 404:
-             print(f"Warning: Project {project_id} not found in layout during details update. Cannot save.")
-             # Return the original 404 error from the helper
-             return error
-        elif error: # Handle other errors like permission denied
-             return error
-        
-        # If item_to_update is None but no error (e.g., file didn't exist), we still can't update.
-        if item_to_update is None:
-             print(f"Error: Could not find item {project_id} to update details, possibly due to missing layout file.")
-             return jsonify({"status": "error", "message": "Project not found in layout data."}), 404
-
-
-        item_to_update['details'] = new_details
-        
-        # Now save the updated layout_data
-        with open(layout_path, 'w', encoding='utf-8') as f:
-            json.dump(layout_data, f, indent=4)
+            item_to_update, error = check_layout_item_ownership(project_id, layout_data, current_user)
+            
+            # If the item wasn't found in the layout_data (even if file existed)
+            if error and error[1] == 404:
+                 logger.warning(f"Project {project_id} not found in layout during details update. Cannot save.")
+                 # Return the original 404 error from the helper
+                 return error
+            elif error: # Handle other errors like permission denied
+                 return error
+
+            item_to_update['details'] = new_details
+            
+            # Now save the updated layout_data
+            save_layout(layout_data)
         
-        print(f"Updated details for project {project_id} in layout by user '{current_user}'.")
+        logger.info(f"Updated details for project {project_id} in layout by user '{current_user}'.")
         return jsonify({"status": "success"})
 
     except json.JSONDecodeError:
-        print(f"Error: Could not decode JSON from {layout_path} during details update.")
+        logger.error("Could not decode layout JSON during details update.")
         return jsonify({"status": "error", "message": "Layout file is corrupted."}), 500
-    except FileNotFoundError: # Should be caught by earlier check, but just in case
-        print(f"Error: Layout file {layout_path} not found during details update attempt.")
-        return jsonify({"status": "error", "message": "Layout file not found."}), 500
     except Exception as e:
-        print(f"Error updating details for project {project_id}: {e}")
+        logger.error(f"Error updating details for project {project_id}: {e}")
         return jsonify({"status": "error", "message": str(e)}), 500
 
 
@@ -402,22 +527,14 @@ def set_project_priority(project_id):
     priority = data.get('priority')
     project_id = os.path.basename(project_id)
     current_user = session.get('username')
-    layout_path = current_app.config['LAYOUT_DATA_FILE_PATH']
     try:
         # Load layout data to check ownership
-        layout_data = {}
-        if os.path.exists(layout_path):
-            with open(layout_path, 'r', encoding='utf-8') as f: layout_data = json.load(f)
-        else:
-             print(f"Warning: Layout file not found at {layout_path} during priority set.")
-             # Allow setting priority even if not in layout? Maybe. Check ownership helper behavior.
-             pass
+        layout_data = load_layout()
     except json.JSONDecodeError:
-         print(f"Warning: Could not read layout file {layout_path} due to JSON error during priority set.")
-         # Proceed, but ownership check might fail if layout_data is empty
+         logger.warning("Could not read layout file due to JSON error during priority set.")
          layout_data = {}
     except Exception as e:
-        print(f"Warning: Error loading layout file {layout_path} during priority set: {e}")
+        logger.warning(f"Error loading layout file during priority set: {e}")
         layout_data = {}
 
 
@@ -440,20 +557,14 @@ def set_project_pause_status(project_id):
     pause_reason = data.get('reason')
     project_id = os.path.basename(project_id)
     current_user = session.get('username')
-    layout_path = current_app.config['LAYOUT_DATA_FILE_PATH']
     try:
         # Load layout data to check ownership
-        layout_data = {}
-        if os.path.exists(layout_path):
-             with open(layout_path, 'r', encoding='utf-8') as f: layout_data = json.load(f)
-        else:
-             print(f"Warning: Layout file not found at {layout_path} during pause set.")
-             pass
+        layout_data = load_layout()
     except json.JSONDecodeError:
-         print(f"Warning: Could not read layout file {layout_path} due to JSON error during pause set.")
+         logger.warning("Could not read layout file due to JSON error during pause set.")
          layout_data = {}
     except Exception as e:
-        print(f"Warning: Error loading layout file {layout_path} during pause set: {e}")
+        logger.warning(f"Error loading layout file during pause set: {e}")
         layout_data = {}
 
     
@@ -481,20 +592,14 @@ def update_dni_status(work_order_no):
     if not project_id: return jsonify({"status": "error", "message": "Missing project_task_no"}), 400
     
     current_user = session.get('username')
-    layout_path = current_app.config['LAYOUT_DATA_FILE_PATH']
     try:
         # Load layout data to check ownership
-        layout_data = {}
-        if os.path.exists(layout_path):
-             with open(layout_path, 'r', encoding='utf-8') as f: layout_data = json.load(f)
-        else:
-             print(f"Warning: Layout file not found at {layout_path} during DNI status update.")
-             pass # Allow update even if project not in layout
+        layout_data = load_layout()
     except json.JSONDecodeError:
-         print(f"Warning: Could not read layout file {layout_path} due to JSON error during DNI status update.")
-         layout_data = {} # Proceed but ownership check might behave unexpectedly
+         logger.warning("Could not read layout file due to JSON error during DNI status update.")
+         layout_data = {}
     except Exception as e:
-        print(f"Warning: Error loading layout file {layout_path} during DNI status update: {e}")
+        logger.warning(f"Error loading layout file during DNI status update: {e}")
         layout_data = {}
 
     
@@ -516,10 +621,10 @@ def update_dni_status(work_order_no):
         conn.execute("INSERT OR IGNORE INTO project_notes (project_task_no) VALUES (?)", (project_id,))
         conn.execute("UPDATE project_notes SET last_dni_updated_at = ? WHERE project_task_no = ?", (timestamp, project_id))
         conn.commit()
-        print(f"Updated MANUAL DNI status for {work_order_no} (Project: {project_id}) by user '{current_user}'")
+        logger.info(f"Updated MANUAL DNI status for {work_order_no} (Project: {project_id}) by user '{current_user}'")
         return jsonify({"status": "success"})
     except Exception as e:
-        print(f"Error updating DNI status for {work_order_no}: {e}")
+        logger.error(f"Error updating DNI status for {work_order_no}: {e}")
         return jsonify({"status": "error", "message": str(e)}), 500
     finally:
         if conn: conn.close()
@@ -532,20 +637,14 @@ def save_project_notes(project_id):
     project_id = os.path.basename(project_id)
     note_type, content = data.get('note_type'), data.get('content')
     current_user = session.get('username')
-    layout_path = current_app.config['LAYOUT_DATA_FILE_PATH']
     try:
         # Load layout data to check ownership
-        layout_data = {}
-        if os.path.exists(layout_path):
-             with open(layout_path, 'r', encoding='utf-8') as f: layout_data = json.load(f)
-        else:
-            print(f"Warning: Layout file not found at {layout_path} during notes save.")
-            pass # Allow saving notes even if project not in layout
+        layout_data = load_layout()
     except json.JSONDecodeError:
-         print(f"Warning: Could not read layout file {layout_path} due to JSON error during notes save.")
+         logger.warning("Could not read layout file due to JSON error during notes save.")
          layout_data = {}
     except Exception as e:
-        print(f"Warning: Error loading layout file {layout_path} during notes save: {e}")
+        logger.warning(f"Error loading layout file during notes save: {e}")
         layout_data = {}
 
     
@@ -563,10 +662,86 @@ def save_project_notes(project_id):
         conn.execute("INSERT OR IGNORE INTO project_notes (project_task_no) VALUES (?)", (project_id,))
         conn.execute(f"UPDATE project_notes SET {note_type} = ?, last_note_updated_at = ? WHERE project_task_no = ?", (content, timestamp, project_id))
         conn.commit()
-        print(f"Saved notes (type: {note_type}) for project {project_id} by user '{current_user}'")
+        logger.info(f"Saved notes (type: {note_type}) for project {project_id} by user '{current_user}'")
         return jsonify({"status": "success"})
     except Exception as e:
-        print(f"Error saving notes for {project_id}: {e}")
+        logger.error(f"Error saving notes for {project_id}: {e}")
+        return jsonify({"status": "error", "message": str(e)}), 500
+    finally:
+        if conn: conn.close()
+
+NOTE_FIELDS = ('notes', 'electrification_notes', 'control_notes')
+
+@bp.route('/project/<project_id>/save', methods=['POST'])
+@admin_required
+def save_project_changes(project_id):
+    """
+    Saves any subset of the note fields and 'details' in one request (the details panel's Save).
+    Ownership is checked once; only fields whose content changed are written, in one
+    velika_montaza transaction, and the layout file is only rewritten if details changed.
+    """
+    data = request.get_json(silent=True) or {}
+    project_id = os.path.basename(project_id)
+    current_user = session.get('username')
+    notes = {field: data[field] for field in NOTE_FIELDS if field in data}
+    has_details = 'details' in data
+    if not notes and not has_details:
+        return jsonify({"status": "error", "message": f"Send at least one of {', '.join(NOTE_FIELDS)}, details"}), 400
+    if not all(isinstance(value, str) or value is None for value in list(notes.values()) + [data.get('details')]):
+        return jsonify({"status": "error", "message": "Field values must be strings"}), 400
+
+    conn = None
+    try:
+        # Details live in the layout file, so the read-modify-write needs the layout lock.
+        with layout_lock() if has_details else nullcontext():
+            try:
+                layout_data = load_layout()
+            except json.JSONDecodeError:
+                if has_details: raise
+                logger.warning("Could not read layout file due to JSON error during notes save.")
+                layout_data = {}
+            item, error = check_layout_item_ownership(project_id, layout_data, current_user)
+            # Notes may be saved for projects outside the layout; details can't.
+            if error and (error[1] != 404 or has_details): return error
+
+            changed_notes = {}
+            if notes:
+                conn = get_db_connection(current_app.config['VELIKA_MONTAZA_DB_PATH'])
+                if conn is None: raise sqlite3.OperationalError("Could not connect to montaza DB.")
+                row = conn.execute(
+                    f"SELECT {', '.join(NOTE_FIELDS)} FROM project_notes WHERE project_task_no = ?", (project_id,)
+                ).fetchone()
+                # A missing note and an empty one look the same in the panel.
+                changed_notes = {
+                    field: value for field, value in notes.items()
+                    if (value or '') != ((row[field] if row else None) or '')
+                }
+            details_changed = has_details and item.get('details') != data['details']
+            if not changed_notes and not details_changed:
+                return jsonify({"status": "success", "changed": []})
+
+            if changed_notes:
+                timestamp = datetime.now(timezone.utc).isoformat()
+                assignments = ', '.join(f"{field} = ?" for field in changed_notes)
+                conn.execute("INSERT OR IGNORE INTO project_notes (project_task_no) VALUES (?)", (project_id,))
+                conn.execute(
+                    f"UPDATE project_notes SET {assignments}, last_note_updated_at = ? WHERE project_task_no = ?",
+                    list(changed_notes.values()) + [timestamp, project_id]
+                )
+                # Commit before save_layout(), which bumps the layout generation in the same DB.
+                conn.commit()
+            if details_changed:
+                item['details'] = data['details']
+                save_layout(layout_data)
+
+        changed = list(changed_notes) + (['details'] if details_changed else [])
+        logger.info(f"Saved {', '.join(changed)} for project {project_id} by user '{current_user}'")
+        return jsonify({"status": "success", "changed": changed})
+    except json.JSONDecodeError:
+        logger.error(f"Could not decode layout JSON during save of project {project_id}.")
+        return jsonify({"status": "error", "message": "Layout file is corrupted."}), 500
+    except Exception as e:
+        logger.error(f"Error saving changes for {project_id}: {e}")
         return jsonify({"status": "error", "message": str(e)}), 500
     finally:
         if conn: conn.close()
@@ -611,12 +786,12 @@ def complete_task(project_id, task_type):
         if row and row['electrification_completed_at'] and row['control_completed_at']:
             conn.execute("UPDATE project_notes SET packaging_status = ? WHERE project_task_no = ?", ('Ready', project_id))
             conn.commit()
-            print(f"Project {project_id} marked ready for packaging.")
+            logger.info(f"Project {project_id} marked ready for packaging.")
 
-        print(f"Completed {task_type} for project {project_id} by user '{session['username']}'")
+        logger.info(f"Completed {task_type} for project {project_id} by user '{session['username']}'")
         return jsonify({"status": "success", "timestamp": timestamp})
     except Exception as e:
-        print(f"Error completing {task_type} for {project_id}: {e}")
+        logger.error(f"Error completing {task_type} for {project_id}: {e}")
         return jsonify({"status": "error", "message": str(e)}), 500
     finally:
         if conn: conn.close()
@@ -638,10 +813,10 @@ def reset_task(project_id, task_type):
         # Reset status, completed_at, and packaging status if either task is reset
         conn.execute(f"UPDATE project_notes SET {task_type}_status = ?, {task_type}_completed_at = ?, packaging_status = ? WHERE project_task_no = ?", (None, None, None, project_id))
         conn.commit()
-        print(f"Reset {task_type} status for project {project_id} by user '{session['username']}'")
+        logger.info(f"Reset {task_type} status for project {project_id} by user '{session['username']}'")
         return jsonify({"status": "success"})
     except Exception as e:
-        print(f"Error resetting {task_type} for {project_id}: {e}")
+        logger.error(f"Error resetting {task_type} for {project_id}: {e}")
         return jsonify({"status": "error", "message": str(e)}), 500
     finally:
         if conn: conn.close()
@@ -0,0 +1,29 @@
+import logging
+from flask import (
+    Blueprint, jsonify, request, current_app
+)
+from .auth import login_required
+from .notes_search import build_match_query, search_notes
+
+logger = logging.getLogger(__name__)
+
+# All routes here will be prefixed with /api
+bp = Blueprint('search', __name__, url_prefix='/api')
+
+@bp.route('/search/notes')
+@login_required
+def search_project_notes():
+    """Projects whose notes match ?q= (all words, as prefixes), ranked, with highlighted snippets."""
+    query = request.args.get('q', '')
+    if build_match_query(query) is None:
+        return jsonify({"error": "Missing 'q' parameter"}), 400
+    try:
+        limit = max(1, min(int(request.args.get('limit', current_app.config['NOTES_SEARCH_LIMIT'])), 200))
+    except ValueError:
+        return jsonify({"error": "limit must be an integer"}), 400
+    try:
+        items = search_notes(query, limit)
+        return jsonify({"query": query, "items": items})
+    except Exception as e:
+        logger.error(f"Error searching notes for '{query}': {e}")
+        return jsonify({"error": str(e)}), 500
@@ -0,0 +1,48 @@
+import logging
+from flask import (
+    Blueprint, jsonify, request, current_app
+)
+from .auth import login_required
+from .shortages import get_group_projects, get_shortage_report
+from .work_centers import work_centers_arg
+
+logger = logging.getLogger(__name__)
+
+# All routes here will be prefixed with /api
+bp = Blueprint('shortages', __name__, url_prefix='/api')
+
+def _report_response(project_ids, work_centers, **extra):
+    items = get_shortage_report(project_ids, work_centers)
+    return jsonify(dict(extra, projects=sorted(set(project_ids)), items=items, item_count=len(items)))
+
+@bp.route('/groups/<group_name>/shortages')
+@login_required
+def get_group_shortages(group_name):
+    """Missing parts per item_no across every project of a skladisce group."""
+    work_centers, error = work_centers_arg()
+    if error: return error
+    try:
+        project_ids = get_group_projects(group_name)
+        if not project_ids:
+            return jsonify({"error": f"Group '{group_name}' not found or empty"}), 404
+        return _report_response(project_ids, work_centers, group=group_name)
+    except Exception as e:
+        logger.error(f"Error fetching shortages for group {group_name}: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@bp.route('/shortages')
+@login_required
+def get_shortages():
+    """Missing parts per item_no across ?projects=A,B,C (ad-hoc group)."""
+    project_ids = [pid.strip() for pid in request.args.get('projects', '').split(',') if pid.strip()]
+    if not project_ids:
+        return jsonify({"error": "Missing 'projects' parameter"}), 400
+    if len(project_ids) > current_app.config['SHORTAGES_MAX_PROJECTS']:
+        return jsonify({"error": f"At most {current_app.config['SHORTAGES_MAX_PROJECTS']} projects per request"}), 400
+    work_centers, error = work_centers_arg()
+    if error: return error
+    try:
+        return _report_response(project_ids, work_centers)
+    except Exception as e:
+        logger.error(f"Error fetching shortages for {len(project_ids)} projects: {e}")
+        return jsonify({"error": str(e)}), 500
@@ -0,0 +1,89 @@
+import os
+import sqlite3
+import logging
+from datetime import date, timedelta
+from flask import (
+    Blueprint, jsonify, request, current_app
+)
+from .auth import login_required
+from .db import get_db_connection
+from .snapshots import week_start
+
+logger = logging.getLogger(__name__)
+
+# All routes here will be prefixed with /api
+bp = Blueprint('trends', __name__, url_prefix='/api')
+
+def _weeks_arg(default):
+    try:
+        return max(1, min(int(request.args.get('weeks', default)), 520))
+    except ValueError:
+        return default
+
+def _trend_rows(rows):
+    """Turns weekly rollup rows (ordered by week) into trend points with the weekly progress."""
+    points = []
+    previous_completed = None
+    for row in rows:
+        start_completed = previous_completed if previous_completed is not None else row['first_completed']
+        total = row['total_dnis']
+        points.append({
+            "week_start": row['week_start'],
+            "completed": row['last_completed'],
+            "total": total,
+            "percentage": round(row['last_completed'] * 100 / total) if total else 0,
+            "completed_this_week": row['last_completed'] - start_completed,
+            "days_recorded": row['days_recorded'],
+            "paused_days": row['paused_days'],
+            "electrification_state": row['electrification_state'],
+            "control_state": row['control_state'],
+            "pause_status": row['pause_status']
+        })
+        previous_completed = row['last_completed']
+    return points
+
+@bp.route('/project/<project_id>/trend')
+@login_required
+def get_project_trend(project_id):
+    """Weekly progress of one project for the last ?weeks= weeks (default 12), from the rollups."""
+    conn = None
+    try:
+        project_id = os.path.basename(project_id)
+        since = week_start(date.today()) - timedelta(weeks=_weeks_arg(12) - 1)
+        conn = get_db_connection(current_app.config['VELIKA_MONTAZA_DB_PATH'])
+        if conn is None: raise sqlite3.OperationalError("Could not connect to montaza DB.")
+        rows = conn.execute("""
+            SELECT * FROM project_weekly_rollups
+            WHERE project_task_no = ? AND week_start >= ?
+            ORDER BY week_start
+        """, (project_id, since.isoformat())).fetchall()
+        return jsonify({"project": project_id, "weeks": _trend_rows(rows)})
+    except Exception as e:
+        logger.error(f"Error fetching trend for {project_id}: {e}")
+        return jsonify({"error": str(e)}), 500
+    finally:
+        if conn: conn.close()
+
+@bp.route('/trends')
+@login_required
+def get_trends():
+    """Weekly progress of every project with rollups in the last ?weeks= weeks (default 4)."""
+    conn = None
+    try:
+        since = week_start(date.today()) - timedelta(weeks=_weeks_arg(4) - 1)
+        conn = get_db_connection(current_app.config['VELIKA_MONTAZA_DB_PATH'])
+        if conn is None: raise sqlite3.OperationalError("Could not connect to montaza DB.")
+        rows = conn.execute("""
+            SELECT * FROM project_weekly_rollups
+            WHERE week_start >= ?
+            ORDER BY project_task_no, week_start
+        """, (since.isoformat(),)).fetchall()
+        per_project = {}
+        for row in rows:
+            per_project.setdefault(row['project_task_no'], []).append(row)
+        return jsonify([{"project": pid, "weeks": _trend_rows(project_rows)} for pid, project_rows in per_project.items()])
+    except Exception as e:
+        logger.error(f"Error fetching trends: {e}")
+        return jsonify({"error": str(e)}), 500
+    finally:
+        if conn: conn.close()
@@ -0,0 +1,30 @@
+from flask import jsonify, request, current_app
+
+# Assembly work centers. WORK_CENTERS lists every center tracked on the layout (each card
+# carries progress per center); a request picks a subset with ?work_center=303,304 and
+# otherwise gets DEFAULT_WORK_CENTERS. Statuses and readiness are computed over the
+# selected centers, and the parts lists exclude them (their components are the assemblies
+# themselves, not parts to fetch).
+
+def default_work_centers():
+    return tuple(current_app.config['DEFAULT_WORK_CENTERS'])
+
+def parse_work_centers(value):
+    """'303,304' -> ('303', '304'); empty -> the defaults. Raises ValueError for centers not in WORK_CENTERS."""
+    centers = tuple(dict.fromkeys(part.strip() for part in (value or '').split(',') if part.strip()))
+    if not centers:
+        return default_work_centers()
+    unknown = [center for center in centers if center not in current_app.config['WORK_CENTERS']]
+    if unknown:
+        raise ValueError(f"Unknown work center(s): {', '.join(unknown)}")
+    return centers
+
+def work_centers_arg():
+    """Returns (work centers from ?work_center=, error response or None)."""
+    try:
+        return parse_work_centers(request.args.get('work_center')), None
+    except ValueError as e:
+        return None, (jsonify({"error": str(e)}), 400)
+
+def sql_placeholders(work_centers):
+    return ','.join('?' * len(work_centers))
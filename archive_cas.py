@@ -0,0 +1,18 @@
+import argparse
+from app import create_app
+from app.time_archive import archive_time_entries
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Move old and finished time entries from cas_baza.db into yearly archive databases")
+    parser.add_argument('--horizon-days', type=int, default=None, help="Archive entries older than this (defaults to CAS_ARCHIVE_HORIZON_DAYS)")
+    parser.add_argument('--keep-finished', action='store_true', help="Don't archive the entries of finished projects' DNIs")
+    parser.add_argument('--dry-run', action='store_true', help="Only report what would be archived")
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        result = archive_time_entries(horizon_days=args.horizon_days, include_finished=not args.keep_finished, dry_run=args.dry_run)
+    verb = "Would archive" if args.dry_run else "Archived"
+    print(f"--- {verb} {result['entries']} time entries ({result['summaries']} DNI/worker summaries) ---")
+    for year, count in result['years'].items():
+        print(f"  {year}: {count}")
@@ -0,0 +1,161 @@
+import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
+from http.cookies import SimpleCookie
+from a2wsgi import WSGIMiddleware
+from app import create_app
+from app.startup import run_startup_checks
+from app.scheduler import start_scheduler
+from app.replica import start_replica
+from app.auth import start_hash_pool
+from app.helpers import build_layout_payload
+
+# Same factory and configuration as run.py; only the server differs.
+app = create_app()
+run_startup_checks(app)
+start_hash_pool(app) # Fork the hashing workers before the server's threads exist
+
+# Regular Flask routes run on a bounded thread pool behind the async server.
+wsgi_app = WSGIMiddleware(app, workers=app.config['ASGI_WSGI_THREADS'])
+# SQLite work from the native async routes runs on its own executor.
+db_executor = ThreadPoolExecutor(max_workers=app.config['ASGI_DB_THREADS'], thread_name_prefix='sqlite')
+
+async def run_db(func, *args):
+    """Runs a blocking helper (SQLite work) on the dedicated executor inside an app context."""
+    def call():
+        with app.app_context():
+            return func(*args)
+    return await asyncio.get_running_loop().run_in_executor(db_executor, call)
+
+def session_from_scope(scope):
+    """Decodes the Flask session cookie for a native ASGI request."""
+    headers = dict(scope.get('headers') or [])
+    cookie = SimpleCookie()
+    try:
+        cookie.load(headers.get(b'cookie', b'').decode('latin-1'))
+    except Exception:
+        return {}
+    morsel = cookie.get(app.config.get('SESSION_COOKIE_NAME', 'session'))
+    serializer = app.session_interface.get_signing_serializer(app)
+    if morsel is None or serializer is None:
+        return {}
+    try:
+        return serializer.loads(morsel.value, max_age=int(app.permanent_session_lifetime.total_seconds()))
+    except Exception:
+        return {}
+
+async def send_json(send, status, payload):
+    body = json.dumps(payload).encode('utf-8')
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())]})
+    await send({'type': 'http.response.body', 'body': body})
+
+class LayoutBroadcaster:
+    """Builds the layout payload once per interval and pushes changes to every open stream."""
+
+    def __init__(self):
+        self.subscribers = set()
+        self.latest = None
+        self.task = None
+
+    def subscribe(self):
+        queue = asyncio.Queue(maxsize=1)
+        self.subscribers.add(queue)
+        if self.latest is not None:
+            queue.put_nowait(self.latest)
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.run())
+        return queue
+
+    def unsubscribe(self, queue):
+        self.subscribers.discard(queue)
+
+    async def run(self):
+        last_signature = None
+        while self.subscribers:
+            try:
+                data = await run_db(build_layout_payload)
+                timestamp = data.pop('server_timestamp', None)
+                signature = app.json.dumps(data)
+                if signature != last_signature:
+                    last_signature = signature
+                    data['server_timestamp'] = timestamp
+                    self.latest = app.json.dumps(data)
+                    for queue in list(self.subscribers):
+                        if queue.full():
+                            queue.get_nowait() # Slow client: keep only the newest payload
+                        queue.put_nowait(self.latest)
+            except Exception as e:
+                print(f"Error building layout stream payload: {e}")
+            await asyncio.sleep(app.config['LAYOUT_STREAM_INTERVAL_SECONDS'])
+        self.latest = None
+
+layout_broadcaster = LayoutBroadcaster()
+
+async def layout_stream(scope, receive, send):
+    """Server-sent events stream that pushes the layout payload whenever it changes."""
+    if 'logged_in' not in session_from_scope(scope):
+        await send_json(send, 401, {"error": "Authentication required"})
+        return
+    await send({'type': 'http.response.start', 'status': 200,
+                'headers': [(b'content-type', b'text/event-stream'), (b'cache-control', b'no-cache'),
+                            (b'x-accel-buffering', b'no')]})
+    queue = layout_broadcaster.subscribe()
+
+    async def wait_for_disconnect():
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+    disconnect = asyncio.create_task(wait_for_disconnect())
+    try:
+        while True:
+            next_payload = asyncio.create_task(queue.get())
+            done, _ = await asyncio.wait({next_payload, disconnect}, timeout=app.config['LAYOUT_STREAM_KEEPALIVE_SECONDS'],
+                                         return_when=asyncio.FIRST_COMPLETED)
+            if disconnect in done:
+                next_payload.cancel()
+                break
+            if next_payload in done:
+                chunk = f"event: layout\ndata: {next_payload.result()}\n\n"
+            else:
+                next_payload.cancel()
+                chunk = ": keepalive\n\n"
+            await send({'type': 'http.response.body', 'body': chunk.encode('utf-8'), 'more_body': True})
+    except OSError:
+        pass # Client went away mid-write
+    finally:
+        layout_broadcaster.unsubscribe(queue)
+        disconnect.cancel()
+
+# Routes served natively by the async server; everything else goes to Flask.
+NATIVE_ROUTES = {
+    '/api/stream/layout': layout_stream,
+}
+
+async def application(scope, receive, send):
+    """ASGI entry point."""
+    if scope['type'] == 'lifespan':
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                start_scheduler(app)
+                start_replica(app)
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                db_executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+    handler = NATIVE_ROUTES.get(scope.get('path')) if scope['type'] == 'http' else None
+    if handler:
+        await handler(scope, receive, send)
+    else:
+        await wsgi_app(scope, receive, send)
+
+if __name__ == '__main__':
+    import uvicorn
+
+    print("\n--- Factory Layout Server is Running with Uvicorn (ASGI) ---")
+    print(f"Access the main app at: http://127.0.0.1:5005")
+    print(f"Access the planning view at: http://127.0.0.1:5005/planning")
+    print(f"Access the admin panel at: http://127.0.0.1:5005/admin")
+
+    uvicorn.run(application, host='0.0.0.0', port=5005)
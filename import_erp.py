@@ -0,0 +1,23 @@
+import sys
+import argparse
+from app import create_app
+from app.erp_import import import_erp_snapshot, ImportValidationError
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Import ERP CSV exports into projekti_baza.db")
+    parser.add_argument('work_orders_csv', help="CSV export with project_task_no, work_order_no, description, work_center")
+    parser.add_argument('components_csv', help="CSV export with project_task_no, item_no, description, inventory, remaining_quantity, sifra_regala, work_center")
+    parser.add_argument('--delimiter', default=',', help="CSV delimiter (ERP exports often use ';')")
+    parser.add_argument('--encoding', default='utf-8-sig')
+    parser.add_argument('--db', default=None, help="Target database (defaults to DATABASE_FILE_PATH)")
+    parser.add_argument('--force', action='store_true', help="Skip the check against the current row counts")
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        try:
+            import_erp_snapshot(args.work_orders_csv, args.components_csv, db_path=args.db,
+                                delimiter=args.delimiter, encoding=args.encoding, force=args.force)
+        except ImportValidationError as e:
+            print(f"--- ERP import aborted, the current database was left untouched: {e} ---")
+            sys.exit(1)
@@ -315,23 +315,44 @@ document.addEventListener('DOMContentLoaded', () => {
         async function fetchAndDraw() {
             statusText.textContent = 'Syncing...';
             try {
+                // Always the full layout, without ?bbox=/&zoom=: search, 'My Projects' and the item
+                // lookups after each action read lastData.items, and the layout stream pushes every card.
                 const data = await fetchApi('/api/layout_data');
-                if (data?.background?.image_path && !imageCache[data.background.image_path]) {
-                    const img = new Image();
-                    img.src = `/api/get_image?path=${encodeURIComponent(data.background.image_path)}`;
-                    await new Promise((resolve, reject) => {
-                        img.onload = () => { imageCache[data.background.image_path] = img; resolve(); };
-                        img.onerror = () => { imageCache[data.background.image_path] = null; reject('Image load failed'); };
-                    });
-                }
-                lastData = data;
-                drawLayout();
-                if (!statusText.textContent.startsWith('Found:') && !statusText.textContent.startsWith('Project not found')) {
-                     statusText.textContent = 'Live';
-                }
+                await applyLayoutData(data);
             } catch (error) { statusText.textContent = `Error`; console.error(error); }
         }
 
+        async function applyLayoutData(data) {
+            if (data?.background?.image_path && !imageCache[data.background.image_path]) {
+                const img = new Image();
+                img.src = `/api/get_image?path=${encodeURIComponent(data.background.image_path)}`;
+                await new Promise((resolve, reject) => {
+                    img.onload = () => { imageCache[data.background.image_path] = img; resolve(); };
+                    img.onerror = () => { imageCache[data.background.image_path] = null; reject('Image load failed'); };
+                });
+            }
+            lastData = data;
+            drawLayout();
+            if (!statusText.textContent.startsWith('Found:') && !statusText.textContent.startsWith('Project not found')) {
+                 statusText.textContent = 'Live';
+            }
+        }
+
+        // Push updates are only available when served through asgi.py; otherwise we keep polling.
+        let layoutStreamLive = false;
+        function startLayoutStream() {
+            if (!window.EventSource) return;
+            const source = new EventSource('/api/stream/layout');
+            source.onopen = () => { layoutStreamLive = true; };
+            source.addEventListener('layout', (event) => {
+                applyLayoutData(JSON.parse(event.data)).catch((error) => { statusText.textContent = `Error`; console.error(error); });
+            });
+            source.onerror = () => {
+                layoutStreamLive = false;
+                if (source.readyState === EventSource.CLOSED) source.close();
+            };
+        }
+
         function updateZoom(factor, pivotX, pivotY) {
             const newScale = Math.max(0.1, Math.min(5, viewTransform.scale * factor));
             const worldX = (pivotX - viewTransform.panX) / viewTransform.scale;
@@ -394,14 +415,9 @@ document.addEventListener('DOMContentLoaded', () => {
 
             const canModifyItem = isAdmin && (!item.owner || item.owner === currentUsername);
 
-            const workOrders = await fetchApi(`/api/project/${item.name}/work_orders`);
-
-            const [extraDetails, missingParts, arrivedParts, photos] = await Promise.all([
-                fetchApi(`/api/project/${item.name}/extra_details`),
-                fetchApi(`/api/project/${item.name}/missing_parts`), // Still fetch for count
-                fetchApi(`/api/project/${item.name}/arrived_parts`),
-                fetchApi(`/api/project/${item.name}/photos`)
-            ]);
+            // One round trip for work orders, notes, missing/arrived parts and photos
+            const bundle = await fetchApi(`/api/project/${item.name}/bundle`);
+            const { work_orders: workOrders, extra_details: extraDetails, missing_parts: missingParts, arrived_parts: arrivedParts, photos } = bundle;
 
             const isEleReady = item.electrification_status === 'Ready', isEleDone = !!item.electrification_completed_at;
             const isConReady = item.control_status === 'Ready', isConDone = !!item.control_completed_at;
@@ -643,16 +659,16 @@ document.addEventListener('DOMContentLoaded', () => {
                     await fetchApi(`/api/project/${projectId}/reset_task/${action.replace('reset_','' )}`, { method: 'POST' });
                 } else if (action === 'save-changes') {
                     button.textContent = 'Saving...'; button.disabled = true;
-                    await Promise.all([
-                        fetchApi(`/api/project/${projectId}/details`, {
-                            method: 'POST',
-                            headers: { 'Content-Type': 'application/json' },
-                            body: JSON.stringify({ details: document.getElementById('worker-input').value })
-                        }),
-                        fetchApi(`/api/project/${projectId}/notes`, { method: 'POST', headers: { 'Content-Type': 'application/json' }, body: JSON.stringify({ note_type: 'notes', content: document.getElementById('notes-general').value }) }),
-                        fetchApi(`/api/project/${projectId}/notes`, { method: 'POST', headers: { 'Content-Type': 'application/json' }, body: JSON.stringify({ note_type: 'electrification_notes', content: document.getElementById('notes-electrification').value }) }),
-                        fetchApi(`/api/project/${projectId}/notes`, { method: 'POST', headers: { 'Content-Type': 'application/json' }, body: JSON.stringify({ note_type: 'control_notes', content: document.getElementById('notes-control').value }) })
-                    ]);
+                    await fetchApi(`/api/project/${projectId}/save`, {
+                        method: 'POST',
+                        headers: { 'Content-Type': 'application/json' },
+                        body: JSON.stringify({
+                            details: document.getElementById('worker-input').value,
+                            notes: document.getElementById('notes-general').value,
+                            electrification_notes: document.getElementById('notes-electrification').value,
+                            control_notes: document.getElementById('notes-control').value
+                        })
+                    });
                     button.textContent = 'Saved!';
                     if (lastData) {
                         const item = lastData.items.find(i => i.name === projectId);
@@ -928,7 +944,7 @@ document.addEventListener('DOMContentLoaded', () => {
                 if (draggedItem) {
                 canvas.style.cursor = '';
                 try {
-                    await fetchApi('/api/move_project_to_layout', {
+                    const result = await fetchApi('/api/move_project_to_layout', {
                         method: 'POST',
                         headers: { 'Content-Type': 'application/json' },
                         body: JSON.stringify({
@@ -937,6 +953,11 @@ document.addEventListener('DOMContentLoaded', () => {
                             y: draggedItem.y
                         })
                     });
+                    if (result?.snapped) { // Server moved the card to the nearest free slot
+                        draggedItem.x = result.x;
+                        draggedItem.y = result.y;
+                        drawLayout();
+                    }
                 } catch (error) {
                         alert('Error saving new position: ' + error.message);
                     await fetchAndDraw();
@@ -1074,7 +1095,8 @@ document.addEventListener('DOMContentLoaded', () => {
         window.addEventListener('resize', resizeCanvas);
         resizeCanvas();
         fetchAndDraw();
-        setInterval(fetchAndDraw, 10000); // Refresh data every 10 seconds
+        startLayoutStream();
+        setInterval(() => { if (!layoutStreamLive) fetchAndDraw(); }, 10000); // Refresh data every 10 seconds unless the stream is live
     }
 
 });
\ No newline at end of file
@@ -1,46 +1,57 @@
+import os
+import argparse
 from waitress import serve
 from app import create_app
-import os
-import json
+from app.startup import run_startup_checks
+from app.scheduler import start_scheduler
+from app.replica import start_replica
+from app.auth import start_hash_pool
 
 app = create_app()
 
+def serve_with_gunicorn(workers, threads, port):
+    """Runs the app in several worker processes (POSIX only, gunicorn)."""
+    from gunicorn.app.base import BaseApplication
+
+    class FactoryLayoutApplication(BaseApplication):
+        def load_config(self):
+            self.cfg.set('bind', f'0.0.0.0:{port}')
+            self.cfg.set('workers', workers)
+            self.cfg.set('threads', threads)
+            self.cfg.set('worker_class', 'gthread')
+            # Threads don't survive fork, so each worker starts its own scheduler (one of them leads)
+            # and loads its own ERP replica. The hashing pool is forked first, before any of those threads exist.
+            self.cfg.set('post_worker_init', lambda worker: (start_hash_pool(app), start_scheduler(app), start_replica(app)))
+
+        def load(self):
+            return app
+
+    FactoryLayoutApplication().run()
+
 if __name__ == '__main__':
-    # Startup checks (moved from the bottom of the old file)
-    os.makedirs(app.config['UPLOADS_FOLDER'], exist_ok=True)
-
-    essential_dbs = [
-        app.config['DATABASE_FILE_PATH'], 
-        app.config['VELIKA_MONTAZA_DB_PATH'], 
-        app.config['CAS_DATABASE_FILE_PATH']
-    ]
-    missing_dbs = [db for db in essential_dbs if not os.path.exists(db)]
-    
-    if missing_dbs:
-        print("\n--- !! WARNING !! ---")
-        for db_path in missing_dbs:
-            print(f"Essential database file '{os.path.basename(db_path)}' is missing at '{db_path}'.")
-        print("---------------------\n")
-        if app.config['CAS_DATABASE_FILE_PATH'] in missing_dbs:
-             print("--- NOTE: Automatic worker assignment requires 'cas_baza.db'. ---\n")
-
-    layout_path = app.config['LAYOUT_DATA_FILE_PATH']
-    if not os.path.exists(layout_path):
-        print(f"\n--- WARNING: Layout file '{os.path.basename(layout_path)}' not found. Creating a new empty file. ---\n")
-        try:
-            with open(layout_path, 'w', encoding='utf-8') as f:
-                json.dump({"items": [], "background": {}}, f, indent=4)
-        except Exception as e:
-            print(f"ERROR: Could not create '{layout_path}': {e}")
-    
-    # Call the DB init command registered in db.py
-    with app.app_context():
-        from app.db import init_velika_montaza_db
-        init_velika_montaza_db() # Run the init check
-
-    print("\n--- Factory Layout Server is Running with Waitress ---")
-    print(f"Access the main app at: http://127.0.0.1:5005")
-    print(f"Access the planning view at: http://127.0.0.1:5005/planning")
-    print(f"Access the admin panel at: http://127.0.0.1:5005/admin")
-
-    serve(app, host='0.0.0.0', port=5005, threads=8)
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Factory Layout Server")
+    parser.add_argument('--workers', type=int, default=1, help="Number of worker processes (more than 1 needs gunicorn, POSIX only)")
+    parser.add_argument('--threads', type=int, default=8, help="Threads per worker process")
+    parser.add_argument('--port', type=int, default=5005)
+    args = parser.parse_args()
+
+    # Startup checks are shared with the ASGI entry point (asgi.py)
+    run_startup_checks(app)
+
+    if args.workers > 1 and os.name == 'nt':
+        print("--- WARNING: Multiple workers need gunicorn, which does not run on Windows. Using a single Waitress process. ---")
+        args.workers = 1
+
+    server_name = "Gunicorn" if args.workers > 1 else "Waitress"
+    print(f"\n--- Factory Layout Server is Running with {server_name} ({args.workers} worker(s) x {args.threads} threads) ---")
+    print(f"Access the main app at: http://127.0.0.1:{args.port}")
+    print(f"Access the planning view at: http://127.0.0.1:{args.port}/planning")
+    print(f"Access the admin panel at: http://127.0.0.1:{args.port}/admin")
+
+    if args.workers > 1:
+        serve_with_gunicorn(args.workers, args.threads, args.port)
+    else:
+        start_hash_pool(app) # Before any thread is started
+        start_scheduler(app)
+        start_replica(app)
+        serve(app, host='0.0.0.0', port=args.port, threads=args.threads)